@@ -0,0 +1,80 @@
+"""Stand-in for the docker command line tool. It answers the sub commands
+used by docker-build without a docker daemon.
+
+Environment variables:
+
+:FAKE_DOCKER_LATENCY: seconds every command sleeps, defaults to 0.
+:FAKE_DOCKER_OUTPUT_LINES: lines printed by build, pull and push, defaults
+    to 10.
+:FAKE_DOCKER_LINE_SIZE: length of the printed lines, defaults to 80.
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+
+
+def _id(name):
+    return hashlib.sha256(name.encode('utf-8')).hexdigest()
+
+
+def _normalize(repotag):
+    if ':' not in repotag.rsplit('/', 1)[-1]:
+        return repotag + ':latest'
+    return repotag
+
+
+def _output(prefix):
+    lines = int(os.environ.get('FAKE_DOCKER_OUTPUT_LINES', 10))
+    size = int(os.environ.get('FAKE_DOCKER_LINE_SIZE', 80))
+    out = sys.stdout
+    for index in range(lines):
+        line = '%s %d ' % (prefix, index)
+        out.write(line + 'x' * max(size - len(line), 0) + '\n')
+
+
+def _option(args, name):
+    return args[args.index(name) + 1] if name in args else None
+
+
+def main(args):
+    while args and args[0].startswith('-'):
+        # global options, e.g. -D
+        args = args[1:]
+    command, args = args[0], args[1:]
+
+    time.sleep(float(os.environ.get('FAKE_DOCKER_LATENCY', 0)))
+
+    if command == 'build':
+        _output('Step')
+        print('Successfully built %s' % _id(_option(args, '-t'))[:12])
+    elif command in ('pull', 'push'):
+        _output(command)
+    elif command == 'inspect':
+        format = _option(args, '-f')
+        names = [arg for arg in args if arg != format and arg != '-f']
+        if format:
+            print('sha256:%s' % _id(names[0]))
+        else:
+            print(json.dumps([
+                {'Id': 'sha256:%s' % _id(name), 'RepoTags': [_normalize(name)],
+                 'RepoDigests': []}
+                for name in names]))
+    elif command == 'commit':
+        print('sha256:%s' % _id(args[-1]))
+    elif command == 'import':
+        data = getattr(sys.stdin, 'buffer', sys.stdin).read()
+        print('sha256:%s' % hashlib.sha256(data).hexdigest())
+    elif command in ('rm', 'rmi'):
+        # docker-build removes images until docker reports them missing
+        sys.stderr.write('Error: No such image\n')
+        return 1
+    elif command not in ('tag', 'login', 'logout'):
+        sys.stderr.write('fake docker: unknown command %s\n' % command)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
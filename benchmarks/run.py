@@ -0,0 +1,413 @@
+"""Benchmarks of the orchestration overhead of docker-build.
+
+docker is replaced by :fake_docker: and registries by :stub_registry:, so
+the results show the time spent in docker-build itself: scheduling, process
+handling and registry requests. Every scenario runs in its own python
+process to report its peak RSS.
+
+Usage:
+
+    $ python benchmarks/run.py
+    $ python benchmarks/run.py build --images 2000 -j 8 --latency 0.05
+    $ python benchmarks/run.py --save baseline.json
+    $ python benchmarks/run.py --compare baseline.json
+"""
+from __future__ import division, print_function
+
+import json
+import optparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_HERE))
+
+from docker_build import _docker_driver, _profile, cli
+from docker_build.image.api import ImageCollection
+from docker_build._registry import Registry
+
+import startup
+from stub_registry import StubRegistry
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0
+    index = int(round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def _latencies(values):
+    result = dict(('p%d' % p, _percentile(values, p)) for p in (50, 90, 99))
+    result['max'] = max(values or [0])
+    return result
+
+
+def _peak_rss():
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes instead of kilobytes
+        rss //= 1024
+    return rss * 1024
+
+
+class FakeDocker(object):
+    """Puts :fake_docker: as ``docker`` in front of $PATH.
+    """
+    def __init__(self, options):
+        self._options = options
+        self._directory = None
+        self._environ = None
+
+    def __enter__(self):
+        self._directory = tempfile.mkdtemp(prefix='fake-docker-')
+        path = os.path.join(self._directory, 'docker')
+        with open(os.path.join(_HERE, 'fake_docker.py')) as f_obj:
+            source = f_obj.read()
+        with open(path, 'w') as f_obj:
+            # -S: skip the site module, the fake needs the stdlib only
+            f_obj.write('#!%s -S\n%s' % (sys.executable, source))
+        os.chmod(path, 0o755)
+
+        self._environ = os.environ.copy()
+        os.environ.update({
+            'PATH': self._directory + os.pathsep + os.environ.get('PATH', ''),
+            'FAKE_DOCKER_LATENCY': str(self._options.latency),
+            'FAKE_DOCKER_OUTPUT_LINES': str(self._options.output_lines),
+            'FAKE_DOCKER_LINE_SIZE': str(self._options.line_size),
+        })
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        os.environ.clear()
+        os.environ.update(self._environ)
+        shutil.rmtree(self._directory)
+
+
+def _image_graph(options):
+    """Yields ``(name, base, repotag)`` of :options.images: images. The
+    first :options.roots: images are root images, every other image has a
+    random earlier image as base. Every :options.temporary_every:-th image is
+    temporary.
+    """
+    rand = random.Random(options.seed)
+    for index in range(options.images):
+        name = 'img%d' % index
+        if index < options.roots:
+            yield name, None, 'bench/root%d:1' % index
+            continue
+        base = 'img%d' % rand.randrange(index)
+        if options.temporary_every and index % options.temporary_every == 0:
+            yield name, base, None
+        else:
+            yield name, base, 'bench/img%d:1' % index
+
+
+def _config(options):
+    lines = []
+    for name, base, repotag in _image_graph(options):
+        if base is None:
+            lines.append("%s = Image(%r)" % (name, repotag))
+        elif repotag is None:
+            lines.append("%s = Image(base=%s, run='true')" % (name, base))
+        else:
+            lines.append("%s = Image(%r, base=%s, run='true', registry=bench)"
+                         % (name, repotag, base))
+    return '\n'.join(lines) + '\n'
+
+
+# -----------------------------------------------------------------------------
+
+def bench_exec(options):
+    """``docker build`` through the command line driver: process startup,
+    output streaming and line callbacks.
+    """
+    latencies = []
+    directory = tempfile.mkdtemp(prefix='bench-exec-')
+    dockerfile = os.path.join(directory, 'Dockerfile')
+    with open(dockerfile, 'w') as f_obj:
+        f_obj.write('FROM scratch\n')
+    try:
+        with FakeDocker(options):
+            for index in range(options.calls):
+                start = time.time()
+                _docker_driver.build('bench/exec%d' % index, chdir=directory,
+                                     dockerfile=dockerfile)
+                latencies.append(time.time() - start)
+    finally:
+        shutil.rmtree(directory)
+
+    total = sum(latencies)
+    return {
+        'operations': len(latencies),
+        'throughput': len(latencies) / total,
+        'lines_per_second': len(latencies) * options.output_lines / total,
+        'latency': _latencies(latencies),
+    }
+
+
+def bench_collection(options):
+    """Creating the image objects and :ImageCollection.tagged_images:.
+    """
+    collection = ImageCollection()
+    registry = Registry('127.0.0.1:5000')
+    images = {}
+
+    start = time.time()
+    for name, base, repotag in _image_graph(options):
+        kwargs = {}
+        if base is not None:
+            kwargs = dict(base=images[base], run='true')
+            if repotag:
+                kwargs['registry'] = registry
+        images[name] = collection.add(repotag, **kwargs)
+    add_time = time.time() - start
+
+    latencies = []
+    for _index in range(options.repeat):
+        start = time.time()
+        collection.tagged_images()
+        latencies.append(time.time() - start)
+
+    return {
+        'operations': len(latencies),
+        'throughput': options.images * len(latencies) / sum(latencies),
+        'add_time': add_time,
+        'latency': _latencies(latencies),
+    }
+
+
+def bench_build(options):
+    """A complete ``docker-build`` run: config loading, scheduling, builds,
+    pushes to the stub registry and cleanup.
+    """
+    directory = tempfile.mkdtemp(prefix='bench-build-')
+    try:
+        config = os.path.join(directory, 'bench.images')
+        with open(config, 'w') as f_obj:
+            f_obj.write(_config(options))
+
+        with FakeDocker(options), StubRegistry() as registry:
+            profiler = _profile.enable()
+            start = time.time()
+            try:
+                cli.main(['-c', config, '-j', str(options.jobs),
+                          '--no-cache', '-r', 'bench=' + registry.address])
+                failed = False
+            except SystemExit:
+                failed = True
+            total = time.time() - start
+    finally:
+        shutil.rmtree(directory)
+
+    def durations(category):
+        return [s.duration for s in profiler.spans if s.category == category]
+
+    # the generated images are native and direct layers, the Dockerfile
+    # layers are nested in the builds of the direct layers
+    builds = [s.duration for s in profiler.spans if s.category == 'build'
+              and s.args['layer'] != 'DockerfileImageLayer']
+    return {
+        'failed': failed,
+        'operations': len(builds),
+        'throughput': len(builds) / total,
+        'total': total,
+        'critical_path': sum(s.duration for s in profiler.critical_path()),
+        'commands': len(durations('exec')),
+        'registry_requests': len(durations('registry')),
+        'latency': _latencies(builds),
+    }
+
+
+def bench_registry(options):
+    """:Registry.images: of a registry with :options.repositories:
+    repositories of :options.tags: tags.
+    """
+    latencies = []
+    with StubRegistry(options.repositories, options.tags) as stub:
+        for _index in range(options.repeat):
+            registry = Registry(stub.address)
+            start = time.time()
+            images = registry.images()
+            latencies.append(time.time() - start)
+            assert len(images) == options.repositories * options.tags
+
+    return {
+        'operations': len(latencies),
+        'throughput': options.repositories * options.tags * len(latencies)
+            / sum(latencies),
+        'latency': _latencies(latencies),
+    }
+
+
+def bench_startup(options):
+    """Import time of the command line interface, measured with
+    ``python -X importtime``. Fails if a lazy module is imported or the
+    median exceeds :options.startup_budget:.
+    """
+    latencies = [startup.import_time() for _index in range(options.repeat)]
+    eager = startup.imported_lazy_modules('import docker_build.cli')
+
+    return {
+        'operations': len(latencies),
+        'throughput': len(latencies) / sum(latencies),
+        'eager_modules': eager,
+        'failed': bool(eager) or
+            _percentile(latencies, 50) * 1000 > options.startup_budget,
+        'latency': _latencies(latencies),
+    }
+
+
+SCENARIOS = [
+    ('startup',    bench_startup),
+    ('exec',       bench_exec),
+    ('collection', bench_collection),
+    ('build',      bench_build),
+    ('registry',   bench_registry),
+]
+
+# -----------------------------------------------------------------------------
+
+def _get_options(args=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] [scenario ...]',
+        description='Scenarios: %s' % ', '.join(n for n, _f in SCENARIOS))
+    parser.add_option('--images', type='int', default=500,
+        help='Number of images of the build and collection scenarios.')
+    parser.add_option('--roots', type='int', default=10,
+        help='Number of root images.')
+    parser.add_option('--temporary-every', type='int', default=4,
+        dest='temporary_every',
+        help='Every n-th image is a temporary image, 0 disables them.')
+    parser.add_option('--seed', type='int', default=0,
+        help='Seed of the generated image graph.')
+    parser.add_option('-j', '--jobs', type='int', default=4,
+        help='Concurrent builds of the build scenario.')
+    parser.add_option('--latency', type='float', default=0.0,
+        help='Seconds every fake docker command takes.')
+    parser.add_option('--output-lines', type='int', default=10,
+        dest='output_lines',
+        help='Lines printed by fake docker build, pull and push.')
+    parser.add_option('--line-size', type='int', default=80,
+        dest='line_size',
+        help='Length of the lines printed by fake docker.')
+    parser.add_option('--calls', type='int', default=50,
+        help='Commands executed by the exec scenario.')
+    parser.add_option('--repositories', type='int', default=200,
+        help='Repositories of the stub registry.')
+    parser.add_option('--tags', type='int', default=10,
+        help='Tags per repository of the stub registry.')
+    parser.add_option('--repeat', type='int', default=5,
+        help='Repetitions of the collection and registry scenarios.')
+    parser.add_option('--startup-budget', type='float', metavar='MS',
+        dest='startup_budget', default=startup.BUDGET_MS,
+        help='Maximum median import time of the startup scenario, '
+            'default %default.')
+    parser.add_option('--save', metavar='PATH',
+        help='Write the results as json to PATH.')
+    parser.add_option('--compare', metavar='PATH',
+        help='Compare the results with the saved results of PATH. Exits '
+            'with status 1 on regressions.')
+    parser.add_option('--threshold', type='float', default=0.25,
+        help='Relative slowdown reported as regression, default 0.25.')
+    parser.add_option('--child', action='store_true',
+        help=optparse.SUPPRESS_HELP)
+
+    options, scenarios = parser.parse_args(args)
+    known = [name for name, _func in SCENARIOS]
+    for name in scenarios:
+        if name not in known:
+            parser.error('unknown scenario: %s' % name)
+    return options, scenarios or known
+
+
+def _run_child(args, scenario):
+    """Runs :scenario: in a new python process and returns its result.
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--child',
+               scenario] + args
+    output = subprocess.check_output(command)
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def _format(name, result):
+    latency = result['latency']
+    line = '%-11s %8d ops %10.1f ops/s  p50 %8.2fms  p90 %8.2fms  ' \
+        'p99 %8.2fms  max %8.2fms  rss %7.1fMB' % (
+            name, result['operations'], result['throughput'],
+            latency['p50'] * 1000, latency['p90'] * 1000,
+            latency['p99'] * 1000, latency['max'] * 1000,
+            result['peak_rss'] / 1024 / 1024)
+    if result.get('eager_modules'):
+        line += '  imported: %s' % ', '.join(result['eager_modules'])
+    if result.get('failed'):
+        line += '  FAILED'
+    return line
+
+
+def _compare(results, baseline, threshold):
+    """Prints the changes against :baseline: and returns False if a scenario
+    got slower than :threshold:.
+    """
+    ok = True
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        changes = [
+            ('throughput', old['throughput'] / result['throughput'] - 1),
+            ('p50', result['latency']['p50'] / old['latency']['p50'] - 1
+                if old['latency']['p50'] else 0),
+            ('peak_rss', result['peak_rss'] / old['peak_rss'] - 1),
+        ]
+        for metric, change in changes:
+            regression = change > threshold
+            ok = ok and not regression
+            print('%-11s %-10s %+7.1f%%%s' % (
+                name, metric, change * 100,
+                '  REGRESSION' if regression else ''))
+    return ok
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    options, scenarios = _get_options(args)
+
+    if options.child:
+        result = dict(SCENARIOS)[scenarios[0]](options)
+        result['peak_rss'] = _peak_rss()
+        print(json.dumps(result))
+        return 0
+
+    # the scenarios are passed on to the children one by one
+    child_args = [arg for arg in args if arg not in scenarios]
+
+    results = {}
+    for name in scenarios:
+        results[name] = _run_child(child_args, name)
+        print(_format(name, results[name]))
+        sys.stdout.flush()
+
+    if options.save:
+        with open(options.save, 'w') as f_obj:
+            json.dump(results, f_obj, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f_obj:
+            baseline = json.load(f_obj)
+        if not _compare(results, baseline, options.threshold):
+            return 1
+    if any(result.get('failed') for result in results.values()):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""Startup cost of the command line interface, shared by the startup
+scenario of :run: and tests/test_startup.py.
+"""
+from __future__ import division
+
+import os
+import subprocess
+import sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that are only imported when used
+LAZY_MODULES = [
+    'requests',
+    'docker_build._docker_api_driver',
+    'docker_build._vagrant_driver',
+    'docker_build.image._docker',
+    'docker_build.image._rootfs',
+    'docker_build.image._vagrant',
+]
+
+# maximum median import time of docker_build.cli in milliseconds
+BUDGET_MS = 200
+
+
+def imported_lazy_modules(script):
+    """Runs the python :script: and returns the lazy modules it imported.
+    """
+    script += '\nimport sys\n' \
+        'print(" ".join(m for m in %r if m in sys.modules))' % LAZY_MODULES
+    output = subprocess.check_output([sys.executable, '-c', script],
+                                     cwd=_ROOT)
+    return output.decode('utf-8').split()
+
+
+def import_time():
+    """Returns the cumulative import time of docker_build.cli in seconds,
+    measured with ``python -X importtime``.
+    """
+    popen = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', 'import docker_build.cli'],
+        cwd=_ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _stdout, stderr = popen.communicate()
+    # import time: self [us] | cumulative | imported package
+    for line in stderr.decode('utf-8').splitlines():
+        fields = [f.strip() for f in line.split('|')]
+        if len(fields) == 3 and fields[2] == 'docker_build.cli':
+            return int(fields[1]) / 1e6
+    raise Exception('docker_build.cli not imported: %s' % stderr)
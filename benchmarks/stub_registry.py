@@ -0,0 +1,93 @@
+"""Registry v2 stub serving a generated catalog over http on localhost.
+"""
+import json
+import re
+import threading
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs, urlparse
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, data=None, headers=None):
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _page(self, items, path, query):
+        # registry v2 pagination with ?n=<size>&last=<item>
+        size = int(query.get('n', [len(items) or 1])[0])
+        last = query.get('last', [None])[0]
+        start = items.index(last) + 1 if last in items else 0
+        page = items[start:start + size]
+        headers = {}
+        if start + size < len(items):
+            headers['Link'] = '<%s?n=%d&last=%s>; rel="next"' % (
+                path, size, page[-1])
+        return page, headers
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        registry = self.server
+
+        if url.path == '/v2/':
+            return self._send(200, {})
+
+        if url.path == '/v2/_catalog':
+            page, headers = self._page(registry.repositories, url.path, query)
+            return self._send(200, {'repositories': page}, headers)
+
+        match = re.match(r'^/v2/(.+)/tags/list$', url.path)
+        if match and match.group(1) in registry.tags:
+            repo = match.group(1)
+            page, headers = self._page(registry.tags[repo], url.path, query)
+            return self._send(200, {'name': repo, 'tags': page}, headers)
+
+        self._send(404, {'errors': [{'code': 'NAME_UNKNOWN'}]})
+
+    def do_HEAD(self):
+        match = re.match(r'^/v2/(.+)/manifests/(.+)$', self.path)
+        if match and match.group(2) in self.server.tags.get(match.group(1), ()):
+            return self._send(200, headers={
+                'Docker-Content-Digest': 'sha256:%064d' % 0})
+        self._send(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubRegistry(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serves :repositories: repositories with :tags: tags each.
+    """
+    daemon_threads = True
+
+    def __init__(self, repositories=0, tags=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.repositories = ['bench/repo%05d' % i for i in range(repositories)]
+        self.tags = dict((repo, ['%d.0' % i for i in range(tags)])
+                         for repo in self.repositories)
+        self._thread = None
+
+    @property
+    def address(self):
+        return '%s:%d' % self.server_address
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        args=(0.01,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
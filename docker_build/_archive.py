@@ -0,0 +1,78 @@
+"""Decompression of rootfs archives by parallel decompressors. Docker
+decompresses imported archives with a single thread.
+"""
+import contextlib
+import logging
+import os
+import subprocess
+import tempfile
+
+from ._compat import to_text
+from ._exec import ExecutionError
+
+
+_log = logging.getLogger(__name__)
+
+# archive suffixes -> multi-threaded decompressors, in order of preference.
+# The commands write the decompressed archive to stdout.
+_DECOMPRESSORS = [
+    (('.gz', '.tgz'),           [['pigz', '-dc']]),
+    (('.xz', '.txz'),           [['xz', '-dc', '-T0']]),
+    (('.bz2', '.tbz', '.tbz2'), [['lbzip2', '-dc'], ['pbzip2', '-dc']]),
+]
+
+
+def _which(name):
+    for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+
+
+def decompressor(filename):
+    """Returns the command that decompresses the archive :filename: to
+    stdout, or None if it is not compressed or no multi-threaded
+    decompressor is installed.
+    """
+    name = filename.lower()
+    for suffixes, commands in _DECOMPRESSORS:
+        if not name.endswith(suffixes):
+            continue
+        for command in commands:
+            if _which(command[0]):
+                return command + [filename]
+    return None
+
+
+@contextlib.contextmanager
+def open_tar(filename):
+    """Yields a binary file object to read the archive :filename: from.
+    Compressed archives are decompressed on the fly if a multi-threaded
+    decompressor is installed, otherwise the archive is read as it is.
+
+    Raises :ExecutionError: if the decompressor fails.
+    """
+    command = decompressor(filename)
+    if command is None:
+        with open(filename, 'rb') as f_obj:
+            yield f_obj
+        return
+
+    _log.debug('Decompressing: %s', ' '.join(command))
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                   stderr=stderr)
+        try:
+            yield process.stdout
+        except Exception:
+            # stops the decompressor by a broken pipe
+            process.stdout.close()
+            process.wait()
+            raise
+        process.stdout.close()
+        status = process.wait()
+
+        if status:
+            stderr.seek(0)
+            raise ExecutionError(' '.join(command), status, '',
+                                 to_text(stderr.read()))
@@ -0,0 +1,163 @@
+import errno
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+_log = logging.getLogger(__name__)
+
+
+class BuildCache(object):
+    """Persistent map of build input digests to docker image ids.
+
+    Additionally the digest of every built tagged image is recorded, so
+    changed build inputs are detected even if the tagged image exists.
+    """
+    _FILENAME = 'build.json'
+
+    def __init__(self, directory):
+        self._path = os.path.join(os.path.expanduser(directory),
+                                  self._FILENAME)
+        self._lock = threading.Lock()
+        self._images, self._tags = self._load()
+
+    def _load(self):
+        data = _read(self._path)
+        try:
+            return data['images'], data['tags']
+        except KeyError:
+            return {}, {}
+
+    def image_id(self, digest):
+        """Returns the image id built from the inputs :digest:.
+        """
+        with self._lock:
+            return self._images.get(digest)
+
+    def tag_digest(self, repotag):
+        """Returns the digest of the inputs :repotag: was built from.
+        """
+        with self._lock:
+            return self._tags.get(repotag)
+
+    def add(self, digest, image_id, repotag=None):
+        with self._lock:
+            self._images[digest] = image_id
+            if repotag:
+                self._tags[repotag] = digest
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({'images': self._images, 'tags': self._tags})
+        _write(self._path, data)
+
+
+class RegistryCache(object):
+    """Persistent results of registry lookups, see :Registry.info:. Entries
+    expire after :ttl: seconds.
+    """
+    _FILENAME = 'registry.json'
+
+    def __init__(self, directory, ttl):
+        self._path = os.path.join(os.path.expanduser(directory),
+                                  self._FILENAME)
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = _read(self._path)
+
+    @staticmethod
+    def _key(url, repotag):
+        return '%s/%s' % (url, repotag)
+
+    def get(self, url, repotag):
+        """Returns ``(True, info)`` for a cached lookup of :repotag: in the
+        registry :url:, the info is None for missing images. Returns
+        ``(False, None)`` if the lookup is not cached or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(self._key(url, repotag))
+        if entry and entry[0] + self._ttl > time.time():
+            return True, entry[1]
+        return False, None
+
+    def put(self, url, repotag, info):
+        with self._lock:
+            self._entries[self._key(url, repotag)] = [time.time(), info]
+
+    def invalidate(self, url, repotag):
+        with self._lock:
+            self._entries.pop(self._key(url, repotag), None)
+
+    def save(self):
+        expired = time.time() - self._ttl
+        with self._lock:
+            data = json.dumps(dict((key, entry)
+                                   for key, entry in self._entries.items()
+                                   if entry[0] > expired))
+        _write(self._path, data)
+
+
+class FileDigestCache(object):
+    """Persistent map of file paths to the digests of their contents, see
+    :_digest.file_digest:. An entry is valid as long as the modification
+    time, size and inode of the file are unchanged.
+    """
+    _FILENAME = 'files.json'
+
+    def __init__(self, directory):
+        self._path = os.path.join(os.path.expanduser(directory),
+                                  self._FILENAME)
+        self._lock = threading.Lock()
+        self._entries = _read(self._path)
+
+    def get(self, path, key):
+        """Returns the digest of the file :path: if it was hashed with the
+        same stat :key: before.
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry and entry[0] == key:
+            return entry[1]
+
+    def put(self, path, key, digest):
+        with self._lock:
+            self._entries[path] = [key, digest]
+
+    def save(self):
+        # drop the entries of removed files
+        with self._lock:
+            data = json.dumps(dict((path, entry)
+                                   for path, entry in self._entries.items()
+                                   if os.path.exists(path)))
+        _write(self._path, data)
+
+
+def _read(path):
+    try:
+        with open(path) as f_obj:
+            data = json.load(f_obj)
+        if isinstance(data, dict):
+            return data
+    except IOError as error:
+        if error.errno != errno.ENOENT:
+            raise
+        return {}
+    except ValueError:
+        pass
+    _log.warn('Ignoring corrupt cache: %s', path)
+    return {}
+
+
+def _write(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # replace the cache file atomically
+    fd, temp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'w') as f_obj:
+        f_obj.write(data)
+    os.rename(temp, path)
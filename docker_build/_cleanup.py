@@ -0,0 +1,64 @@
+"""Removes temporary images in bulk, optionally by a detached process that
+keeps running after docker-build exits.
+
+Usage of the detached process, the repotags are read from stdin:
+
+    python -m docker_build._cleanup <driver module> <jobs>
+"""
+import importlib
+import logging
+import os
+import subprocess
+import sys
+
+import six
+
+
+_log = logging.getLogger(__name__)
+
+# concurrent docker rmi commands
+_JOBS = 4
+
+
+def remove_images(driver, repotags, detach=False, jobs=_JOBS):
+    """Removes the images :repotags: with :driver:. With :detach: they are
+    removed by a background process and the function returns immediately.
+    """
+    if not repotags:
+        return
+    if not detach:
+        driver.rmi_many(repotags, jobs)
+        return
+
+    _log.info('Removing %d temporary images in the background',
+              len(repotags))
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [package] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    # not terminated with docker-build, e.g. by ctrl-c. preexec_fn is not
+    # safe while other threads are running, python 2 has no alternative.
+    if six.PY2:
+        session = dict(preexec_fn=getattr(os, 'setsid', None))
+    else:
+        session = dict(start_new_session=True)
+
+    with open(os.devnull, 'r+b') as devnull:
+        popen = subprocess.Popen(
+            [sys.executable, '-m', __name__, driver.__name__, str(jobs)],
+            stdin=subprocess.PIPE, stdout=devnull, stderr=devnull,
+            close_fds=True, env=env, **session)
+    popen.stdin.write('\n'.join(repotags).encode('utf-8'))
+    popen.stdin.close()
+
+
+def main(args):
+    driver_name, jobs = args
+    driver = importlib.import_module(driver_name)
+    repotags = sys.stdin.read().split()
+    driver.rmi_many(repotags, int(jobs))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,9 +1,9 @@
 import six
 
 if six.PY2:
-    from urlparse import urlparse, urlunparse
+    from urlparse import urljoin, urlparse, urlunparse
 else:
-    from urllib.parse import urlparse, urlunparse
+    from urllib.parse import urljoin, urlparse, urlunparse
 
 
 def to_utf8(value):
@@ -16,3 +16,9 @@ def to_ascii(value):
     if value is None or isinstance(value, bytes):
         return value
     return value.encode('ascii')
+
+
+def to_text(value):
+    if value is None or isinstance(value, six.text_type):
+        return value
+    return value.decode('utf-8', 'replace')
@@ -0,0 +1,323 @@
+"""Build context of Dockerfile builds. Files excluded by the .dockerignore
+file are never sent to docker. Unless pruning is disabled, only the files
+referenced by ``ADD`` and ``COPY`` instructions are sent along with the
+Dockerfile.
+"""
+import contextlib
+import json
+import logging
+import os
+import re
+import shlex
+import tarfile
+import tempfile
+
+from . import _profile
+
+
+_log = logging.getLogger(__name__)
+
+_DOCKERIGNORE = '.dockerignore'
+
+# name of Dockerfiles outside of the context directory within the context
+_OUTER_DOCKERFILE = '.dockerfile'
+
+_pruning = True
+
+
+def set_pruning(enabled):
+    """Disables sending only the files referenced by the Dockerfile, e.g.
+    for base images with ``ONBUILD ADD`` instructions.
+    """
+    global _pruning
+    _pruning = enabled
+
+
+def _translate(pattern):
+    """Returns a regular expression for the path pattern :pattern: of
+    .dockerignore files and ``ADD``/``COPY`` sources.
+    """
+    regex = ''
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith('**/', index):
+            regex += '(.*/)?'
+            index += 3
+            continue
+        if pattern.startswith('**', index):
+            regex += '.*'
+            index += 2
+            continue
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            end = pattern.find(']', index + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                chars = pattern[index + 1:end]
+                if chars.startswith('^') or chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                regex += '[%s]' % chars
+                index = end
+        elif char == '\\' and index + 1 < len(pattern):
+            index += 1
+            regex += re.escape(pattern[index])
+        else:
+            regex += re.escape(char)
+        index += 1
+    return re.compile(regex + '$')
+
+
+def _normalize(pattern):
+    pattern = os.path.normpath(pattern.strip()).replace(os.sep, '/')
+    return pattern.lstrip('/') or '.'
+
+
+def read_dockerignore(directory):
+    """Returns the rules of the .dockerignore file in :directory: as list of
+    ``(exclude, regex)`` tuples.
+    """
+    rules = []
+    try:
+        with open(os.path.join(directory, _DOCKERIGNORE)) as f_obj:
+            lines = f_obj.read().splitlines()
+    except IOError:
+        return rules
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        exclude = not line.startswith('!')
+        if not exclude:
+            line = line[1:]
+        rules.append((exclude, _translate(_normalize(line))))
+    return rules
+
+
+def _parents(relpath):
+    # the path and its parent directories
+    parts = relpath.split('/')
+    for index in range(len(parts), 0, -1):
+        yield '/'.join(parts[:index])
+
+
+def _is_ignored(rules, relpath):
+    ignored = False
+    for exclude, regex in rules:
+        for path in _parents(relpath):
+            if regex.match(path):
+                ignored = exclude
+                break
+    return ignored
+
+
+def _instructions(content):
+    """Yields the ``(instruction, arguments)`` of the Dockerfile
+    :content:.
+    """
+    line = ''
+    for part in content.splitlines():
+        stripped = part.strip()
+        if not line and (not stripped or stripped.startswith('#')):
+            continue
+        if stripped.endswith('\\'):
+            line += stripped[:-1] + ' '
+            continue
+        line += stripped
+        fields = line.split(None, 1)
+        line = ''
+        if fields:
+            yield fields[0].upper(), fields[1] if len(fields) > 1 else ''
+
+
+# instructions of the Dockerfile format, others are not understood
+_INSTRUCTIONS = set([
+    'ADD', 'ARG', 'CMD', 'COPY', 'ENTRYPOINT', 'ENV', 'EXPOSE', 'FROM',
+    'HEALTHCHECK', 'LABEL', 'MAINTAINER', 'ONBUILD', 'RUN', 'SHELL',
+    'STOPSIGNAL', 'USER', 'VOLUME', 'WORKDIR',
+])
+
+# flags of ADD and COPY that do not change which files are read
+_COPY_FLAGS = set([
+    '--chmod', '--chown', '--checksum', '--exclude', '--keep-git-dir',
+    '--link', '--parents',
+])
+
+# types of RUN --mount that do not read the build context
+_MOUNT_TYPES = set(['cache', 'secret', 'ssh', 'tmpfs'])
+
+
+def _directives(content):
+    """Yields the names of the parser directives, e.g. ``escape``, at the
+    start of the Dockerfile :content:.
+    """
+    for line in content.splitlines():
+        match = re.match(r'^#\s*([a-zA-Z]+)\s*=', line.strip())
+        if not match:
+            return
+        yield match.group(1).lower()
+
+
+def _leading_flags(arguments):
+    flags = []
+    while arguments.startswith('--'):
+        fields = arguments.split(None, 1)
+        flags.append(fields[0])
+        arguments = fields[1] if len(fields) > 1 else ''
+    return flags
+
+
+def _reads_context(mount):
+    # RUN --mount=type=bind,source=...: bind mounts the context by default
+    options = dict(option.partition('=')[::2]
+                   for option in mount.split('=', 1)[1].split(','))
+    return options.get('type', 'bind') not in _MOUNT_TYPES \
+        and not options.get('from')
+
+
+def referenced_sources(content):
+    """Returns the source patterns of the ``ADD`` and ``COPY`` instructions
+    of the Dockerfile :content: or None if they are not known, e.g. because
+    of variables. Anything that is not understood, e.g. heredocs, ``RUN
+    --mount`` or parser directives, returns None, so the whole context is
+    sent.
+    """
+    for directive in _directives(content):
+        if directive != 'syntax':
+            return None
+
+    sources = []
+    for instruction, arguments in _instructions(content):
+        if instruction not in _INSTRUCTIONS or '<<' in arguments:
+            # unknown instruction or heredoc
+            return None
+        if instruction == 'ONBUILD':
+            continue
+        if instruction == 'RUN':
+            for flag in _leading_flags(arguments):
+                if flag.startswith('--mount=') and _reads_context(flag):
+                    return None
+            continue
+        if instruction not in ('ADD', 'COPY'):
+            continue
+
+        try:
+            if arguments.startswith('['):
+                args = json.loads(arguments)
+            else:
+                args = shlex.split(arguments)
+        except ValueError:
+            return None
+
+        flags = [arg for arg in args if arg.startswith('--')]
+        if any(flag.startswith('--from') for flag in flags):
+            # copied from another image or stage
+            continue
+        if any(flag.split('=', 1)[0] not in _COPY_FLAGS for flag in flags):
+            return None
+        args = [arg for arg in args if not arg.startswith('--')]
+
+        for source in args[:-1]:
+            if '$' in source:
+                return None
+            if re.match(r'^[a-z]+://', source) or source.startswith('git@'):
+                continue
+            sources.append(_normalize(source))
+    return sources
+
+
+def _is_referenced(sources, relpath):
+    for source in sources:
+        if source == '.':
+            return True
+        regex = _translate(source)
+        for path in _parents(relpath):
+            if regex.match(path):
+                return True
+    return False
+
+
+def _may_contain(sources, relpath):
+    # the directory :relpath: may contain referenced files
+    for source in sources:
+        prefix = re.split(r'[*?\[]', source, 1)[0]
+        if prefix.startswith(relpath + '/') or \
+                (relpath + '/').startswith(prefix):
+            return True
+    return False
+
+
+def context_paths(directory, dockerfile=None):
+    """Returns the paths of the build context of :dockerfile: (default
+    Dockerfile) in :directory:, relative to :directory:.
+    """
+    dockerfile = os.path.join(directory, dockerfile or 'Dockerfile')
+    rules = read_dockerignore(directory)
+    # whole directories are skipped unless files in them are re-included
+    prune_ignored = all(exclude for exclude, _regex in rules)
+
+    sources = None
+    if _pruning:
+        with open(dockerfile) as f_obj:
+            sources = referenced_sources(f_obj.read())
+
+    dockerfile_relpath = os.path.relpath(dockerfile, directory) \
+        .replace(os.sep, '/')
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(dirs + files):
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, directory).replace(os.sep, '/')
+            if relpath == dockerfile_relpath:
+                paths.append(relpath)
+                continue
+            if _is_ignored(rules, relpath):
+                if prune_ignored and name in dirs:
+                    dirs.remove(name)
+                continue
+            if sources is not None and not _is_referenced(sources, relpath):
+                if name in dirs and not _may_contain(sources, relpath):
+                    dirs.remove(name)
+                continue
+            paths.append(relpath)
+    return paths
+
+
+@contextlib.contextmanager
+def build_context(directory, dockerfile=None):
+    """Writes the build context of :dockerfile: (default Dockerfile) in
+    :directory: to a temporary tar file. Yields the file and the name of
+    the Dockerfile within the tar.
+    """
+    dockerfile = os.path.join(directory, dockerfile or 'Dockerfile')
+    name = os.path.relpath(dockerfile, directory).replace(os.sep, '/')
+    outside = name.startswith('../')
+    if outside:
+        name = _OUTER_DOCKERFILE
+
+    with _profile.span(directory, 'context') as span:
+        f_obj = tempfile.TemporaryFile()
+        with tarfile.open(fileobj=f_obj, mode='w') as tar:
+            paths = context_paths(directory, dockerfile)
+            for relpath in paths:
+                tar.add(os.path.join(directory, relpath), arcname=relpath,
+                        recursive=False)
+            if outside:
+                tar.add(dockerfile, arcname=name)
+        size = f_obj.tell()
+        f_obj.seek(0)
+
+        span.args.update(files=len(paths), bytes=size)
+        _log.info('Build context of %s: %d files, %d bytes',
+                  directory, len(paths), size)
+
+    try:
+        yield f_obj, name
+    finally:
+        f_obj.close()
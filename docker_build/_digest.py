@@ -0,0 +1,120 @@
+import hashlib
+import mmap
+import os
+
+from ._compat import to_utf8
+
+
+_CHUNK_SIZE = 1024 * 1024
+
+# bytes hashed at once from memory mapped files
+_MMAP_CHUNK_SIZE = 16 * 1024 * 1024
+
+# cache of file digests, see :set_file_cache:
+_file_cache = None
+
+
+def set_file_cache(cache):
+    """Takes the digests of unchanged files from :cache:, a
+    :FileDigestCache:, or always hashes them if :cache: is None.
+    """
+    global _file_cache
+    _file_cache = cache
+
+
+def new():
+    return hashlib.sha256()
+
+
+def update_file(hasher, path):
+    """Adds the content of the file :path: to :hasher:.
+    """
+    with open(path, 'rb') as f_obj:
+        while True:
+            data = f_obj.read(_CHUNK_SIZE)
+            if not data:
+                break
+            hasher.update(data)
+
+
+def _update_mapped(hasher, f_obj):
+    """Adds the content of the file :f_obj: to :hasher: without copying it
+    to user space. Returns False if the file cannot be memory mapped.
+    """
+    try:
+        mapped = mmap.mmap(f_obj.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, EnvironmentError):
+        # empty files and special files
+        return False
+
+    try:
+        view = memoryview(mapped)
+    except TypeError:
+        # no buffer interface (python 2)
+        view = mapped
+    try:
+        for offset in range(0, len(mapped), _MMAP_CHUNK_SIZE):
+            hasher.update(view[offset:offset + _MMAP_CHUNK_SIZE])
+    finally:
+        if view is not mapped:
+            view.release()
+        mapped.close()
+    return True
+
+
+def file_digest(path):
+    """Returns the hex digest of the content of the file :path:, which is
+    hashed in a single memory mapped pass. Digests of files with unchanged
+    size and modification time are taken from the file cache, see
+    :set_file_cache:.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = [getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size,
+           stat.st_ino]
+    if _file_cache:
+        digest = _file_cache.get(path, key)
+        if digest:
+            return digest
+
+    hasher = new()
+    with open(path, 'rb') as f_obj:
+        if not _update_mapped(hasher, f_obj):
+            update_file(hasher, path)
+    digest = hasher.hexdigest()
+
+    if _file_cache:
+        _file_cache.put(path, key, digest)
+    return digest
+
+
+def update_directory(hasher, directory):
+    """Adds the names, link targets and file contents below :directory: to
+    :hasher:. The result does not depend on the order of the directory
+    listing.
+    """
+    relpaths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(dirs + files):
+            relpaths.append(os.path.relpath(os.path.join(root, name),
+                                            directory))
+    update_paths(hasher, directory, relpaths)
+
+
+def update_paths(hasher, directory, relpaths):
+    """Adds the names, link targets and file contents of the :relpaths:
+    below :directory: to :hasher:.
+    """
+    for relpath in relpaths:
+        path = os.path.join(directory, relpath)
+        hasher.update(to_utf8(relpath) + b'\0')
+
+        if os.path.islink(path):
+            hasher.update(b'l' + to_utf8(os.readlink(path)) + b'\0')
+        elif os.path.isfile(path):
+            hasher.update(to_utf8('f%d\0' % os.path.getsize(path)))
+            # unchanged files are not read again, see :set_file_cache:
+            hasher.update(to_utf8(file_digest(path)))
+        else:
+            hasher.update(b'd\0')
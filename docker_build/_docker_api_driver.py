@@ -0,0 +1,436 @@
+"""Docker driver that talks to the Docker Engine API over the unix socket
+instead of executing the docker command line tool. It provides the same
+functions as :_docker_driver:.
+"""
+import base64
+import json
+import logging
+import os
+import re
+import socket
+import threading
+from stat import S_ISREG
+
+import six
+from six.moves import http_client, queue
+from six.moves.urllib.parse import quote, urlencode
+
+from . import _context
+from ._compat import to_text, to_utf8
+from ._exec import ExecutionError
+from ._pool import map_concurrent
+
+
+_log = logging.getLogger(__name__)
+
+_DEFAULT_SOCKET = '/var/run/docker.sock'
+
+# maximum number of idle connections kept open to the docker daemon
+_POOL_SIZE = 8
+
+_READ_SIZE = 64 * 1024
+
+
+class APIError(ExecutionError):
+    """Raised for failed docker API requests. Like :ExecutionError: of the
+    command line driver, :command: is the request and :stderr: the error
+    message.
+    """
+    def __init__(self, request, status, message):
+        super(APIError, self).__init__(request, status, None, to_utf8(message))
+
+    def __str__(self):
+        return 'Request failed for %s (%s): %s' % (
+            self.command, self.status, to_text(self.stderr))
+
+
+class _UnixHTTPConnection(http_client.HTTPConnection):
+    def __init__(self, path):
+        http_client.HTTPConnection.__init__(self, 'localhost')
+        self._path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self._path)
+        self.sock = sock
+
+
+def _tell(f_obj):
+    try:
+        return f_obj.tell()
+    except (EnvironmentError, ValueError):
+        # not seekable
+        return None
+
+
+class ConnectionPool(object):
+    """Keeps idle http connections to the unix socket :path: open for reuse.
+    """
+    def __init__(self, path, size=_POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(size)
+
+    def _get(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return _UnixHTTPConnection(self.path), False
+
+    def _put(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method, url, body=None, headers=None):
+        """Sends a request and returns a :Response:. A request on a reused
+        connection that was closed by the daemon is retried once, unless
+        the body is a file that cannot be rewound, e.g. a pipe.
+        """
+        headers = headers or {}
+        # file bodies are sent again on retries
+        position = _tell(body) if hasattr(body, 'read') else 0
+        while True:
+            connection, reused = self._get()
+            try:
+                connection.request(method, url, body, headers)
+                response = connection.getresponse()
+            except (socket.error, http_client.HTTPException):
+                connection.close()
+                if reused and position is not None:
+                    if hasattr(body, 'read'):
+                        body.seek(position)
+                    continue
+                raise
+            return Response(self, connection, response, '%s %s' % (method, url))
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class Response(object):
+    def __init__(self, pool, connection, response, request):
+        self._pool = pool
+        self._connection = connection
+        self._response = response
+        self.request = request
+        self.status = response.status
+
+    def _release(self):
+        if self._connection is None:
+            return
+        if self._response.will_close or not self._response.isclosed():
+            # closed by the daemon or unread data left
+            self._connection.close()
+        else:
+            self._pool._put(self._connection)
+        self._connection = None
+
+    def read(self):
+        try:
+            return self._response.read()
+        finally:
+            self._release()
+
+    def json(self):
+        data = self.read()
+        if data:
+            return json.loads(to_text(data))
+
+    def iter_json(self):
+        """Yields the json messages of a streamed response, e.g. progress
+        messages of pull, push and build.
+        """
+        buf = b''
+        try:
+            while True:
+                data = self._response.read(_READ_SIZE)
+                if not data:
+                    break
+                buf += data
+                lines = buf.split(b'\n')
+                buf = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(to_text(line))
+            if buf.strip():
+                yield json.loads(to_text(buf))
+        finally:
+            self._release()
+
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def check(self):
+        """Raises :APIError: unless the request succeeded.
+        """
+        if self.ok():
+            return self
+        data = self.read()
+        try:
+            message = json.loads(to_text(data))['message']
+        except (ValueError, KeyError, TypeError):
+            message = to_text(data)
+        raise APIError(self.request, self.status, message)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# registry -> X-Registry-Auth header
+_auth = {}
+
+
+def _socket_path():
+    docker_host = os.environ.get('DOCKER_HOST', '')
+    if docker_host.startswith('unix://'):
+        return docker_host[len('unix://'):]
+    return _DEFAULT_SOCKET
+
+
+def connect(path=None):
+    """Uses the docker daemon listening on the unix socket :path:. Defaults
+    to $DOCKER_HOST (unix://...) or /var/run/docker.sock.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool:
+            _pool.close()
+        _pool = ConnectionPool(path or _socket_path())
+
+
+def _get_pool():
+    with _pool_lock:
+        if _pool is not None:
+            return _pool
+    connect()
+    return _pool
+
+
+def _request(method, path, params=None, **kwargs):
+    url = path
+    if params:
+        params = dict((k, v) for k, v in params.items() if v is not None)
+        url = '%s?%s' % (path, urlencode(sorted(params.items())))
+    return _get_pool().request(method, url, **kwargs)
+
+
+def _quote(name):
+    return quote(name, safe='')
+
+
+def _split_repotag(repotag):
+    name, _sep, tag = repotag.rpartition(':')
+    if not name or '/' in tag:
+        return repotag, None
+    return name, tag
+
+
+def _registry_key(registry):
+    # registry url with or without scheme and path, e.g. http://host:5000
+    registry = to_text(registry)
+    registry = re.sub(r'^[a-z]+://', '', registry)
+    return registry.split('/', 1)[0]
+
+
+def _auth_header(repotag):
+    name = _split_repotag(repotag)[0]
+    key = name.split('/', 1)[0] if '/' in name else None
+    # the header is mandatory for push, even without credentials
+    return {'X-Registry-Auth': _auth.get(key, to_text(base64.b64encode(b'{}')))}
+
+
+def _check_messages(response):
+    """Consumes a streamed response and returns its messages. Raises
+    :APIError: for error messages.
+    """
+    messages = []
+    for message in response.iter_json():
+        if 'error' in message:
+            raise APIError(response.request, response.status,
+                           message['error'])
+        _log.debug('>> %s', message.get('stream') or message.get('status')
+                   or message)
+        messages.append(message)
+    return messages
+
+
+def build(repotag, chdir=None, dockerfile=None):
+    """Builds the image :repotag: from the directory :chdir:, like
+    ``docker build``. The build context is pruned, see :_context:.
+    """
+    directory = chdir or os.getcwd()
+
+    with _context.build_context(directory, dockerfile) as (context, name):
+        size = os.fstat(context.fileno()).st_size
+        response = _request(
+            'POST', '/build',
+            dict(t=repotag, rm=1,
+                 dockerfile=name if name != 'Dockerfile' else None),
+            body=context,
+            headers={'Content-Type': 'application/x-tar',
+                     'Content-Length': str(size)}).check()
+        messages = _check_messages(response)
+
+    for message in reversed(messages):
+        if 'aux' in message:
+            return message['aux']['ID']
+        match = re.search(r'Successfully built ([0-9a-fA-F]{12,})',
+                          message.get('stream', ''))
+        if match:
+            return match.group(1)
+    raise Exception()
+
+
+def commit(container_id, repotag=None):
+    """Commits the container and returns the docker image id.
+    """
+    repo = tag = None
+    if repotag:
+        repo, tag = _split_repotag(repotag)
+    response = _request(
+        'POST', '/commit', dict(container=container_id, repo=repo, tag=tag))
+    return response.check().json()['Id']
+
+
+def import_(source):
+    """Imports the archive :source:, a filename or a binary file object,
+    like ``docker import``. Archives of unknown size, e.g. pipes, are sent
+    chunked.
+    """
+    if not hasattr(source, 'read'):
+        with open(source, 'rb') as f_obj:
+            return import_(f_obj)
+
+    headers = {'Content-Type': 'application/x-tar'}
+    stat = os.fstat(source.fileno())
+    if S_ISREG(stat.st_mode):
+        headers['Content-Length'] = str(stat.st_size - source.tell())
+    response = _request(
+        'POST', '/images/create', dict(fromSrc='-'),
+        body=source, headers=headers).check()
+    messages = _check_messages(response)
+    return messages[-1]['status'].strip()
+
+
+def _format(data, format):
+    # supports {{.Field.SubField}} of the docker inspect templates
+    def _lookup(match):
+        value = data
+        for key in match.group(1).split('.'):
+            value = value[key]
+        if isinstance(value, six.string_types):
+            return value
+        return json.dumps(value)
+
+    return re.sub(r'\{\{\s*\.([A-Za-z0-9_.]+)\s*\}\}', _lookup, format)
+
+
+def inspect(container_id, format=None):
+    """Returns the details of an image or container like ``docker inspect``
+    or None if it does not exist.
+    """
+    for kind in ('images', 'containers'):
+        response = _request('GET', '/%s/%s/json' % (kind, _quote(container_id)))
+        if response.status != 404:
+            data = response.check().json()
+            if format:
+                return _format(data, format)
+            return data
+        response.read()
+
+
+def inspect_id(what):
+    return inspect(what, '{{.Id}}')
+
+
+def inspect_ids(repotags):
+    """Returns a dict of repotag -> image id, the image id is None for
+    missing images.
+    """
+    repotags = list(set(repotags))
+    ids = map_concurrent(inspect_id, repotags, _POOL_SIZE)
+    return dict(zip(repotags, ids))
+
+
+def login(registry, username, password, email=' '):
+    """Checks the credentials and uses them for pushing and pulling images
+    of :registry:.
+    """
+    key = _registry_key(registry)
+    config = dict(username=username, password=password, email=email,
+                  serveraddress=to_text(registry))
+    _request('POST', '/auth',
+             body=json.dumps(config),
+             headers={'Content-Type': 'application/json'}).check().read()
+
+    config = json.dumps(dict(config, serveraddress=key))
+    _auth[key] = to_text(base64.urlsafe_b64encode(to_utf8(config)))
+
+
+def logout(registry):
+    _auth.pop(_registry_key(registry), None)
+
+
+def pull(repotag):
+    name, tag = _split_repotag(repotag)
+    response = _request(
+        'POST', '/images/create', dict(fromImage=name, tag=tag or 'latest'),
+        headers=_auth_header(repotag)).check()
+    _check_messages(response)
+
+
+def push(repotag):
+    assert repotag
+    name, tag = _split_repotag(repotag)
+    response = _request(
+        'POST', '/images/%s/push' % _quote(name), dict(tag=tag),
+        headers=_auth_header(repotag)).check()
+    _check_messages(response)
+
+
+def rm(container_id, force=True):
+    """Removes a container. Returns the http status unless 2xx if :force:
+    is set, raises :APIError: otherwise.
+    """
+    response = _request('DELETE', '/containers/%s' % _quote(container_id),
+                        dict(force=1 if force else None))
+    if force:
+        response.read()
+        return 0 if response.ok() else response.status
+    response.check().read()
+
+
+def rmi(repotag, force=True):
+    """Removes an image. Returns the http status unless 2xx if :force: is
+    set, raises :APIError: otherwise.
+    """
+    response = _request('DELETE', '/images/%s' % _quote(repotag),
+                        dict(force=1 if force else None))
+    if force:
+        data = response.read()
+        if response.ok():
+            _log.debug('>> %s', to_text(data))
+            return 0
+        return response.status
+    response.check().read()
+
+
+def rmi_many(repotags, jobs=_POOL_SIZE):
+    """Removes the images :repotags:, :jobs: images concurrently. Missing
+    images are ignored.
+    """
+    map_concurrent(rmi, list(repotags), jobs)
+
+
+def tag(image, repotag):
+    assert image
+    assert repotag
+    repo, tag = _split_repotag(repotag)
+    response = _request('POST', '/images/%s/tag' % _quote(image),
+                        dict(repo=repo, tag=tag))
+    response.check().read()
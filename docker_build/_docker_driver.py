@@ -1,24 +1,52 @@
 import json
 import logging
+import os
 import re
 
-from . import _exec
+from . import _context, _exec
+from ._compat import to_text
+from ._pool import map_concurrent
 
 
 _log = logging.getLogger(__name__)
 
+# lines of error output kept for streamed commands
+_ERROR_LINES = 100
+
+# maximum number of images removed by a single docker rmi
+_RMI_BATCH_SIZE = 50
+
 
 def _exec_docker_cmd(command, *args, **kwargs):
     return _exec.exec_cmd('docker', command, *args, **kwargs)
 
 
-def build(repotag, chdir=None):
-    """Executes ``docker build``.
+def build(repotag, chdir=None, dockerfile=None):
+    """Executes ``docker build`` in :chdir:. The pruned build context, see
+    :_context:, is streamed to docker.
     """
-    output = _exec_docker_cmd('-D', 'build', '--rm', '-t', repotag, '.', chdir=chdir)
-    match = re.search(r'Successfully built ([0-9a-fA-F]{12,})', output)
-    if match:
-        return match.group(1)
+    directory = chdir or os.getcwd()
+    with _context.build_context(directory, dockerfile) as (context, name):
+        return _build(repotag, context, name)
+
+
+def _build(repotag, context, dockerfile):
+    args = ['-D', 'build', '--rm', '-t', repotag]
+    if dockerfile != 'Dockerfile':
+        args.extend(['-f', dockerfile])
+    args.append('-')
+
+    image_ids = []
+    def _match(line):
+        match = re.search(r'Successfully built ([0-9a-fA-F]{12,})',
+                          to_text(line))
+        if match:
+            image_ids.append(match.group(1))
+
+    _exec_docker_cmd(*args, stdin=context, callback=_match,
+                     max_lines=_ERROR_LINES)
+    if image_ids:
+        return image_ids[-1]
     raise Exception()
 
 
@@ -33,9 +61,14 @@ def commit(container_id, repotag=None):
     return _exec_docker_cmd('commit', '-p', container_id, *args)
 
 
-def import_(filename):
-    f_obj = open(filename, 'rb')
-    return _exec_docker_cmd('import', '-', stdin=f_obj)
+def import_(source):
+    """Executes ``docker import``. The archive :source:, a filename or a
+    binary file object, is streamed to docker.
+    """
+    if hasattr(source, 'read'):
+        return _exec_docker_cmd('import', '-', stdin=source)
+    with open(source, 'rb') as f_obj:
+        return _exec_docker_cmd('import', '-', stdin=f_obj)
 
 
 def inspect(container_id, format=None):
@@ -65,6 +98,32 @@ def inspect_id(what):
         return image_id.strip()
 
 
+def _normalize_repotag(repotag):
+    # docker lists repotags always with a tag
+    if ':' not in repotag.rsplit('/', 1)[-1]:
+        return repotag + ':latest'
+    return repotag
+
+
+def inspect_ids(repotags):
+    """Executes a single ``docker inspect <repotag> ...`` for all
+    :repotags:. Returns a dict of repotag -> image id, the image id is None
+    for missing images.
+    """
+    ids = dict.fromkeys(repotags)
+    if not ids:
+        return ids
+
+    # fails if any image is missing, but still prints the existing ones
+    _status, output = _exec_docker_cmd('inspect', *ids.keys(), can_fail=True)
+    normalized = dict((_normalize_repotag(r), r) for r in ids)
+    for data in json.loads(output or '[]'):
+        for repotag in data.get('RepoTags') or []:
+            if repotag in normalized:
+                ids[normalized[repotag]] = data['Id']
+    return ids
+
+
 def login(registry, username, password, email=' '):
     """Executes ``docker login ...``.
     """
@@ -116,6 +175,24 @@ def rmi(repotag, force=True):
         _exec_docker_cmd('rmi', repotag)
 
 
+def rmi_many(repotags, jobs=1):
+    """Removes the images :repotags: with ``docker rmi -f``. The images are
+    split into at most :jobs: batches, which are removed concurrently.
+    Missing images are ignored.
+    """
+    repotags = list(repotags)
+    size = min(_RMI_BATCH_SIZE, max(1, -(-len(repotags) // jobs)))
+    batches = [repotags[i:i + size] for i in range(0, len(repotags), size)]
+
+    def _rmi(batch):
+        # fails if any image is missing, but still removes the others
+        status, output = _exec_docker_cmd('rmi', '-f', *batch, can_fail=True)
+        if status:
+            _log.debug('docker rmi failed: %s', status)
+
+    map_concurrent(_rmi, batches, jobs)
+
+
 #def run(repotag, cmd, volumes=()):
 #    """Executes ``docker run`` and returns the docker container id.
 #    """
@@ -0,0 +1,24 @@
+"""Selects the docker driver used by images and registries: the docker
+command line tool or the Docker Engine API. Drivers are imported when
+selected.
+"""
+import importlib
+
+
+DRIVERS = {
+    'cli': '._docker_driver',
+    'api': '._docker_api_driver',
+}
+
+_driver = None
+
+
+def get_driver():
+    if _driver is None:
+        set_driver('cli')
+    return _driver
+
+
+def set_driver(name):
+    global _driver
+    _driver = importlib.import_module(DRIVERS[name], __package__)
@@ -1,12 +1,19 @@
+import collections
+import errno
 import logging
 import os
 import pipes
 import subprocess
 import threading
 
+from . import _profile
+
 
 _log = logging.getLogger(__name__)
 
+# bytes copied at once into the stdin pipe of a process
+_STDIN_CHUNK_SIZE = 1024 * 1024
+
 
 class ExecutionError(Exception):
     def __init__(self, cmd, status, stdout, stderr):
@@ -38,45 +45,103 @@ def wrap_execution_error(exc_type):
     return _deco
 
 
-def _readerthread(fh, logger, out):
+def _readerthread(fh, logger, out, callback=None):
+    for line in iter(fh.readline, b''):
+        if logger:
+            logger(line)
+        if callback:
+            callback(line)
+        if out is not None:
+            out.append(line)
+
+
+def _sendfile(f_obj, pipe):
+    """Copies the file :f_obj: to :pipe: without reading it into user space.
+    Returns False if the platform does not support it for these files.
+    """
+    if not hasattr(os, 'sendfile'):
+        return False
+    try:
+        in_fd = f_obj.fileno()
+    except (AttributeError, IOError, ValueError):
+        # not a real file, e.g. io.BytesIO
+        return False
+
+    try:
+        offset = f_obj.tell()
+    except (EnvironmentError, ValueError):
+        # pipes
+        return False
+    out_fd = pipe.fileno()
     while True:
-        data = fh.read()
-        if not data:
+        try:
+            sent = os.sendfile(out_fd, in_fd, offset, _STDIN_CHUNK_SIZE)
+        except OSError as error:
+            if offset == f_obj.tell() and error.errno in (
+                    errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK):
+                # nothing sent yet: not supported for this kind of file
+                return False
+            raise
+        if not sent:
             break
-        if logger:
-            logger(data)
-        out.append(data)
+        offset += sent
+    return True
 
 
-def _communicate(popen, stdin=None):
-    stdout = []
-    stderr = []
+def _write_stdin(stdin, pipe):
+    try:
+        if not hasattr(stdin, 'read'):
+            pipe.write(stdin)
+        elif not _sendfile(stdin, pipe):
+            while True:
+                data = stdin.read(_STDIN_CHUNK_SIZE)
+                if not data:
+                    break
+                pipe.write(data)
+        pipe.close()
+    except (IOError, OSError) as error:
+        # the process exited without reading all data, the exit status
+        # tells the reason
+        if error.errno != errno.EPIPE:
+            raise
+        _log.debug('stdin closed by process: %s', error)
+
+
+def _communicate(popen, stdin=None, callback=None, keep_output=True,
+                 max_lines=None):
+    """Streams the output of :popen: line by line to :callback: and returns
+    the exit status and the output.
+
+    stdout is only kept if :keep_output: is set. stdout and stderr are
+    limited to their last :max_lines: lines.
+    """
+    stdout = collections.deque(maxlen=max_lines) if keep_output else None
+    stderr = collections.deque(maxlen=max_lines)
 
-    logger = lambda v: _log.debug('[stdout] %s', v)
+    logger = lambda v: _log.debug('[stdout] %s', v.rstrip())
     stdout_thread = threading.Thread(target=_readerthread,
-                                     args=(popen.stdout, logger, stdout))
-    logger = lambda v: _log.debug('[stderr] %s', v)
+                                     args=(popen.stdout, logger, stdout,
+                                           callback))
+    logger = lambda v: _log.debug('[stderr] %s', v.rstrip())
     stderr_thread = threading.Thread(target=_readerthread,
                                      args=(popen.stderr, logger, stderr))
 
-    stdout_thread.setDaemon(True)
-    stderr_thread.setDaemon(True)
+    stdout_thread.daemon = True
+    stderr_thread.daemon = True
 
     stdout_thread.start()
     stderr_thread.start()
 
     if stdin is not None:
-        if hasattr(stdin, 'read'):
-            stdin_data = stdin.read()
-        else:
-            stdin_data = stdin
-        popen.stdin.write(stdin_data)
-        popen.stdin.close()
+        # the reader threads drain the output meanwhile, so the process
+        # never blocks on a full output pipe
+        _write_stdin(stdin, popen.stdin)
 
     stdout_thread.join()
     stderr_thread.join()
 
-    stdout = b''.join(stdout)
+    if stdout is not None:
+        stdout = b''.join(stdout)
     stderr = b''.join(stderr)
 
     popen.wait()
@@ -84,30 +149,60 @@ def _communicate(popen, stdin=None):
 
 
 def exec_cmd(binary, *command_args, **kwargs):
+    """Executes the command and returns its output.
+
+    Keyword arguments:
+
+    :chdir: working directory of the command.
+    :can_fail: return ``(status, output)`` instead of raising
+        :ExecutionError: on failure.
+    :stdin: bytes or file object that is streamed to the command.
+    :callback: called with every line of the output while the command is
+        running. The output is not returned unless :keep_output: is set.
+    :keep_output: keep and return the output. Defaults to True without a
+        :callback:.
+    :max_lines: only keep the last lines of the output and error output.
+    :env: environment variables set for the command.
+    """
     change_dir = kwargs.pop('chdir', None)
     can_fail = kwargs.pop('can_fail', False)
     stdin = kwargs.pop('stdin', None)
+    callback = kwargs.pop('callback', None)
+    keep_output = kwargs.pop('keep_output', callback is None)
+    max_lines = kwargs.pop('max_lines', None)
+    env = kwargs.pop('env', None)
     assert not kwargs, kwargs
 
+    if env:
+        env = dict(os.environ, **env)
+
     stdin_pipe = subprocess.PIPE if stdin else None
     command = [binary] + list(command_args)
     _log.debug(' '.join(command))
-    try:
-        with chdir(change_dir):
+
+    # arguments may contain credentials, only the sub command is recorded
+    subcommand = [arg for arg in command_args if not arg.startswith('-')]
+    with _profile.span(' '.join([binary] + subcommand[:1]), 'exec') as span:
+        try:
             popen = subprocess.Popen(command,
                                      close_fds=True,
+                                     cwd=change_dir,
+                                     env=env,
                                      stdout=subprocess.PIPE,
                                      stderr=subprocess.PIPE,
                                      stdin=stdin_pipe)
-    except os.error as error:
-        status = -1
-        stdout = None
-        stderr = str(error)
-        if can_fail:
-            return (status, stdout, stderr)
-        raise ExecutionError(binary, status, stdout, stdout)
-
-    status, stdout, stderr = _communicate(popen, stdin)
+        except os.error as error:
+            status = -1
+            stdout = None
+            stderr = str(error)
+            span.args['exit_code'] = status
+            if can_fail:
+                return (status, stdout, stderr)
+            raise ExecutionError(binary, status, stdout, stdout)
+
+        status, stdout, stderr = _communicate(
+            popen, stdin, callback, keep_output, max_lines)
+        span.args['exit_code'] = status
 
     if not can_fail and status:
         raise ExecutionError(binary, status, stdout, stderr)
@@ -120,16 +215,24 @@ def exec_cmd(binary, *command_args, **kwargs):
 
 class chdir(object):
     """Context manager to change the working directory.
+
+    The working directory is shared by all threads, therefore threads that
+    change it are serialized.
     """
+    _lock = threading.RLock()
+
     def __init__(self, directory):
         self._directory = directory
-        self._cwd = os.getcwd()
+        self._cwd = None
 
     def __enter__(self):
         if self._directory:
+            self._lock.acquire()
+            self._cwd = os.getcwd()
             os.chdir(self._directory)
 
     def __exit__(self, exc_type, exc_value, traceback):
         if self._directory:
             os.chdir(self._cwd)
+            self._lock.release()
 
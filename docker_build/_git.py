@@ -0,0 +1,20 @@
+import os
+
+from ._compat import to_text
+from ._exec import exec_cmd
+
+
+def changed_files(ref, directory):
+    """Returns the absolute paths of the files of the git work tree of
+    :directory: that changed since the commit :ref:, including uncommitted
+    and untracked files.
+    """
+    top = to_text(exec_cmd('git', 'rev-parse', '--show-toplevel',
+                           chdir=directory)).strip()
+    changed = to_text(exec_cmd('git', 'diff', '--name-only', ref, '--',
+                               chdir=top))
+    untracked = to_text(exec_cmd('git', 'ls-files', '--others',
+                                 '--exclude-standard', chdir=top))
+
+    files = (changed + '\n' + untracked).splitlines()
+    return [os.path.join(top, name) for name in files if name]
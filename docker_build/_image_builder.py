@@ -1,5 +1,15 @@
 import logging
+
+import six
+
+from . import _drivers, _prefetch, _profile
+from ._cache import BuildCache
+from ._cleanup import remove_images
 from ._exec import ExecutionError
+from ._journal import BuildJournal
+from ._scheduler import Scheduler, image_closure
+from ._uploader import Uploader, report
+from .image.api import BaseImageLayer
 
 
 _log = logging.getLogger(__name__)
@@ -9,18 +19,48 @@ class ImageBuilder(object):
     """Builds images and uploads them to the registry (optionally).
 
     Does not build images if they are already built unless options.force
-    is set.
+    is set. Independent images are built concurrently by options.jobs
+    worker threads. Built images are uploaded by options.push_jobs pusher
+    threads while the remaining images are built.
+
+    Unless options.use_cache is unset, images whose build inputs did not
+    change are taken from the build cache in options.cache_dir.
+
+    Missing existing base images of the images to build are pulled by
+    options.pull_jobs threads ahead of their builds, see :_prefetch:.
+
+    Chains of temporary images are fused into the build of their child
+    image where possible, see :ImageCollection.fuse_layers:.
+
+    Temporary images are removed after the build, by a background process
+    if options.async_cleanup is set. With options.resume they are kept if the
+    build fails, and the next run with options.resume continues with the
+    images built by the failed run, see :BuildJournal:. Images pushed by the
+    failed run are not pushed again, see :BaseImageLayer.upload_to_registry:.
+
+    :targets: restricts the build to these tagged images and their base
+    images. Defaults to all tagged images.
     """
-    def __init__(self, options, image_collection):
+    def __init__(self, options, image_collection, targets=None):
         self._options = options
         self._image_collection = image_collection
+        self._targets = targets
+        self._cache = None
+        if options.use_cache:
+            self._cache = BuildCache(options.cache_dir)
+        config = options.dockerbuild
+        self._journal = BuildJournal(options.cache_dir,
+                                     config if config != '-' else None)
 
 
     def _images(self):
         cleanup = []
         retval = None
 
-        tagged = self._image_collection.tagged_images()
+        if self._targets is None:
+            tagged = self._image_collection.tagged_images()
+        else:
+            tagged = self._targets
 
         if not tagged:
             _log.warn('Only temporary images found. Nothing to build.')
@@ -32,8 +72,15 @@ class ImageBuilder(object):
                 image.delete()
                 build.append(image)
         else:
+            with _profile.span('check uploaded', 'check', images=len(tagged)):
+                uploaded = BaseImageLayer.check_uploaded(tagged)
+            if self._cache:
+                # the digests depend on the ids of the pulled images
+                BaseImageLayer.inspect_pulled(
+                    [image for image in tagged
+                     if self._cache.tag_digest(image.full_repotag)])
             for image in tagged:
-                if not image.is_uploaded():
+                if not uploaded[image] or self._is_changed(image):
                     build.append(image)
 
             if not build:
@@ -44,29 +91,146 @@ class ImageBuilder(object):
 
 
     def build(self):
+        try:
+            return self._build()
+        finally:
+            _prefetch.stop()
+
+
+    def _build(self):
         images = self._images()
         if not images:
+            if len(self._journal):
+                # the images of the last run are not needed anymore
+                self._cleanup(True)
             return True
 
+        targets = set(images)
+
+        if self._options.pull_jobs:
+            # pulls the base images of the images to build only, an up to
+            # date run does not wait for pulls
+            _prefetch.start(image_closure(images), self._options.pull_jobs)
+
+        fused = self._image_collection.fuse_layers()
+        if fused:
+            _log.debug('Fused %d temporary images into their child images',
+                       fused)
+
+        def _build(image):
+            if image not in targets:
+                # base image, built on behalf of a tagged image
+                self._build_image(image)
+                return
+
+            _log.info('Building image: %s', image.full_repotag)
+            self._build_image(image)
+            if not image.is_uploadable():
+                return
+            uploader.put(image)
+
+        success = False
+        uploader = Uploader(self._options.push_jobs)
         try:
-            for image in images:
-                _log.info('Building image: %s', image.full_repotag)
-                try:
-                    # builds dependent images, too
-                    image.build()
-                    image.upload_to_registry()
-                except ExecutionError as error:
-                    _log.error(
-                        'While building image %s. %s', image.full_repotag, error)
-                    return False
+            try:
+                scheduler = Scheduler(self._options.jobs)
+                failed = scheduler.run(images, _build)
+            finally:
+                results = uploader.wait()
+                uploaded = report(results)
+                if self._cache:
+                    self._cache.save()
+            success = uploaded and not failed
         finally:
             _log.debug('cleanup temporary images')
-            self._cleanup()
+            self._cleanup(success)
 
+        for image, exc_info in failed:
+            error = exc_info[1]
+            if not isinstance(error, ExecutionError):
+                six.reraise(*exc_info)
+            _log.error(
+                'While building image %s. %s', image.full_repotag, error)
+
+        return success
+
+
+    def _is_changed(self, image):
+        """Returns True if the build inputs of :image: changed since it was
+        built the last time.
+        """
+        if not self._cache:
+            return False
+
+        built_from = self._cache.tag_digest(image.full_repotag)
+        if built_from is None or image.digest() in (None, built_from):
+            return False
+
+        _log.info('Build inputs changed: %s', image.full_repotag)
         return True
 
 
-    def _cleanup(self):
-        for image in self._image_collection:
-            image.cleanup()
+    def _build_image(self, image):
+        """Builds :image: unless the last, failed run built it already (see
+        options.resume) or the build cache contains an image that was built
+        from the same inputs.
+        """
+        if not self._options.force:
+            self._use_built_image(image)
+
+        image.build()
+
+        digest = None
+        if self._cache or self._options.resume:
+            digest = image.digest()
+        if not digest or not image.image_id:
+            return
+
+        if self._cache:
+            repotag = None if image.is_temporary() else image.full_repotag
+            self._cache.add(digest, image.image_id, repotag)
+        if self._options.resume:
+            self._journal.built(image, digest)
+
+
+    def _use_built_image(self, image):
+        if not self._cache and not self._options.resume:
+            return
+        digest = image.digest()
+        if not digest:
+            return
+
+        if self._options.resume:
+            image_id = self._journal.image_id(digest)
+            if image_id and image.use_image(image_id):
+                _log.info('Resuming with the image of the last run for %s',
+                          image.full_repotag)
+                return
+
+        if self._cache:
+            image_id = self._cache.image_id(digest)
+            if image_id and image.use_image(image_id):
+                _log.info('Using cached image for %s', image.full_repotag)
+
+
+    def _cleanup(self, success):
+        """Removes the temporary images, unless the build failed and is
+        resumed by the next run.
+        """
+        if self._options.resume and not success:
+            _log.info('Keeping the temporary images to resume the build')
+            return
 
+        with _profile.span('cleanup', 'cleanup'):
+            BaseImageLayer.cleanup_images(
+                self._image_collection, self._options.async_cleanup)
+
+            # kept by the last run
+            removed = set(image._cleanup_repotag()
+                          for image in self._image_collection)
+            repotags = [repotag
+                        for repotag in self._journal.temporary_repotags()
+                        if repotag not in removed]
+            remove_images(_drivers.get_driver(), repotags,
+                          self._options.async_cleanup)
+        self._journal.clear()
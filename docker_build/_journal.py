@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import threading
+
+from ._cache import _read, _write
+from ._compat import to_utf8
+
+
+class BuildJournal(object):
+    """Persistent record of the layers built by a run, so a failed
+    run can be resumed, see :ImageBuilder:. Layers are identified by the
+    digest of their build inputs, the repotags of temporary images differ
+    between runs.
+
+    Pushed images are deliberately not recorded: a tag may be pushed again
+    by other hosts in the meantime, so whether an image still has to be
+    pushed is left to the registry check of
+    :BaseImageLayer.upload_to_registry:.
+
+    The cache :directory: is shared by all projects, so there is a journal
+    per :config: file. A configuration read from standard input is keyed by
+    the working directory.
+    """
+    def __init__(self, directory, config=None):
+        config = os.path.abspath(config or os.getcwd())
+        name = 'journal-%s.json' % hashlib.sha1(to_utf8(config)).hexdigest()
+        self._path = os.path.join(os.path.expanduser(directory), name)
+        self._lock = threading.Lock()
+        # digest -> dict(image_id, repotag, temporary)
+        self._layers = _read(self._path)
+
+    def __len__(self):
+        return len(self._layers)
+
+    def image_id(self, digest):
+        """Returns the id of the image built from the inputs :digest:.
+        """
+        with self._lock:
+            layer = self._layers.get(digest)
+        return layer and layer['image_id']
+
+    def built(self, image, digest):
+        with self._lock:
+            layer = self._layers.get(digest)
+            if layer and layer['image_id'] == image.image_id:
+                # resumed, the image keeps the repotag of the last run
+                return
+            self._layers[digest] = dict(image_id=image.image_id,
+                                        repotag=image.repotag,
+                                        temporary=image.is_temporary())
+            self._save()
+
+    def temporary_repotags(self):
+        """Returns the repotags of the recorded temporary images.
+        """
+        with self._lock:
+            return sorted(layer['repotag'] for layer in self._layers.values()
+                          if layer['temporary'])
+
+    def clear(self):
+        with self._lock:
+            self._layers = {}
+            if os.path.exists(self._path):
+                os.remove(self._path)
+
+    def _save(self):
+        _write(self._path, json.dumps(self._layers))
@@ -1,10 +1,16 @@
 import errno
-import imp
+import hashlib
 import logging
+import marshal
 import os
 import sys
+import tempfile
 import traceback
+import types
 
+import six
+
+from ._compat import to_utf8
 from ._exec import chdir
 from ._registry import Registry
 from .image.api import BaseImageLayer
@@ -75,21 +81,91 @@ def _check_file_exists(path):
                       path)
 
 
-def _load_module(cwd, filename):
+_code_cache = None
+
+
+def set_code_cache(directory):
+    """Keeps the compiled code of loaded config files in :directory:, None
+    disables the cache.
+    """
+    global _code_cache
+    _code_cache = os.path.expanduser(directory) if directory else None
+
+
+def _compile(abspath):
+    with open(abspath, 'rb') as f_obj:
+        source = f_obj.read()
+    return compile(source, abspath, 'exec', dont_inherit=True)
+
+
+def _code_cache_path(abspath):
+    # marshal data is specific to the python version
+    key = hashlib.sha1(to_utf8(abspath + '\0' + sys.version)).hexdigest()
+    return os.path.join(_code_cache, key)
+
+
+def _load_code(abspath):
+    """Returns the compiled code of :abspath:. The code is taken from the
+    code cache while the size and mtime of the file are unchanged.
+    """
+    if _code_cache is None:
+        return _compile(abspath)
+
+    stat = os.stat(abspath)
+    path = _code_cache_path(abspath)
+    try:
+        with open(path, 'rb') as f_obj:
+            mtime, size, code = marshal.load(f_obj)
+        if (mtime, size) == (stat.st_mtime, stat.st_size):
+            return code
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        pass
+
+    code = _compile(abspath)
+    try:
+        if not os.path.isdir(_code_cache):
+            os.makedirs(_code_cache)
+        fd, temp = tempfile.mkstemp(dir=_code_cache)
+        with os.fdopen(fd, 'wb') as f_obj:
+            marshal.dump((stat.st_mtime, stat.st_size, code), f_obj)
+        os.rename(temp, path)
+    except (IOError, OSError) as error:
+        _log.debug('cannot cache compiled config %s: %s', abspath, error)
+    return code
+
+
+def _exec_module(name, filename, code):
+    module = types.ModuleType(name)
+    module.__file__ = filename
+    sys.modules[name] = module
+    six.exec_(code, module.__dict__)
+    return module
+
+
+def _load_module(cwd, filename, source=None):
+    """Loads the config file :filename:. With :source: the config is not
+    read from :filename:, which is only used in tracebacks.
+    """
     if cwd:
         abspath = os.path.join(cwd, filename)
     else:
         abspath = os.path.abspath(filename)
 
-    # python >= 2.7: do not write out compiled config file
+    # python >= 2.7: do not write out compiled files of modules imported by
+    # the config
     sys.dont_write_bytecode = True
 
     with chdir(cwd or os.path.dirname(filename)):
-        _check_file_exists(abspath)
+        if source is None:
+            _check_file_exists(abspath)
 
         name = abspath.replace('.', '_')
         try:
-            return imp.load_source(name, abspath)
+            if source is None:
+                code = _load_code(abspath)
+            else:
+                code = compile(source, filename, 'exec', dont_inherit=True)
+            return _exec_module(name, abspath, code)
         except Exception as error:
             formatted = _format_exception(error, filename)
             raise FormattedException(formatted)
@@ -118,11 +194,23 @@ def load_config_file(builtins, path, cwd=None):
     :Registry: and :Image: must be set as builtins.
     """
     module = _load_module(cwd, path)
+    _register_images(builtins, module)
+    return module
+
+
+def load_config_source(builtins, source, cwd=None):
+    """Like :load_config_file: for the content :source: of a config file,
+    e.g. read from stdin.
+    """
+    module = _load_module(cwd or os.getcwd(), '<stdin>', source)
+    _register_images(builtins, module)
+    return module
+
+
+def _register_images(builtins, module):
     for name in dir(module):
         value = getattr(module, name)
         if isinstance(value, BaseImageLayer):
             _log.debug('found image: %s', name)
             builtins.register(name, value)
 
-    return module
-
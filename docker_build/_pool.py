@@ -0,0 +1,131 @@
+import sys
+import threading
+
+import six
+from six.moves import queue
+
+
+class Task(object):
+    """Result of a callable submitted to a :WorkerPool:.
+    """
+    def __init__(self, func, args, kwargs):
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+    def run(self):
+        try:
+            self.result = self._func(*self._args, **self._kwargs)
+        except Exception:
+            self.exc_info = sys.exc_info()
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self):
+        """Waits until the task is finished and returns its result. Reraises
+        the exception of the task if it failed.
+        """
+        self._done.wait()
+        if self.exc_info:
+            six.reraise(*self.exc_info)
+        return self.result
+
+
+class WorkerPool(object):
+    """Executes callables on a fixed number of worker threads.
+    """
+    def __init__(self, size):
+        assert size >= 1, size
+        self._queue = queue.Queue()
+        self._threads = []
+
+        for _index in range(size):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            task.run()
+
+    def submit(self, func, *args, **kwargs):
+        task = Task(func, args, kwargs)
+        self._queue.put(task)
+        return task
+
+    def close(self):
+        """Stops the worker threads once all submitted tasks are done.
+        """
+        for _thread in self._threads:
+            self._queue.put(None)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        self.join()
+
+
+def map_concurrent(func, items, size):
+    """Calls :func: for every item of :items: on at most :size: worker
+    threads. Returns the results in the order of :items:.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    with WorkerPool(min(size, len(items))) as pool:
+        tasks = [pool.submit(func, item) for item in items]
+    return [task.wait() for task in tasks]
+
+
+def imap_unordered(func, items, size):
+    """Calls :func: for every item of :items: on :size: worker threads and
+    yields the results as soon as they are available. :items: is consumed
+    lazily, at most :size: calls are pending at any time.
+    """
+    results = queue.Queue()
+
+    def _call(item):
+        try:
+            results.put((func(item), None))
+        except Exception:
+            results.put((None, sys.exc_info()))
+
+    items = iter(items)
+    pending = 0
+    exhausted = False
+    with WorkerPool(size) as pool:
+        while True:
+            while not exhausted and pending < size:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pool.submit(_call, item)
+                pending += 1
+
+            if not pending:
+                break
+
+            result, exc_info = results.get()
+            pending -= 1
+            if exc_info:
+                six.reraise(*exc_info)
+            yield result
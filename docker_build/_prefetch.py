@@ -0,0 +1,112 @@
+"""Pulls the existing base images in the background. Started before the
+images are built, the pulls overlap with the builds of other images, see
+:start:.
+"""
+import logging
+import threading
+
+from ._pool import WorkerPool
+
+
+_log = logging.getLogger(__name__)
+
+# concurrent pulls
+_JOBS = 4
+
+_prefetch = None
+_prefetch_lock = threading.Lock()
+
+
+class Prefetch(object):
+    """Pulls the missing images of :repotags:, a dict of driver -> repotags,
+    by :jobs: worker threads. The local images are inspected in a batch per
+    driver first.
+    """
+    def __init__(self, repotags, jobs=_JOBS):
+        self._pool = WorkerPool(jobs)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        # (driver, repotag) -> pull task
+        self._pulls = {}
+        self._planned = [self._pool.submit(self._plan, driver, group)
+                         for driver, group in repotags.items()]
+
+    def _plan(self, driver, repotags):
+        if self._stopped.is_set():
+            return
+        ids = driver.inspect_ids(repotags)
+        missing = [repotag for repotag in repotags if ids[repotag] is None]
+        if missing:
+            _log.info('Pulling %d images in the background', len(missing))
+        for repotag in missing:
+            task = self._pool.submit(self._pull, driver, repotag)
+            with self._lock:
+                self._pulls[(driver, repotag)] = task
+
+    def _pull(self, driver, repotag):
+        if self._stopped.is_set():
+            # not needed anymore
+            return
+        driver.pull(repotag)
+
+    def wait(self, driver, repotag):
+        """Waits until the image :repotag: is pulled if it is prefetched.
+        Failures are ignored, the caller pulls again to report them.
+        """
+        for task in self._planned:
+            try:
+                task.wait()
+            except Exception as error:
+                _log.debug('Prefetch failed: %s', error)
+
+        with self._lock:
+            task = self._pulls.get((driver, repotag))
+        if task:
+            try:
+                task.wait()
+            except Exception as error:
+                _log.debug('Prefetching %s failed: %s', repotag, error)
+
+    def close(self):
+        """Skips the pending pulls and waits for the running ones, so no
+        ``docker pull`` outlives the build.
+        """
+        self._stopped.set()
+        self._pool.close()
+        self._pool.join()
+
+
+def start(images, jobs=_JOBS):
+    """Starts pulling the existing images among :images:, see
+    :BaseImageLayer.pull_repotag:.
+    """
+    repotags = {}
+    for image in images:
+        repotag = image.pull_repotag()
+        if repotag and repotag not in repotags.get(image._driver, ()):
+            repotags.setdefault(image._driver, []).append(repotag)
+
+    global _prefetch
+    with _prefetch_lock:
+        if _prefetch:
+            _prefetch.close()
+        _prefetch = Prefetch(repotags, jobs) if repotags else None
+
+
+def wait(driver, repotag):
+    """Waits for the prefetched pull of :repotag:, if any.
+    """
+    with _prefetch_lock:
+        prefetch = _prefetch
+    if prefetch:
+        prefetch.wait(driver, repotag)
+
+
+def stop():
+    """Stops prefetching, see :Prefetch.close:.
+    """
+    global _prefetch
+    with _prefetch_lock:
+        if _prefetch:
+            _prefetch.close()
+        _prefetch = None
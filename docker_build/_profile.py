@@ -0,0 +1,162 @@
+"""Records the duration of the phases of a run, e.g. config loading, image
+builds, commands and registry requests. Disabled unless :enable: is called.
+"""
+from __future__ import division
+
+import json
+import os
+import threading
+import time
+
+
+class Span(object):
+    def __init__(self, profiler, name, category, args):
+        self._profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+        self.thread = threading.current_thread().name
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = time.time()
+        if exc_type is not None:
+            self.args.setdefault('error', exc_type.__name__)
+        self._profiler.add(self)
+
+
+class _NullSpan(object):
+    def __init__(self):
+        self.args = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class Profiler(object):
+    def __init__(self):
+        self.started = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def span(self, name, category, **args):
+        return Span(self, name, category, args)
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def chrome_trace(self):
+        """Returns the spans in the chrome trace event format, see
+        chrome://tracing.
+        """
+        threads = {}
+        events = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': int((span.start - self.started) * 1e6),
+                'dur': int(span.duration * 1e6),
+                'pid': os.getpid(),
+                'tid': tid,
+                'args': span.args,
+            })
+        for name, tid in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M',
+                           'pid': os.getpid(), 'tid': tid,
+                           'args': {'name': name}})
+        return {'traceEvents': events}
+
+    def critical_path(self):
+        """Returns the chain of image builds, from the root image to the
+        built image, with the longest total build time.
+        """
+        builds = dict((span.name, span) for span in self.spans
+                      if span.category == 'build')
+        best = []
+        best_duration = -1
+        for span in builds.values():
+            chain = []
+            while span is not None:
+                chain.append(span)
+                span = builds.get(span.args.get('base'))
+            duration = sum(s.duration for s in chain)
+            if duration > best_duration:
+                best = list(reversed(chain))
+                best_duration = duration
+        return best
+
+    def summary(self, slowest=10):
+        """Returns a table of the critical path, the time per category and the
+        slowest spans.
+        """
+        lines = ['Total: %.2fs' % (time.time() - self.started), '']
+
+        path = self.critical_path()
+        if path:
+            lines.append('Critical path (%.2fs):'
+                         % sum(s.duration for s in path))
+            for span in path:
+                lines.append('  %8.2fs  %s' % (span.duration, span.name))
+            lines.append('')
+
+        totals = {}
+        for span in self.spans:
+            count, duration = totals.get(span.category, (0, 0))
+            totals[span.category] = (count + 1, duration + span.duration)
+        lines.append('Time per phase:')
+        for category, (count, duration) in sorted(
+                totals.items(), key=lambda item: -item[1][1]):
+            lines.append('  %8.2fs  %-10s %5d spans'
+                         % (duration, category, count))
+        lines.append('')
+
+        lines.append('Slowest:')
+        for span in sorted(self.spans, key=lambda s: -s.duration)[:slowest]:
+            lines.append('  %8.2fs  %-10s %s'
+                         % (span.duration, span.category, span.name))
+
+        return '\n'.join(lines)
+
+
+_profiler = None
+
+
+def enable():
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+def span(name, category, **args):
+    """Context manager that records the time spent within as a span of
+    :category:, if profiling is enabled. Further details can be added to
+    the ``args`` dict of the returned span.
+    """
+    if _profiler is None:
+        return _NullSpan()
+    return _profiler.span(name, category, **args)
+
+
+def write_trace(path):
+    with open(path, 'w') as f_obj:
+        json.dump(_profiler.chrome_trace(), f_obj)
@@ -1,6 +1,30 @@
-import requests
-from ._compat import urlparse, urlunparse, to_ascii
-from . import _docker_driver
+import threading
+
+from ._compat import urlparse, urljoin, urlunparse, to_ascii, to_text
+from . import _drivers, _profile
+from ._pool import imap_unordered, map_concurrent
+
+
+# maximum number of concurrent http requests per registry
+_CONCURRENT_REQUESTS = 8
+
+# number of repositories and tags requested per page
+_PAGE_SIZE = 100
+
+# manifest types accepted when checking for images of a v2 registry
+_MANIFEST_TYPES = ', '.join([
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.v1+prettyjws',
+])
+
+
+def _split_repotag(repotag):
+    if ':' in repotag:
+        return repotag.split(':', 1)
+    return repotag, 'latest'
 
 
 class RegistryURL(object):
@@ -77,17 +101,19 @@ class RegistryURL(object):
                 url = url[2:]
         return url
 
+    def api_url(self, path):
+        return '%s%s' % (to_text(self.url), path)
+
     def repotag_url(self, repotag):
-        return '%s/%s' % (self.docker_url, repotag)
+        return '%s/%s' % (to_text(self.docker_url), repotag)
 
     def tag_url(self, repotag):
-        if ':' in repotag:
-            repo, tag = repotag.split(':', 1)
-        else:
-            repo = repotag
-            tag  = 'latest'
+        repo, tag = _split_repotag(repotag)
+        return self.api_url('/v1/repositories/%s/tags/%s' % (repo, tag))
 
-        return '%s/v1/repositories/%s/tags/%s' % (self.url, repo, tag)
+    def manifest_url(self, repotag):
+        repo, tag = _split_repotag(repotag)
+        return self.api_url('/v2/%s/manifests/%s' % (repo, tag))
 
 
 class Registry(RegistryURL):
@@ -95,12 +121,20 @@ class Registry(RegistryURL):
         super(Registry, self).__init__(*args, **kwargs)
 
         self._logged_in = False
+        # concurrent uploads share the login
+        self._login_lock = threading.Lock()
+        self._login_users = 0
 
-        self._http = requests.session()
-        if self._username:
-            self._http.auth = self.auth
+        self._session = None
+        self._session_lock = threading.Lock()
+
+        self._docker_driver = _drivers.get_driver()
 
-        self._docker_driver = _docker_driver
+        self._api_version = None
+        self._api_version_lock = threading.Lock()
+
+        # optional :RegistryCache: of info lookups
+        self.cache = None
 
 
     def _check_logged_in(self):
@@ -128,22 +162,73 @@ class Registry(RegistryURL):
         self._logged_in = False
 
     def __enter__(self):
-        self._login()
+        with self._login_lock:
+            if not self._login_users:
+                self._login()
+            self._login_users += 1
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self._logout()
+        with self._login_lock:
+            self._login_users -= 1
+            if not self._login_users:
+                self._logout()
 
     # -------------------------------------------------------------------------
 
+    @property
+    def _http(self):
+        # requests is imported with the first request, most runs do not
+        # talk to registries
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                session = requests.session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_maxsize=_CONCURRENT_REQUESTS)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                if self._username:
+                    session.auth = self.auth
+                self._session = session
+            return self._session
+
+    def _request(self, method, url, **kwargs):
+        with _profile.span('%s %s' % (method, url), 'registry') as span:
+            response = self._http.request(method, url, **kwargs)
+            span.args['status'] = response.status_code
+        return response
+
+    @property
+    def api_version(self):
+        """Version of the registry API, 1 or 2. Detected with the first
+        request and cached.
+        """
+        with self._api_version_lock:
+            if self._api_version is None:
+                response = self._request('GET', self.api_url('/v2/'))
+                # unauthorized requests are answered by v2 registries, too
+                if response.status_code in (200, 401):
+                    self._api_version = 2
+                else:
+                    self._api_version = 1
+            return self._api_version
+
     def ping(self):
-        url = '%s/v1/_ping' % (self.url, )
-        self._http.get(url)
+        if self.api_version == 2:
+            url = self.api_url('/v2/')
+        else:
+            url = self.api_url('/v1/_ping')
+        self._request('GET', url)
 
     def delete_tag(self, repotag):
         # remove tag from remote image
         self._check_logged_in()
+        if self.api_version == 2:
+            # v2 can only delete manifests, which removes all of their tags.
+            # Pushing replaces the tag anyway.
+            return
         url = self.tag_url(repotag)
-        self._http.delete(url)
+        self._request('DELETE', url)
 
     def post(self, image, repotag):
         self._check_logged_in()
@@ -151,50 +236,137 @@ class Registry(RegistryURL):
         self._docker_driver.tag(image, url)
         self._docker_driver.push(url)
 
-    def info(self, repotag):
+    def digest(self, repotag):
+        """Returns the manifest digest of :repotag: or None if the image does
+        not exist. Requires a v2 registry.
+        """
+        response = self._request('HEAD', self.manifest_url(repotag),
+                                 headers={'Accept': _MANIFEST_TYPES},
+                                 allow_redirects=False)
+        if response.ok:
+            return response.headers.get('Docker-Content-Digest', '')
+
+    def info(self, repotag, cached=True):
+        """Returns None if :repotag: does not exist. Otherwise the manifest
+        digest (v2) or the image id (v1). Lookups are cached in :cache:
+        unless :cached: is unset.
+        """
+        if self.cache is None or not cached:
+            return self._info(repotag)
+
+        hit, info = self.cache.get(to_text(self.url), repotag)
+        if not hit:
+            info = self._info(repotag)
+            self.cache.put(to_text(self.url), repotag, info)
+        return info
+
+    def invalidate(self, repotag):
+        """Drops the cached info of :repotag:, e.g. after pushing it.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(to_text(self.url), repotag)
+
+    def _info(self, repotag):
+        if self.api_version == 2:
+            return self.digest(repotag)
+
         url = self.tag_url(repotag)
-        response = self._http.get(url)
+        response = self._request('GET', url)
         if response.ok:
             return response.json()
 
-    def repositories(self):
-        """Fetch a list of repositories.
+    def infos(self, repotags):
+        """Like :info: for many repotags at once. The requests are sent
+        concurrently. Returns a dict of repotag -> info.
         """
-        url = '%s/v1/search' % (self.url, )
-        response = self._http.get(url)
+        repotags = list(repotags)
+        infos = map_concurrent(self.info, repotags, _CONCURRENT_REQUESTS)
+        return dict(zip(repotags, infos))
+
+    def _get(self, url):
+        response = self._request('GET', url)
         if not response.ok:
             raise Exception(response)
-        data = response.json()
+        return response
 
-        repositories = []
+    def _get_pages(self, url):
+        """Fetches the pages of a paginated registry v2 list, following the
+        ``Link: <url>; rel="next"`` headers. Yields the json data of every
+        page.
+        """
+        while url:
+            response = self._get(url)
+            yield response.json()
+
+            url = response.links.get('next', {}).get('url')
+            if url:
+                url = urljoin(response.url, url)
+
+    def _v2_repositories(self):
+        url = self.api_url('/v2/_catalog?n=%d' % _PAGE_SIZE)
+        for data in self._get_pages(url):
+            for repo in data.get('repositories') or []:
+                yield repo
+
+    def _v1_repositories(self):
+        url = self.api_url('/v1/search')
+        data = self._get(url).json()
         for item in data['results']:
-            repositories.append(item['name'])
-        return repositories
+            yield item['name']
 
-    def images(self):
-        """Fetch a list of images.
+    def _iter_repositories(self):
+        if self.api_version == 2:
+            return self._v2_repositories()
+        return self._v1_repositories()
+
+    def repositories(self):
+        """Fetch a list of repositories.
         """
-        repositories = self.repositories()
+        return list(self._iter_repositories())
+
+    def _v2_tags(self, repo):
+        url = self.api_url('/v2/%s/tags/list?n=%d' % (repo, _PAGE_SIZE))
+        tags = []
+        for data in self._get_pages(url):
+            tags.extend(data.get('tags') or [])
+        return tags
+
+    def _v1_tags(self, repo):
+        url = self.api_url('/v1/repositories/%s/tags' % repo)
+        return list(self._get(url).json().keys())
+
+    def iter_images(self, jobs=_CONCURRENT_REQUESTS):
+        """Yields the images of the registry. The tags of up to :jobs:
+        repositories are fetched concurrently, images are yielded as soon as
+        the tags of their repository arrived.
+        """
+        get_tags = self._v2_tags if self.api_version == 2 else self._v1_tags
+
+        def _images(repo):
+            return [self.repotag_url('%s:%s' % (repo, tag))
+                    for tag in get_tags(repo)]
 
-        images = []
-        for repo in repositories:
-            url = '%s/v1/repositories/%s/tags' % (self.url, repo)
-            response = self._http.get(url)
-            if not response.ok:
-                raise Exception(response)
-            data = response.json()
+        repositories = self._iter_repositories()
+        for images in imap_unordered(_images, repositories, jobs):
+            for image in images:
+                yield image
 
-            for tag in data.keys():
-                image = '%s:%s' % (repo, tag)
-                images.append(self.repotag_url(image))
-        return images
+    def images(self):
+        """Fetch a list of images.
+        """
+        return list(self.iter_images())
 
 
 class RegistryCollection(object):
-    def __init__(self):
+    """Creates the registries of the configuration. They share the optional
+    :RegistryCache: :cache:.
+    """
+    def __init__(self, cache=None):
         self.registries = []
+        self.cache = cache
 
     def add(self, *args, **kwargs):
         registry = Registry(*args, **kwargs)
+        registry.cache = self.cache
         self.registries.append(registry)
         return registry
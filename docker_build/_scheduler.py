@@ -0,0 +1,84 @@
+import logging
+import sys
+
+from six.moves import queue
+
+from ._pool import WorkerPool
+
+
+_log = logging.getLogger(__name__)
+
+
+def image_closure(images):
+    """Returns :images: and all of their base images. Base images are listed
+    before the images that depend on them.
+    """
+    closure = []
+    seen = set()
+    for image in images:
+        chain = []
+        while image is not None and image not in seen:
+            seen.add(image)
+            chain.append(image)
+            image = image.base
+        closure.extend(reversed(chain))
+    return closure
+
+
+class Scheduler(object):
+    """Walks the dependency graph of images and processes independent
+    subtrees concurrently on a bounded pool of worker threads.
+    """
+    def __init__(self, jobs=1):
+        assert jobs >= 1, jobs
+        self._jobs = jobs
+
+    def run(self, images, func):
+        """Calls ``func(image)`` for every image of :images: and their base
+        images. Every image is processed exactly once and only after its base
+        image was processed successfully.
+
+        After the first failure no further images are started. Returns a list
+        of ``(image, exc_info)`` tuples of the failed images.
+        """
+        closure = image_closure(images)
+        members = set(closure)
+        waiting = {}
+        ready = []
+        for image in closure:
+            if image.base in members:
+                waiting.setdefault(image.base, []).append(image)
+            else:
+                ready.append(image)
+
+        finished = queue.Queue()
+        failed = []
+        running = 0
+
+        def _process(image):
+            try:
+                func(image)
+            except Exception:
+                finished.put((image, sys.exc_info()))
+            else:
+                finished.put((image, None))
+
+        with WorkerPool(self._jobs) as pool:
+            while True:
+                while ready and not failed:
+                    pool.submit(_process, ready.pop(0))
+                    running += 1
+
+                if not running:
+                    break
+
+                image, exc_info = finished.get()
+                running -= 1
+
+                if exc_info:
+                    _log.debug('failed: %s', image.full_repotag)
+                    failed.append((image, exc_info))
+                else:
+                    ready.extend(waiting.pop(image, []))
+
+        return failed
@@ -0,0 +1,162 @@
+"""Teardown of the containers started for builds, e.g. vagrant machines.
+
+Containers are removed by background threads, so a build continues right
+after committing its container. Started containers are recorded in a state
+file per process until they are removed, the containers leaked by killed
+runs are removed by the next run, see :Teardown.reap:.
+"""
+import errno
+import functools
+import json
+import logging
+import os
+import re
+import threading
+
+from ._cache import _read, _write
+from ._pool import WorkerPool
+
+
+_log = logging.getLogger(__name__)
+
+# concurrent container removals
+_JOBS = 2
+
+_teardown = None
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+    return True
+
+
+def _state_file(directory, pid):
+    return os.path.join(directory, 'containers-%d.json' % pid)
+
+
+class Teardown(object):
+    """Tracks the started containers and removes them in the background.
+
+    The started containers are recorded in a state file in :directory:,
+    one per process so concurrent runs do not overwrite their records.
+    Without :directory: leaked containers are not recorded.
+    """
+    def __init__(self, directory=None, jobs=_JOBS):
+        self._directory = directory
+        self._jobs = jobs
+        self._lock = threading.Lock()
+        self._pool = None
+        self._tasks = []
+
+    def _update(self, container_id, pid):
+        if not self._directory:
+            return
+        path = _state_file(self._directory, os.getpid())
+        containers = _read(path)
+        if pid is None:
+            containers.pop(container_id, None)
+        else:
+            containers[container_id] = pid
+        if containers:
+            _write(path, json.dumps(containers))
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def started(self, container_id):
+        """Records the started container :container_id:.
+        """
+        with self._lock:
+            self._update(container_id, os.getpid())
+
+    def forget(self, container_id):
+        """Stops tracking the container :container_id:, e.g. because it is
+        kept running on purpose.
+        """
+        with self._lock:
+            self._update(container_id, None)
+
+    def remove(self, container_id, func):
+        """Calls ``func()`` to remove the container :container_id: in the
+        background. The container is forgotten afterwards.
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = WorkerPool(self._jobs)
+            self._tasks.append(
+                self._pool.submit(self._remove, container_id, func))
+
+    def _remove(self, container_id, func):
+        _log.debug('Removing container %s', container_id)
+        try:
+            status = func()
+            if status:
+                _log.warn('Removing container %s failed (%s)',
+                          container_id, status)
+        finally:
+            with self._lock:
+                self._update(container_id, None)
+
+    def reap(self, remove):
+        """Removes the containers recorded by runs that are not running
+        anymore by ``remove(container_id)`` in the background. They are
+        recorded as started by this run until they are removed.
+        """
+        if not self._directory or not os.path.isdir(self._directory):
+            return
+        leaked = []
+        with self._lock:
+            for name in sorted(os.listdir(self._directory)):
+                match = re.match(r'containers-(\d+)\.json$', name)
+                if not match:
+                    continue
+                pid = int(match.group(1))
+                if pid != os.getpid() and _is_running(pid):
+                    continue
+                path = os.path.join(self._directory, name)
+                containers = _read(path)
+                for container_id in sorted(containers):
+                    self._update(container_id, os.getpid())
+                    leaked.append(container_id)
+                if pid != os.getpid():
+                    os.remove(path)
+
+        for container_id in leaked:
+            _log.info('Removing leaked container %s', container_id)
+            self.remove(container_id, functools.partial(remove, container_id))
+
+    def wait(self):
+        """Waits until all containers are removed. Returns False if a
+        removal failed.
+        """
+        with self._lock:
+            tasks, self._tasks = self._tasks, []
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.close()
+
+        success = True
+        for task in tasks:
+            try:
+                task.wait()
+            except Exception as error:
+                _log.error('Removing container failed: %s', error)
+                success = False
+        return success
+
+
+def get_teardown():
+    global _teardown
+    if _teardown is None:
+        _teardown = Teardown()
+    return _teardown
+
+
+def set_state_directory(directory):
+    """Records the started containers in state files in :directory:, or not
+    at all if :directory: is None.
+    """
+    global _teardown
+    _teardown = Teardown(directory)
@@ -0,0 +1,51 @@
+import logging
+
+from . import _profile
+from ._pool import WorkerPool
+
+
+_log = logging.getLogger(__name__)
+
+
+class Uploader(object):
+    """Uploads built images to their registries. Images are queued and pushed
+    by a pool of pusher threads, so builds are not stalled by slow pushes.
+    """
+    def __init__(self, jobs=1):
+        self._pool = WorkerPool(jobs)
+        self._tasks = []
+
+    def put(self, image):
+        """Queues :image: for upload.
+        """
+        _log.debug('queue upload: %s', image.full_repotag)
+        task = self._pool.submit(self._upload, image)
+        self._tasks.append((image, task))
+
+    def _upload(self, image):
+        with _profile.span(image.full_repotag, 'push'):
+            image.upload_to_registry()
+
+    def wait(self):
+        """Waits for all queued uploads. Returns a list of
+        ``(image, exc_info)`` tuples, ``exc_info`` is None for successfully
+        uploaded images.
+        """
+        self._pool.close()
+        self._pool.join()
+        return [(image, task.exc_info) for image, task in self._tasks]
+
+
+def report(results):
+    """Logs the results of :Uploader.wait: and returns True if all uploads
+    succeeded.
+    """
+    success = True
+    for image, exc_info in results:
+        if exc_info:
+            _log.error('Upload of image %s failed. %s',
+                       image.full_repotag, exc_info[1])
+            success = False
+        else:
+            _log.info('Uploaded image: %s', image.full_repotag)
+    return success
@@ -1,30 +1,53 @@
 import contextlib
+import logging
+import os
 import re
 
-from . import _exec
+from . import _drivers, _exec, _teardown
+from ._compat import to_text
 from ._exec import wrap_execution_error, ExecutionError
 
 
+_log = logging.getLogger(__name__)
+
+# lines of error output kept for streamed commands
+_ERROR_LINES = 100
+
+
 class VagrantError(Exception):
     pass
 
 
 def _exec_vagrant_cmd(command, *args, **kwargs):
-    return _exec.exec_cmd(
-        'VAGRANT_DEFAULT_PROVIDER=docker vagrant', command, *args, **kwargs)
+    return _exec.exec_cmd('vagrant', command, *args,
+                          env={'VAGRANT_DEFAULT_PROVIDER': 'docker'},
+                          **kwargs)
+
+
+def _up(chdir, *args):
+    # ids of the created containers
+    container_ids = []
+    def _match(line):
+        match = re.search(r'Container created: (\S+)\s*', to_text(line))
+        if match:
+            container_ids.append(match.group(1))
+            # removed by the next run if this one gets killed
+            _teardown.get_teardown().started(match.group(1))
+
+    _exec_vagrant_cmd('up', *args, chdir=chdir, callback=_match,
+                      max_lines=_ERROR_LINES)
+    return container_ids
 
 
 @wrap_execution_error(VagrantError)
 def up(chdir=None):
     """Calls `vagrant up` and returns the docker container id on success.
     """
-    output = _exec_vagrant_cmd('up', chdir=chdir)
-    match = re.search(r'Container created: (\S+)\s*', output)
-    if not match:
+    container_ids = _up(chdir)
+    if not container_ids:
         raise VagrantError('Container id not found.')
 
-    container_id = match.group(1)
-    return container_id
+    return container_ids[0]
 
 
 @wrap_execution_error(VagrantError)
@@ -35,9 +58,112 @@ def destroy(chdir=None):
         raise VagrantError(error)
 
 
+@wrap_execution_error(VagrantError)
+def provision(chdir=None):
+    """Calls `vagrant provision`, which runs the provisioners in the running
+    machine again.
+    """
+    _exec_vagrant_cmd('provision', chdir=chdir, callback=lambda line: None,
+                      max_lines=_ERROR_LINES)
+
+
+@wrap_execution_error(VagrantError)
+def status(chdir=None):
+    """Returns the state of the machine, e.g. ``running``, ``stopped`` or
+    ``not_created``.
+    """
+    output = _exec_vagrant_cmd('status', '--machine-readable', chdir=chdir)
+    # timestamp,target,type,data
+    for line in to_text(output).splitlines():
+        fields = line.split(',')
+        if len(fields) >= 4 and fields[2] == 'state':
+            return fields[3]
+    raise VagrantError('Machine state not found.')
+
+
+def _machine_path(chdir):
+    return os.path.join(chdir or os.getcwd(), '.vagrant', 'machines',
+                        'default', 'docker', 'id')
+
+
+def machine_id(chdir=None):
+    """Returns the container id of the machine created in :chdir: or None.
+    """
+    path = _machine_path(chdir)
+    try:
+        with open(path) as f_obj:
+            return f_obj.read().strip() or None
+    except IOError:
+        return None
+
+
+@wrap_execution_error(VagrantError)
+def resume(chdir=None):
+    """Runs the provisioners in the machine in :chdir: again if it is still
+    running, otherwise calls `vagrant up`. Returns the docker container id.
+    """
+    if status(chdir=chdir) == 'running':
+        provision(chdir=chdir)
+    else:
+        _up(chdir, '--provision')
+
+    container_id = machine_id(chdir=chdir)
+    if not container_id:
+        raise VagrantError('Container id not found.')
+    # kept running on purpose
+    _teardown.get_teardown().forget(container_id)
+    return container_id
+
+
 @contextlib.contextmanager
-def vagrant(chdir=None):
-    container_id = up(chdir=chdir)
-    yield container_id
-    destroy(chdir=chdir)
+def vagrant(chdir=None, keep=False, release=None):
+    """Yields the container id of the provisioned machine in :chdir:.
+
+    Otherwise the machine is destroyed in the background afterwards, even
+    if building fails, see :destroy_async:. With :keep: the machine is kept
+    running and provisioned again by the next call, see :resume:.
+
+    ``release()`` is called once the machine is destroyed, e.g. to unlock
+    :chdir:, which must not change until then.
+    """
+    if keep:
+        try:
+            yield resume(chdir=chdir)
+        finally:
+            if release:
+                release()
+        return
+
+    container_id = None
+    try:
+        container_id = up(chdir=chdir)
+        yield container_id
+    finally:
+        # the machine may be created even if provisioning failed
+        container_id = container_id or machine_id(chdir=chdir)
+        if container_id:
+            destroy_async(container_id, chdir=chdir, release=release)
+        elif release:
+            release()
+
+
+def destroy_async(container_id, chdir=None, release=None):
+    """Destroys the machine of the container :container_id: in :chdir: by
+    `vagrant destroy` in the background, see :_teardown:. The container is
+    removed if destroying fails. ``release()`` is called afterwards.
+    """
+    chdir = chdir or os.getcwd()
+
+    def _destroy():
+        try:
+            try:
+                destroy(chdir=chdir)
+            except VagrantError as error:
+                _log.warn('Destroying machine %s failed: %s',
+                          container_id, error)
+                return _drivers.get_driver().rm(container_id, force=True)
+        finally:
+            if release:
+                release()
 
+    _teardown.get_teardown().remove(container_id, _destroy)
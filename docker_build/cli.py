@@ -5,16 +5,21 @@ import functools
 import os
 import re
 import sys
-import tempfile
 import logging
 
-from .image.api import ImageCollection
+from . import _context, _digest, _drivers, _profile, _teardown
+from ._exec import ExecutionError
+from ._git import changed_files
+from .image.api import BaseImageLayer, ImageCollection
+from ._cache import FileDigestCache, RegistryCache
 from ._registry import RegistryCollection
 from ._image_builder import ImageBuilder
 from ._load_config import (
     Builtins,
     load_config_file,
+    load_config_source,
     load_registry_config_file,
+    set_code_cache,
     FormattedException)
 
 
@@ -22,12 +27,14 @@ _MAIN_FILENAME     = 'docker-build.images'
 _REGISTRY_FILENAME = ['docker-build.registry',
                       '~/.docker-build/registry',
                       '/etc/docker-build/registry']
+_CACHE_DIRECTORY   = '~/.docker-build/cache'
+_REGISTRY_CACHE_TTL = 300
 
 _log = logging.getLogger(__name__)
 
 
 def _get_cli_arguments(args=None):
-    parser = OptionParser()
+    parser = OptionParser(usage='%prog [options] [image ...]')
     parser.add_option('-v', '--verbose',
         dest    = 'verbose',
         action  = 'count',
@@ -68,11 +75,117 @@ def _get_cli_arguments(args=None):
         dest    = 'force',
         action  = 'store_true',
         default = False)
+    parser.add_option('-j', '--jobs',
+        help    = 'Number of images that are built concurrently. Default ' \
+            'is %default.',
+        metavar = 'N',
+        dest    = 'jobs',
+        type    = 'int',
+        default = 1)
+    parser.add_option('--pull-jobs',
+        help    = 'Number of missing base images that are pulled ' \
+            'concurrently ahead of the builds that need them. 0 pulls ' \
+            'them when they are built. Default is %default.',
+        metavar = 'N',
+        dest    = 'pull_jobs',
+        type    = 'int',
+        default = 4)
+    parser.add_option('--push-jobs',
+        help    = 'Number of images that are uploaded to registries ' \
+            'concurrently while building. Default is %default.',
+        metavar = 'N',
+        dest    = 'push_jobs',
+        type    = 'int',
+        default = 1)
+    parser.add_option('--cache-dir',
+        help    = 'Directory of the build cache. Default is %default.',
+        metavar = 'PATH',
+        dest    = 'cache_dir',
+        default = _CACHE_DIRECTORY)
+    parser.add_option('--no-cache',
+        help    = 'Do not use the build cache. Images are rebuilt if they ' \
+            'do not exist.',
+        dest    = 'use_cache',
+        action  = 'store_false',
+        default = True)
+    parser.add_option('--async-cleanup',
+        help    = 'Remove temporary images by a background process, ' \
+            'docker-build exits without waiting for it.',
+        dest    = 'async_cleanup',
+        action  = 'store_true',
+        default = False)
+    parser.add_option('--resume',
+        help    = 'Keep the temporary images if the build fails, and ' \
+            'continue with the images built by the last failed run ' \
+            'started with --resume.',
+        dest    = 'resume',
+        action  = 'store_true',
+        default = False)
+    parser.add_option('--full-context',
+        help    = 'Send the whole directory of a Dockerfile as build ' \
+            'context, not only the files referenced by ADD and COPY ' \
+            'instructions. Required for base images with ONBUILD ADD ' \
+            'or ONBUILD COPY instructions.',
+        dest    = 'full_context',
+        action  = 'store_true',
+        default = False)
+    parser.add_option('--vagrant-isolated',
+        help    = 'Build Vagrant images in private copies of their ' \
+            'directory, so images sharing a directory are built ' \
+            'concurrently (see -j). Vagrantfiles must not refer to files ' \
+            'outside of their directory.',
+        dest    = 'vagrant_isolated',
+        action  = 'store_true',
+        default = False)
+    parser.add_option('--vagrant-keep',
+        help    = 'Keep Vagrant machines running after the build and run ' \
+            '"vagrant provision" in them for the next build instead of ' \
+            'creating them again. Their working copies are kept in the ' \
+            'cache directory. Implies --vagrant-isolated.',
+        dest    = 'vagrant_keep',
+        action  = 'store_true',
+        default = False)
+    parser.add_option('--changed-since',
+        help    = 'Build the images whose Dockerfile directory, Vagrantfile ' \
+            'directory or rootfs archive changed since the git commit ' \
+            'REF, and the images depending on them.',
+        metavar = 'REF',
+        dest    = 'changed_since')
+    parser.add_option('--descendants',
+        help    = 'Build the images depending on the given images, too.',
+        dest    = 'descendants',
+        action  = 'store_true',
+        default = False)
+    parser.add_option('--registry-cache-ttl',
+        help    = 'Seconds the results of registry lookups are cached in ' \
+            'the cache directory, 0 disables the cache. Default is ' \
+            '%default.',
+        metavar = 'SECONDS',
+        dest    = 'registry_cache_ttl',
+        type    = 'int',
+        default = _REGISTRY_CACHE_TTL)
+    parser.add_option('--driver',
+        help    = 'Talk to docker with the command line tool (cli) or the ' \
+            'Docker Engine API on the unix socket of $DOCKER_HOST (api). ' \
+            'Default is %default.',
+        dest    = 'driver',
+        type    = 'choice',
+        choices = sorted(_drivers.DRIVERS),
+        default = 'cli')
+    parser.add_option('--profile',
+        help    = 'Record the time spent in each phase, print a summary ' \
+            'with the critical path of the build and write a chrome trace ' \
+            '(chrome://tracing) to PATH.',
+        metavar = 'PATH',
+        dest    = 'profile')
     parser.add_option('--list-registry-images',
         help    = 'List images of a registry',
         dest    = 'registry_list_images')
 
-    options, _args = parser.parse_args(args)
+    options, targets = parser.parse_args(args)
+    options.targets = targets
+    # the cache paths must not depend on the working directory
+    options.cache_dir = os.path.expanduser(options.cache_dir)
 
     _fix_default_cli_arguments(options)
 
@@ -80,6 +193,13 @@ def _get_cli_arguments(args=None):
         if not re.match(r'[a-zA-Z_][a-zA-Z0-9_]*=.*', desc):
             parser.error('-r %s must be in format <name>=<url>' % desc)
 
+    if options.jobs < 1:
+        parser.error('-j %d must be at least 1' % options.jobs)
+    if options.push_jobs < 1:
+        parser.error('--push-jobs %d must be at least 1' % options.push_jobs)
+    if options.pull_jobs < 0:
+        parser.error('--pull-jobs %d must not be negative' % options.pull_jobs)
+
     return options
 
 
@@ -110,9 +230,90 @@ class CLIError(Exception):
 def main(args=None):
     options = _get_cli_arguments(args)
     _configure_logging(options)
+    _drivers.set_driver(options.driver)
+
+    if not options.profile:
+        return _main(options)
+
+    profiler = _profile.enable()
+    try:
+        return _main(options)
+    finally:
+        _profile.write_trace(options.profile)
+        print(profiler.summary(), file=sys.stderr)
+        _log.info('Trace written to %s', options.profile)
+
+
+def _select_targets(options, image_collection, config_files):
+    """Returns the tagged images selected by the image arguments and
+    --changed-since or None to build all images. All images are selected if
+    one of the loaded :config_files: changed.
+    """
+    if not options.targets and not options.changed_since:
+        return None
+
+    images = []
+    for name in options.targets:
+        found = image_collection.find(name)
+        if not found:
+            raise CLIError('Image %s not found' % name)
+        images.extend(found)
+    targets = image_collection.select(images, options.descendants)
+
+    if options.changed_since:
+        directory = os.getcwd()
+        if options.dockerbuild != '-':
+            directory = os.path.dirname(os.path.abspath(options.dockerbuild))
+        try:
+            files = changed_files(options.changed_since, directory)
+        except ExecutionError as error:
+            raise CLIError(str(error))
+
+        for config in config_files:
+            if config in files:
+                _log.info('Configuration changed: %s', config)
+                return image_collection.tagged_images()
+
+        # images depending on changed images are rebuilt, too
+        changed = image_collection.select(
+            image_collection.changed_images(files), descendants=True)
+        targets = image_collection.select(targets + changed)
+
+    _log.info('Selected images: %s',
+              ', '.join(image.full_repotag for image in targets))
+    return targets
+
+
+def _main(options):
+    registry_cache = None
+    if options.use_cache and options.registry_cache_ttl > 0:
+        registry_cache = RegistryCache(options.cache_dir,
+                                       options.registry_cache_ttl)
+
+    # removes the containers leaked by killed runs
+    _teardown.set_state_directory(os.path.join(options.cache_dir,
+                                               'containers'))
+    _teardown.get_teardown().reap(_drivers.get_driver().rm)
+
+    file_cache = None
+    if options.use_cache:
+        file_cache = FileDigestCache(options.cache_dir)
+    _digest.set_file_cache(file_cache)
+
+    set_code_cache(os.path.join(options.cache_dir, 'config')
+                   if options.use_cache else None)
+    _context.set_pruning(not options.full_context)
+    if options.vagrant_isolated or options.vagrant_keep:
+        # the vagrant layer is imported on first use only
+        from .image import _vagrant
+        _vagrant.set_mode(options.vagrant_isolated,
+                          os.path.join(options.cache_dir, 'vagrant')
+                          if options.vagrant_keep else None)
 
     image_collection = ImageCollection()
-    registry_collection = RegistryCollection()
+    registry_collection = RegistryCollection(registry_cache)
+    # absolute paths of the loaded config files, see :_select_targets:
+    config_files = []
 
     try:
         cwd = os.getcwd()
@@ -121,8 +322,10 @@ def main(args=None):
 
             bound_load_registry_config_file = \
                 functools.partial(load_registry_config_file, builtins)
-            bound_load_config_file = \
-                functools.partial(load_config_file, builtins)
+            def bound_load_config_file(path, cwd=None):
+                config_files.append(os.path.join(cwd, path) if cwd
+                                    else os.path.abspath(path))
+                return load_config_file(builtins, path, cwd=cwd)
 
             builtins.register('Registry', registry_collection.add)
             builtins.register('Image', image_collection.add)
@@ -132,7 +335,8 @@ def main(args=None):
             # optional: load registries
             for filename in options.registry_config:
                 _log.debug('loading registry file: %s', filename)
-                bound_load_registry_config_file(filename)
+                with _profile.span(filename, 'config'):
+                    bound_load_registry_config_file(filename)
 
             # optional: load registries directly from command line
             for desc in options.registry:
@@ -147,19 +351,17 @@ def main(args=None):
                 except KeyError:
                     raise CLIError("Registry %s not found" \
                         % options.registry_list_images)
-                for repotag in registry.images():
+                for repotag in registry.iter_images():
                     print(repotag)
+                    sys.stdout.flush()
                 return
 
             # load image description
-            if options.dockerbuild == '-':
-                dockerbuild = sys.stdin.read()
-                with tempfile.NamedTemporaryFile(delete=True) as temp:
-                    temp.write(dockerbuild.encode('utf-8'))
-                    temp.flush()
-                    bound_load_config_file(temp.name, cwd=cwd)
-            else:
-                bound_load_config_file(options.dockerbuild)
+            with _profile.span(options.dockerbuild, 'config'):
+                if options.dockerbuild == '-':
+                    load_config_source(builtins, sys.stdin.read(), cwd=cwd)
+                else:
+                    bound_load_config_file(options.dockerbuild)
 
     except FormattedException as error:
         _log.error(error.args[0])
@@ -180,20 +382,41 @@ def main(args=None):
     if options.check_only:
         return
 
-    if options.list_images:
-        for image in image_collection.tagged_images():
-            is_uploaded = image.is_uploaded()
-            present = '+' if is_uploaded else '-'
-            print(present, image.full_repotag)
-        sys.exit(0)
-
-
-    builder = ImageBuilder(options, image_collection)
-    retval = builder.build()
-
-    if not retval:
+    try:
+        targets = _select_targets(options, image_collection, config_files)
+    except CLIError as error:
+        _log.error(error.args[0])
         sys.exit(1)
 
+    try:
+        if options.list_images:
+            tagged = image_collection.tagged_images()
+            if targets is not None:
+                tagged = targets
+            with _profile.span('check uploaded', 'check', images=len(tagged)):
+                uploaded = BaseImageLayer.check_uploaded(tagged)
+            for image in tagged:
+                present = '+' if uploaded[image] else '-'
+                print(present, image.full_repotag)
+            sys.exit(0)
+
+
+        if targets == []:
+            _log.warn('No images selected. Nothing to build.')
+            return
+
+        builder = ImageBuilder(options, image_collection, targets)
+        retval = builder.build()
+
+        if not retval:
+            sys.exit(1)
+    finally:
+        _teardown.get_teardown().wait()
+        if registry_cache:
+            registry_cache.save()
+        if file_cache:
+            file_cache.save()
+
 
 if __name__ == '__main__':
     main()
@@ -5,9 +5,10 @@ import os
 import random
 import re
 import string
+import threading
 
-from .. import _docker_driver
-from .._exec import chdir
+from .. import _cleanup, _digest, _drivers, _profile
+from .._compat import to_utf8
 from .._temp import TempDirectory, TempFileLink
 
 
@@ -80,9 +81,11 @@ class BaseImageLayer(object):
         if self._base:
             self._base.add_child(self)
 
-        self._driver = _docker_driver
+        self._driver = _drivers.get_driver()
         self._already_built = False
         self._image_id = None
+        self._from_cache = False
+        self._digest = None
 
         if registry and not self._is_temporary:
             self.full_repotag = registry.repotag_url(repotag)
@@ -90,6 +93,16 @@ class BaseImageLayer(object):
             self.full_repotag = repotag
 
 
+    @property
+    def base(self):
+        return self._base
+
+
+    @property
+    def image_id(self):
+        return self._image_id
+
+
     def is_root(self):
         return self._base is None
 
@@ -109,34 +122,157 @@ class BaseImageLayer(object):
             if self._base:
                 # recursively build dependency images
                 self._base.build()
-            with chdir(self._cwd):
+            base = self._base.full_repotag if self._base else None
+            with _profile.span(self.full_repotag, 'build',
+                               layer=self.__class__.__name__, base=base):
                 self._build()
             self._already_built = True
 
 
     def _build(self):
-        """Underlying docker image build implementation.
+        """Underlying docker image build implementation. Relative paths
+        have to be resolved against ``self._cwd``, the working directory of
+        the process is shared by concurrent builds.
         """
         raise NotImplementedError(self.repotag, self.__class__._build)
 
 
+    def digest(self):
+        """Digest of the build inputs of this image and of its base images.
+        Returns None if the inputs are not known before building.
+        """
+        if self._digest is None:
+            base_digest = ''
+            if self._base:
+                base_digest = self._base.digest()
+                if base_digest is None:
+                    return
+
+            hasher = _digest.new()
+            hasher.update(to_utf8(self.__class__.__name__ + base_digest))
+            if self._update_digest(hasher):
+                self._digest = hasher.hexdigest()
+
+        return self._digest
+
+
+    def _update_digest(self, hasher):
+        """Adds the build inputs of this layer to :hasher:. Returns False if
+        the inputs are not known.
+        """
+        return False
+
+
+    def pull_repotag(self):
+        """Returns the repotag of the existing image this layer pulls, or
+        None. These images are pulled in advance, see :_prefetch:.
+        """
+        return None
+
+
+    def fuse_base(self):
+        """Builds the temporary base image as part of the build of this
+        image, if the layer types support it. Only called if this image is
+        the only child of the base image. Returns True if the base image was
+        fused.
+        """
+        return False
+
+
+    def input_paths(self):
+        """Returns the files and directories the image is built from,
+        besides the configuration and the base image. Returns None if they
+        are not known.
+        """
+        return None
+
+
+    def use_image(self, image_id):
+        """Uses the existing docker image :image_id: instead of building
+        the image, e.g. when the build inputs are unchanged. Returns False if
+        the image does not exist (anymore).
+        """
+        if self._driver.inspect_id(image_id) is None:
+            return False
+        if not self._is_temporary:
+            self._driver.tag(image_id, self.repotag)
+        self._image_id = image_id
+        self._from_cache = True
+        self._already_built = True
+        return True
+
+
+    def _cleanup_repotag(self):
+        if self._is_temporary and self._already_built and not self._from_cache:
+            return self.repotag
+
+
     def cleanup(self):
         """Remove temporary image.
         """
-        if self._is_temporary and self._already_built:
-            self._driver.rmi(self.repotag, force=True)
+        repotag = self._cleanup_repotag()
+        if repotag:
+            self._driver.rmi(repotag, force=True)
+
+
+    @staticmethod
+    def cleanup_images(images, detach=False):
+        """Bulk version of :cleanup:. The temporary images are removed with
+        a few concurrent commands per driver, by a background process if
+        :detach: is set.
+        """
+        repotags = {}
+        for image in images:
+            repotag = image._cleanup_repotag()
+            if repotag:
+                repotags.setdefault(image._driver, []).append(repotag)
+
+        for driver, group in repotags.items():
+            _cleanup.remove_images(driver, group, detach)
+
+
+    def is_uploadable(self):
+        return not self._is_temporary and self._registry is not None
 
 
     def upload_to_registry(self):
-        if self._is_temporary:
-            return
-        if not self._registry:
+        if not self.is_uploadable():
             return
 
         assert self._already_built
         with self._registry:
+            if self._is_pushed():
+                _log.info('Already in registry: %s', self.full_repotag)
+                return
             self._registry.delete_tag(self.repotag)
-            self._registry.post(self._image_id, self.repotag)
+            try:
+                self._registry.post(self._image_id, self.repotag)
+            finally:
+                self._registry.invalidate(self.repotag)
+
+
+    def _is_pushed(self):
+        """Returns True if the registry holds the built image already.
+        """
+        # a cached info may be outdated by other hosts pushing the tag
+        remote = self._registry.info(self.repotag, cached=False)
+        if not remote:
+            return False
+
+        data = self._driver.inspect(self._image_id)
+        if not data:
+            return False
+
+        # digests of the image in our registry, e.g.
+        # localhost:5000/test/sample@sha256:...
+        repo = self._registry.repotag_url(self.repotag.split(':', 1)[0])
+        local = [data['Id'], data['Id'].split(':')[-1]]
+        for repo_digest in data.get('RepoDigests') or []:
+            name, _sep, digest = repo_digest.partition('@')
+            if name == repo:
+                local.append(digest)
+
+        return remote in local
 
 
     def is_uploaded(self):
@@ -149,6 +285,62 @@ class BaseImageLayer(object):
         return self._registry.info(self.repotag) is not None
 
 
+    @staticmethod
+    def check_uploaded(images):
+        """Bulk version of :is_uploaded:. Local images are inspected with a
+        single docker command, registry images are queried concurrently.
+        Returns a dict of image -> bool for all non-temporary :images:.
+        """
+        local = {}
+        remote = {}
+        for image in images:
+            if image._is_temporary:
+                continue
+            if image._registry:
+                remote.setdefault(image._registry, []).append(image)
+            else:
+                local.setdefault(image._driver, []).append(image)
+
+        uploaded = {}
+        for driver, group in local.items():
+            ids = driver.inspect_ids([image.repotag for image in group])
+            for image in group:
+                uploaded[image] = ids[image.repotag] is not None
+
+        for registry, group in remote.items():
+            infos = registry.infos([image.repotag for image in group])
+            for image in group:
+                uploaded[image] = infos[image.repotag] is not None
+
+        return uploaded
+
+
+    @staticmethod
+    def inspect_pulled(images):
+        """Inspects the existing images pulled by :images: and their base
+        images with a single docker command per driver, see :pull_repotag:.
+        Their ids are part of the digests, so :digest: does not inspect them
+        one by one afterwards.
+        """
+        pulled = {}
+        seen = set()
+        for image in images:
+            while image is not None and image not in seen:
+                seen.add(image)
+                repotag = image.pull_repotag()
+                if repotag and image._image_id is None \
+                        and image._digest is None:
+                    pulled.setdefault(image._driver, []).append(image)
+                image = image._base
+
+        for driver, group in pulled.items():
+            ids = driver.inspect_ids(
+                sorted(set(image.pull_repotag() for image in group)))
+            for image in group:
+                # the id of a pulled image is the id of its repotag
+                image._image_id = ids[image.pull_repotag()]
+
+
     def is_temporary(self):
         return self._is_temporary
 
@@ -170,7 +362,13 @@ class BaseImageLayer(object):
 class FixBuildfileImageLayer(BaseImageLayer):
     """Some tools builds images based on build files with fix names, e.g.
     docker uses Dockerfile, vagrant uses Vagranfile.
+
+    Builds within the same directory are serialized as they share the build
+    file name and the tool's state in that directory.
     """
+    _directory_locks = {}
+    _directory_locks_guard = threading.Lock()
+
     def __init__(self, dir_or_file, basename, **kwargs):
         super(FixBuildfileImageLayer, self).__init__(**kwargs)
         self._basename = basename
@@ -184,9 +382,18 @@ class FixBuildfileImageLayer(BaseImageLayer):
         if not os.path.exists(self._filename):
             raise IOError(errno.ENOENT, 'No such file', self._filename)
 
+    @classmethod
+    def _directory_lock(cls, directory):
+        with cls._directory_locks_guard:
+            return cls._directory_locks.setdefault(directory, threading.Lock())
+
     def _build(self):
         directory = os.path.dirname(self._filename)
 
+        with self._directory_lock(directory):
+            self._build_locked(directory)
+
+    def _build_locked(self, directory):
         if os.path.basename(self._filename) == self._basename:
             self._build_directory(directory)
         else:
@@ -198,3 +405,10 @@ class FixBuildfileImageLayer(BaseImageLayer):
     def _build_directory(self, directory):
         raise NotImplementedError()
 
+    def _update_digest(self, hasher):
+        _digest.update_file(hasher, self._filename)
+        return True
+
+    def input_paths(self):
+        return [os.path.dirname(self._filename)]
+
@@ -1,7 +1,9 @@
 import functools
 import logging
+import os
 import tempfile
 
+from .. import _context, _digest, _prefetch
 from .._compat import to_utf8
 from ._base import BaseImageLayer, FixBuildfileImageLayer
 
@@ -21,11 +23,37 @@ class DockerfileImageLayer(FixBuildfileImageLayer):
         super(DockerfileImageLayer, self).__init__(
             dockerfile, 'Dockerfile', **kwargs)
 
-    def _build_directory(self, directory):
-        self._image_id = self._driver.build(self.repotag, chdir=directory)
+    def _build(self):
+        directory = os.path.dirname(self._filename)
+        kwargs = {}
+        if os.path.basename(self._filename) != self._basename:
+            # no temporary link to the Dockerfile: concurrent builds can
+            # share the directory
+            kwargs['dockerfile'] = self._filename
+        self._image_id = self._driver.build(
+            self.repotag, chdir=directory, **kwargs)
+
+    def _update_digest(self, hasher):
+        if not os.path.isfile(self._filename):
+            return False
+
+        # the build context contains the Dockerfile
+        directory = os.path.dirname(self._filename)
+        hasher.update(to_utf8(os.path.basename(self._filename) + '\0'))
+        _digest.update_paths(hasher, directory,
+                             _context.context_paths(directory, self._filename))
+        return True
 
 
 class DockerfileDirectImageLayer(BaseImageLayer):
+    """Builds an image from the instructions given as keyword arguments.
+
+    Chains of temporary direct layers are built with a single Dockerfile,
+    see :fuse_base:.
+    """
+    # built by the build of the child image
+    _fused = False
+
     def __init__(self, **kwargs):
         image_kwargs = {}
         for key, _fn in self.FIELDS:
@@ -34,15 +62,14 @@ class DockerfileDirectImageLayer(BaseImageLayer):
                 value = kwargs.pop(key)
                 image_kwargs[key] = value
 
-        self._rest_kwargs = kwargs
         self._kwargs = image_kwargs
         super(DockerfileDirectImageLayer, self).__init__(**kwargs)
         assert self._base
 
-    def _content(self):
+    def _content(self, fields=None):
         content = []
 
-        for field_name, field_fn in self.FIELDS:
+        for field_name, field_fn in fields or self.FIELDS:
             value = field_fn(self)
             if not isinstance(value, list):
                 value = [value]
@@ -52,19 +79,60 @@ class DockerfileDirectImageLayer(BaseImageLayer):
 
         return to_utf8('\n'.join(content))
 
+    def _update_digest(self, hasher):
+        # FROM refers to the base image, which is part of the digest already
+        hasher.update(self._content(self.FIELDS[1:]))
+        return True
+
+    def input_paths(self):
+        # the instructions are part of the configuration
+        return []
+
+    def fuse_base(self):
+        base = self._base
+        if not isinstance(base, DockerfileDirectImageLayer) or \
+                not base.is_temporary() or base._driver is not self._driver:
+            return False
+        base._fused = True
+        return True
+
+    def _fused_content(self):
+        """Returns the Dockerfile of this image, including the instructions
+        of the fused base images which were not built on their own.
+        """
+        layers = [self]
+        base = self._base
+        while isinstance(base, DockerfileDirectImageLayer) and \
+                base._fused and base._image_id is None:
+            layers.append(base)
+            base = base._base
+
+        content = [to_utf8('FROM %s' % base._image_id)]
+        for layer in reversed(layers):
+            content.append(layer._content(layer.FIELDS[1:]))
+        return b'\n'.join(part for part in content if part)
+
+    def _cleanup_repotag(self):
+        if self._image_id is None:
+            # fused, never tagged
+            return
+        return super(DockerfileDirectImageLayer, self)._cleanup_repotag()
+
     def _build(self):
-        with tempfile.NamedTemporaryFile(delete=True, dir=self._cwd) as temp:
-            content = self._content()
+        if self._fused:
+            _log.debug('Building %s with its child image', self.repotag)
+            return
+
+        # outside of the context directory, concurrent builds walk it
+        with tempfile.NamedTemporaryFile(delete=True) as temp:
+            content = self._fused_content()
             _log.debug(content)
             temp.file.write(content)
             temp.file.flush()
 
-            kwargs = self._rest_kwargs.copy()
-            kwargs.pop('base')
-            kwargs.pop('temp_repotag_template', None)
-            image = DockerfileImageLayer(temp.name, **kwargs)
-            image.build()
-            self._image_id = image._image_id
+            # tagged like this image, which removes temporary images
+            self._image_id = self._driver.build(
+                self.repotag, chdir=self._cwd, dockerfile=temp.name)
 
     def _FROM(self):
         return self._base._image_id
@@ -100,7 +168,27 @@ class NativeDockerImageLayer(BaseImageLayer):
         if self._base and not self._registry:
             self._driver.tag(self._image_id, self.repotag)
 
+    def _update_digest(self, hasher):
+        if self._base:
+            # a tag of the base image
+            return True
+
+        image_id = self._image_id or self._driver.inspect_id(self.full_repotag)
+        if image_id is None:
+            return False
+        hasher.update(to_utf8(self.full_repotag + image_id))
+        return True
+
+    def input_paths(self):
+        return []
+
+    def pull_repotag(self):
+        if self._base:
+            return None
+        return self.full_repotag
+
     def _pull(self):
+        _prefetch.wait(self._driver, self.full_repotag)
         image_id = self._driver.inspect_id(self.full_repotag)
         if image_id is None:
             self._driver.pull(self.full_repotag)
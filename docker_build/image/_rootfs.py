@@ -1,3 +1,8 @@
+import os
+
+from .. import _archive, _digest
+from .._compat import to_utf8
+from .._exec import chdir
 from ._base import BaseImageLayer
 
 
@@ -9,6 +14,11 @@ class RootFSLayer(BaseImageLayer):
         * tar.gz
         * tar.bz2
         * tar.xz
+
+    Compressed archives are decompressed by a multi-threaded decompressor
+    if one is installed, see :_archive:. Unless the archive changes, its
+    digest is computed once and the imported image is reused from the build
+    cache.
     """
     def __init__(self, rootfs, pre=None, post=None, **kwargs):
         super(RootFSLayer, self).__init__(**kwargs)
@@ -18,11 +28,28 @@ class RootFSLayer(BaseImageLayer):
 
     def _build(self):
         if self._pre:
-            exitcode = self._pre()
+            with chdir(self._cwd):
+                exitcode = self._pre()
             if exitcode:
                 raise Exception('Pre action failed (exitcode: %s)' % exitcode)
         try:
-            self._image_id = self._driver.import_(self._rootfs)
+            rootfs = os.path.join(self._cwd, self._rootfs)
+            with _archive.open_tar(rootfs) as f_obj:
+                self._image_id = self._driver.import_(f_obj)
         finally:
             if self._post:
-                self._post()
+                with chdir(self._cwd):
+                    self._post()
+
+    def _update_digest(self, hasher):
+        rootfs = os.path.join(self._cwd, self._rootfs)
+        if self._pre or not os.path.exists(rootfs):
+            # the pre action may create or change the archive
+            return False
+        hasher.update(to_utf8(_digest.file_digest(rootfs)))
+        return True
+
+    def input_paths(self):
+        if self._pre:
+            return None
+        return [os.path.join(self._cwd, self._rootfs)]
@@ -1,5 +1,33 @@
+import hashlib
+import os
+import shutil
+
 from ._base import FixBuildfileImageLayer
 from .. import _vagrant_driver
+from .._compat import to_utf8
+from .._temp import TempDirectory, TempFileLink
+
+
+_isolated = False
+
+# working copies of the kept machines, see :set_mode:
+_keep_directory = None
+
+
+def set_mode(isolated=False, keep_directory=None):
+    """With :isolated: vagrant layers are built in private copies of their
+    directory, so layers sharing a directory are built concurrently.
+
+    With :keep_directory: the machines are kept running and provisioned
+    again by the next build instead of creating them again. Their working
+    copies are kept in :keep_directory:, which implies :isolated:.
+    """
+    global _isolated, _keep_directory
+    _isolated = isolated
+    _keep_directory = None
+    if keep_directory:
+        # reused by runs from other working directories
+        _keep_directory = os.path.abspath(os.path.expanduser(keep_directory))
 
 
 class VagrantLayer(FixBuildfileImageLayer):
@@ -17,6 +45,89 @@ class VagrantLayer(FixBuildfileImageLayer):
         super(VagrantLayer, self).__init__(dir_or_file, 'Vagrantfile', **kwargs)
         self._vagrant_driver = _vagrant_driver
 
-    def _build_directory(self, directory):
-        with self._vagrant_driver.vagrant(directory) as container_id:
+    def _build(self):
+        if _keep_directory:
+            # one kept machine per Vagrantfile
+            name = hashlib.sha1(to_utf8(self._filename)).hexdigest()[:16]
+            directory = os.path.join(_keep_directory, name)
+            with self._directory_lock(directory):
+                self._copy_directory(directory)
+                self._build_directory(directory)
+        elif _isolated:
+            temp = TempDirectory()
+            directory = temp.create()
+            try:
+                self._copy_directory(directory)
+            except Exception:
+                temp.delete()
+                raise
+            # removed once the machine is destroyed
+            self._build_directory(directory, release=temp.delete)
+        else:
+            self._build_shared()
+
+    def _build_shared(self):
+        """Builds in the directory of the Vagrantfile, which stays locked
+        until the machine is destroyed in the background.
+        """
+        directory = os.path.dirname(self._filename)
+        lock = self._directory_lock(directory)
+        link = None
+        if os.path.basename(self._filename) != self._basename:
+            link = TempFileLink(self._filename,
+                                os.path.join(directory, self._basename))
+
+        def _release():
+            try:
+                if link:
+                    link.__exit__(None, None, None)
+            finally:
+                lock.release()
+
+        lock.acquire()
+        try:
+            if link:
+                link.__enter__()
+        except Exception:
+            lock.release()
+            raise
+        self._build_directory(directory, release=_release)
+
+    def _copy_directory(self, directory):
+        """Replaces the content of the working copy :directory: by the
+        directory of the Vagrantfile. The vagrant state is kept.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in os.listdir(directory):
+            if name == '.vagrant':
+                continue
+            path = os.path.join(directory, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+        source = os.path.dirname(self._filename)
+        for name in os.listdir(source):
+            if name == '.vagrant':
+                continue
+            path = os.path.join(source, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.copytree(path, os.path.join(directory, name),
+                                symlinks=True)
+            elif os.path.islink(path):
+                os.symlink(os.readlink(path), os.path.join(directory, name))
+            else:
+                shutil.copy2(path, os.path.join(directory, name))
+
+        target = os.path.join(directory, self._basename)
+        if os.path.lexists(target):
+            os.remove(target)
+        shutil.copy2(self._filename, target)
+
+    def _build_directory(self, directory, release=None):
+        keep = _keep_directory is not None
+        with self._vagrant_driver.vagrant(directory, keep=keep,
+                                          release=release) as container_id:
             self._commit(container_id)
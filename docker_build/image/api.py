@@ -1,32 +1,70 @@
-from ._vagrant import VagrantLayer
-from ._rootfs import RootFSLayer
-from ._docker import (
-    BaseImageLayer,
-    DockerfileDirectImageLayer,
-    DockerfileImageLayer,
-    NativeDockerImageLayer)
+import importlib
+import os
+import sys
+
+from ._base import BaseImageLayer
+
+
+# layer class -> module, the modules are imported on first use
+_LAYERS = {
+    'DockerfileDirectImageLayer': '._docker',
+    'DockerfileImageLayer':       '._docker',
+    'NativeDockerImageLayer':     '._docker',
+    'RootFSLayer':                '._rootfs',
+    'VagrantLayer':               '._vagrant',
+}
+
+
+def _layer_class(name):
+    """Returns the layer class :name:, its module is imported on first use.
+    """
+    module = importlib.import_module(_LAYERS[name], __package__)
+    return getattr(module, name)
+
+
+def __getattr__(name):
+    if name not in _LAYERS:
+        raise AttributeError(name)
+    return _layer_class(name)
+
+
+if sys.version_info < (3, 7):
+    # no lazy module attributes (PEP 562)
+    globals().update((name, _layer_class(name)) for name in _LAYERS)
 
 
 def _create_image(repotag=None, **kwargs):
     kwargs['repotag'] = repotag
 
     if kwargs.get('rootfs'):
-        return RootFSLayer(kwargs.pop('rootfs'), **kwargs)
+        return _layer_class('RootFSLayer')(kwargs.pop('rootfs'), **kwargs)
     elif kwargs.get('vagrant'):
-        return VagrantLayer(kwargs.pop('vagrant'), **kwargs)
+        return _layer_class('VagrantLayer')(kwargs.pop('vagrant'), **kwargs)
     elif kwargs.get('dockerfile'):
-        return DockerfileImageLayer(kwargs.pop('dockerfile'), **kwargs)
+        return _layer_class('DockerfileImageLayer')(
+            kwargs.pop('dockerfile'), **kwargs)
     elif set(kwargs.keys()) & (set(['cmd', 'expose', 'run'])):
-        return DockerfileDirectImageLayer(**kwargs)
+        return _layer_class('DockerfileDirectImageLayer')(**kwargs)
     elif set(kwargs.keys()).issubset(set(['repotag', 'registry', 'base'])):
-        return NativeDockerImageLayer(**kwargs)
+        return _layer_class('NativeDockerImageLayer')(**kwargs)
     else:
         raise Exception('Invalid image parameter: %s' % kwargs)
 
 
 class ImageCollection(object):
+    """The images of the configuration, indexed by repotag and full repotag.
+
+    The topological order of the images (base images first) is computed on
+    first use and kept until the next image is added.
+    """
     def __init__(self):
         self._images = []
+        # full_repotag / repotag -> images
+        self._by_repotag = {}
+        # base image -> child images
+        self._children = {}
+        self._order = None
+        self._tagged = None
 
     def __iter__(self):
         for image in self._images:
@@ -35,27 +73,153 @@ class ImageCollection(object):
     def __len__(self):
         return len(self._images)
 
+    def __contains__(self, image):
+        return image in self._children
+
     def add(self, *args, **kwargs):
         image = _create_image(*args, **kwargs)
-        self._images.append(image)
+        self._add(image)
         return image
 
+    def _add(self, image):
+        self._check_cycle(image)
+        if not image.is_temporary():
+            self._check_duplicate(image)
+
+        self._images.append(image)
+        self._children[image] = []
+        if image.base in self._children:
+            self._children[image.base].append(image)
+        if not image.is_temporary():
+            for key in set([image.full_repotag, image.repotag]):
+                self._by_repotag.setdefault(key, []).append(image)
+
+        self._order = None
+        self._tagged = None
+
+    @staticmethod
+    def _check_cycle(image):
+        seen = set([image])
+        base = image.base
+        while base is not None:
+            if base in seen:
+                raise ValueError('Image %s depends on itself' % image.repotag)
+            seen.add(base)
+            base = base.base
+
+    def _check_duplicate(self, image):
+        for other in self._by_repotag.get(image.full_repotag, ()):
+            if other.full_repotag != image.full_repotag:
+                continue
+            # existing images can be referenced more than once
+            if other.is_root() and image.is_root() and \
+                    not other._deletable and not image._deletable:
+                continue
+            raise ValueError('Image %s is defined twice' % image.full_repotag)
+
+    def get(self, repotag):
+        """Returns the image with the full repotag or repotag :repotag: or
+        None.
+        """
+        images = self._by_repotag.get(repotag)
+        if images:
+            return images[0]
+
+    def find(self, name):
+        """Returns the images with the full repotag or repotag :name: or, if
+        there are none, the tagged images of the repository :name:.
+        """
+        images = self._by_repotag.get(name)
+        if images:
+            return list(images)
+        return [image for image in self.tagged_images()
+                if image.repotag.rsplit(':', 1)[0] == name]
+
+    def descendants(self, image):
+        """Yields all images that depend on :image:.
+        """
+        stack = list(self._children[image])
+        while stack:
+            child = stack.pop()
+            yield child
+            stack.extend(self._children[child])
+
+    def select(self, images, descendants=False):
+        """Returns the tagged images of :images: in topological order, with
+        :descendants: including the tagged images depending on them.
+        """
+        selected = set(images)
+        if descendants:
+            for image in images:
+                selected.update(self.descendants(image))
+        return [image for image in self.tagged_images() if image in selected]
+
+    def changed_images(self, files):
+        """Returns the images built from any of the paths :files:, and the
+        images with unknown build inputs.
+        """
+        files = [os.path.realpath(path) for path in files]
+
+        def _changed(image):
+            paths = image.input_paths()
+            if paths is None:
+                return True
+            for path in paths:
+                path = os.path.realpath(path)
+                for changed in files:
+                    if changed == path or changed.startswith(path + os.sep):
+                        return True
+            return False
+
+        return [image for image in self.ordered_images() if _changed(image)]
+
+    def fuse_layers(self):
+        """Optimizer pass: temporary images with a single child image are
+        built as part of the build of the child, if the layer types support
+        it, see :BaseImageLayer.fuse_base:. Returns the number of fused
+        images.
+        """
+        fused = 0
+        for image in self.ordered_images():
+            base = image.base
+            if base in self._children and base.is_temporary() and \
+                    len(self._children[base]) == 1 and image.fuse_base():
+                fused += 1
+        return fused
+
+    def children(self, image):
+        """Returns the images that use :image: as base image.
+        """
+        return self._children[image]
+
     @property
     def root_images(self):
-        images = []
-        for image in self._images:
-            if image.is_root():
-                images.append(image)
-        return images
-
-    def _tagged_images(self, images):
-        tagged = []
-        for image in images:
-            if not image.is_temporary():
-                tagged.append(image)
-            tagged.extend(self._tagged_images(image.children))
-        return tagged
+        return [image for image in self.ordered_images()
+                if image.base not in self._children]
 
-    def tagged_images(self):
-        return self._tagged_images(self.root_images)
+    def ordered_images(self):
+        """Returns the images in topological order, every image follows its
+        base image. The returned list must not be modified.
+        """
+        if self._order is None:
+            order = []
+            # depth first, children in the order they were added
+            stack = [image for image in reversed(self._images)
+                     if image.base not in self._children]
+            while stack:
+                image = stack.pop()
+                order.append(image)
+                stack.extend(reversed(self._children[image]))
+            if len(order) != len(self._images):
+                raise ValueError('Cyclic image dependencies')
+            self._order = order
+        return self._order
 
+    def tagged_images(self):
+        """Returns the non-temporary images in topological order. The
+        returned list must not be modified.
+        """
+        if self._tagged is None:
+            self._tagged = [image for image in self.ordered_images()
+                            if not image.is_temporary()]
+        return self._tagged
@@ -1,10 +1,66 @@
+import json
 import os
+import threading
 
 import py
 import pytest
+from six.moves import BaseHTTPServer, socketserver
 
 
 @pytest.fixture()
 def datadir():
     here = os.path.dirname(os.path.abspath(__file__))
     return py.path.local(os.path.join(here, 'raw'))
+
+
+class _RegistryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        self.server.requests.append((self.command, self.path))
+        response = self.server.responses.get((self.command, self.path))
+        if response is None:
+            response = (404, {}, {'errors': [{'code': 'NOT_FOUND'}]})
+        status, headers, data = response
+        data = json.dumps(data).encode('utf-8') if data is not None else b''
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    do_GET = do_HEAD = do_DELETE = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+class _RegistryServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), _RegistryHandler)
+        self.requests = []
+        # (method, path) -> (status, headers, json data)
+        self.responses = {}
+
+    @property
+    def url(self):
+        return '127.0.0.1:%d' % self.server_address[1]
+
+
+@pytest.fixture()
+def registry_server():
+    """Local http server that answers with :responses: like a registry.
+    """
+    server = _RegistryServer()
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
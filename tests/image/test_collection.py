@@ -0,0 +1,91 @@
+import pytest
+
+from docker_build._registry import Registry
+from docker_build.image.api import ImageCollection
+
+
+def test_order():
+    collection = ImageCollection()
+    a = collection.add('test/a')
+    b = collection.add('test/b')
+    a1 = collection.add('test/a1', base=a, run='true')
+    temp = collection.add(base=a1, run='true')
+    a2 = collection.add('test/a2', base=temp, run='true')
+    b1 = collection.add('test/b1', base=b, run='true')
+
+    assert collection.ordered_images() == [a, a1, temp, a2, b, b1]
+    assert collection.tagged_images() == [a, a1, a2, b, b1]
+    assert collection.root_images == [a, b]
+    assert collection.children(a1) == [temp]
+
+    # the order is cached until an image is added
+    assert collection.tagged_images() is collection.tagged_images()
+    b2 = collection.add('test/b2', base=b, run='true')
+    assert collection.tagged_images() == [a, a1, a2, b, b1, b2]
+
+
+def test_get():
+    registry = Registry('localhost:5000')
+    collection = ImageCollection()
+    base = collection.add('test/base')
+    pushed = collection.add('test/base', base=base, registry=registry)
+
+    assert collection.get('test/base') is base
+    assert collection.get('localhost:5000/test/base') is pushed
+    assert collection.get('test/missing') is None
+
+
+def test_duplicate():
+    collection = ImageCollection()
+    ubuntu = collection.add('ubuntu')
+    # references of existing images
+    collection.add('ubuntu')
+
+    collection.add('test/sample', base=ubuntu, run='true')
+    with pytest.raises(ValueError):
+        collection.add('test/sample', base=ubuntu, cmd='true')
+
+
+def test_cycle():
+    collection = ImageCollection()
+    base = collection.add('test/base')
+    child = collection.add('test/child', base=base, run='true')
+    base._base = child
+
+    with pytest.raises(ValueError):
+        collection.add('test/other', base=child, run='true')
+
+
+def test_select():
+    collection = ImageCollection()
+    base = collection.add('test/base')
+    temp = collection.add(base=base, run='true')
+    web = collection.add('test/web:1.0', base=temp, run='true')
+    worker = collection.add('test/worker:1.0', base=base, run='true')
+    other = collection.add('test/other:1.0')
+
+    assert collection.find('test/web') == [web]
+    assert collection.find('test/web:1.0') == [web]
+    assert collection.find('test/missing') == []
+
+    assert collection.select([worker, base]) == [base, worker]
+    assert collection.select([base], descendants=True) == [base, web, worker]
+    assert collection.select([temp], descendants=True) == [web]
+    assert other not in collection.select([base], descendants=True)
+
+
+def test_changed_images(tmpdir):
+    tmpdir.mkdir('web').join('Dockerfile').write('FROM ubuntu')
+    tmpdir.mkdir('worker').join('Dockerfile').write('FROM ubuntu')
+
+    collection = ImageCollection()
+    web = collection.add('test/web', dockerfile=tmpdir.join('web').strpath)
+    collection.add('test/worker', dockerfile=tmpdir.join('worker').strpath)
+    child = collection.add('test/child', base=web, run='true')
+    collection.add('test/native')
+
+    changed = [tmpdir.join('web', 'app.py').strpath]
+    assert collection.changed_images(changed) == [web]
+    assert collection.select(collection.changed_images(changed),
+                             descendants=True) == [web, child]
+    assert collection.changed_images([tmpdir.join('webapp').strpath]) == []
@@ -1,3 +1,5 @@
+import os
+
 from flexmock import flexmock
 import pytest
 
@@ -5,12 +7,12 @@ from docker_build import _docker_driver
 from docker_build.image.api import DockerfileImageLayer, DockerfileDirectImageLayer
 
 
-@pytest.mark.parametrize('docker_filename, docker_dir_or_file', [
-    ('Dockerfile',         ''),
-    ('Dockerfile',         '../'),
-    ('custom-file.docker', ''),
+@pytest.mark.parametrize('docker_filename, docker_dir_or_file, kwargs', [
+    ('Dockerfile',         '',    {}),
+    ('Dockerfile',         '../', {}),
+    ('custom-file.docker', '',    {'dockerfile': str}),
 ])
-def test_build(tmpdir, datadir, docker_filename, docker_dir_or_file):
+def test_build(tmpdir, datadir, docker_filename, docker_dir_or_file, kwargs):
     content = datadir.join('dockerfile.py.Dockerfile').read()
 
     docker_file = tmpdir.join(docker_filename)
@@ -19,7 +21,7 @@ def test_build(tmpdir, datadir, docker_filename, docker_dir_or_file):
     file_or_dir = docker_file.join(docker_dir_or_file).strpath
 
     flexmock(_docker_driver).should_receive('build') \
-        .with_args(str, chdir=tmpdir.strpath) \
+        .with_args(str, chdir=tmpdir.strpath, **kwargs) \
         .and_return('b7722e0317a4') \
         .once()
 
@@ -29,19 +31,60 @@ def test_build(tmpdir, datadir, docker_filename, docker_dir_or_file):
     assert layer._image_id == 'b7722e0317a4'
 
 
-def test_build_direct():
+def test_build_direct(tmpdir):
     base = flexmock(
         build=lambda: None,
         _image_id='b7722e0317a4',
+        full_repotag='test/base',
         add_child=lambda child: None)
-    layer = DockerfileDirectImageLayer(base=base, cmd='pwd')
+    layer = DockerfileDirectImageLayer(base=base, cmd='pwd',
+                                       cwd=tmpdir.strpath)
 
-    fake_layer = flexmock(_image_id='abcdef')
-    flexmock(DockerfileImageLayer) \
-        .new_instances(fake_layer)
-    fake_layer.should_receive('build') \
-        .once()
+    def _build(repotag, chdir, dockerfile):
+        # the Dockerfile is not part of the context directory
+        assert chdir == tmpdir.strpath
+        assert os.path.dirname(dockerfile) != tmpdir.strpath
+        assert tmpdir.listdir() == []
+        with open(dockerfile, 'rb') as f_obj:
+            assert f_obj.read() == b'FROM b7722e0317a4\nCMD pwd'
+        return 'abcdef'
+    layer._driver = flexmock()
+    layer._driver.should_receive('build').replace_with(_build).once()
 
     layer.build()
     assert layer._image_id == 'abcdef'
 
+
+
+def test_build_fused():
+    from docker_build.image.api import ImageCollection
+
+    collection = ImageCollection()
+    base = collection.add('test/base')
+    temp1 = collection.add(base=base, run='make')
+    temp2 = collection.add(base=temp1, run='make install', expose=80)
+    sample = collection.add('test/sample', base=temp2, cmd='serve')
+    shared = collection.add(base=base, run='true')
+    collection.add('test/a', base=shared, cmd='a')
+    collection.add('test/b', base=shared, cmd='b')
+
+    assert collection.fuse_layers() == 2
+    assert temp1._fused and temp2._fused and not shared._fused
+
+    base._image_id = 'b7722e0317a4'
+    base._already_built = True
+    temp1.build()
+    temp2.build()
+    assert temp2.image_id is None
+    assert temp2._cleanup_repotag() is None
+    assert sample._fused_content() == b'\n'.join([
+        b'FROM b7722e0317a4',
+        b'RUN make',
+        b'RUN make install',
+        b'EXPOSE 80',
+        b'CMD serve'])
+
+    # built before, e.g. taken from the build cache
+    temp1._image_id = 'abcdef'
+    assert sample._fused_content() == \
+        b'FROM abcdef\nRUN make install\nEXPOSE 80\nCMD serve'
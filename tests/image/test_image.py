@@ -2,7 +2,9 @@ import os
 import pytest
 from flexmock import flexmock
 
-from docker_build.image.api import RootFSLayer, VagrantLayer
+from docker_build.image.api import (
+    BaseImageLayer, DockerfileDirectImageLayer, NativeDockerImageLayer,
+    RootFSLayer, VagrantLayer)
 
 
 def test_vagrant_layer_missing_argument():
@@ -37,3 +39,151 @@ def test_image_dependencies(tmpdir):
     # only build once
     dep2.build()
 
+
+
+def test_check_uploaded():
+    registry = flexmock(repotag_url=lambda repotag: 'reg/' + repotag)
+    local = NativeDockerImageLayer('test/local')
+    missing = NativeDockerImageLayer('test/missing')
+    remote = NativeDockerImageLayer('test/remote', registry=registry)
+    temp = RootFSLayer('rootfs.tar')
+
+    driver = flexmock()
+    driver.should_receive('inspect_ids') \
+        .with_args(['test/local', 'test/missing']) \
+        .and_return({'test/local': 'abcd', 'test/missing': None}) \
+        .once()
+    local._driver = missing._driver = driver
+    registry.should_receive('infos') \
+        .with_args(['test/remote']) \
+        .and_return({'test/remote': 'bcde'}) \
+        .once()
+
+    result = BaseImageLayer.check_uploaded([local, missing, remote, temp])
+    assert result == {local: True, missing: False, remote: True}
+
+
+def test_digest(tmpdir):
+    from docker_build.image.api import DockerfileDirectImageLayer
+
+    vagrantfile = tmpdir.join('Vagrantfile')
+    vagrantfile.write('# version 1')
+    base = VagrantLayer(tmpdir.strpath)
+    child = DockerfileDirectImageLayer(base=base, run='ls')
+
+    digest = base.digest()
+    child_digest = child.digest()
+    assert digest and child_digest and digest != child_digest
+
+    # unchanged inputs, different image
+    assert VagrantLayer(vagrantfile.strpath).digest() == digest
+
+    vagrantfile.write('# version 2')
+    changed = VagrantLayer(tmpdir.strpath)
+    assert changed.digest() != digest
+    assert DockerfileDirectImageLayer(base=changed, run='ls').digest() != \
+        child_digest
+
+
+def test_digest_unknown(tmpdir):
+    rootfs = tmpdir.join('rootfs.tar')
+    rootfs.write('')
+
+    assert RootFSLayer(rootfs.strpath).digest()
+    assert RootFSLayer(rootfs.strpath, pre=lambda: 0).digest() is None
+    assert RootFSLayer(tmpdir.join('missing.tar').strpath).digest() is None
+
+
+def test_use_image():
+    image = NativeDockerImageLayer('test/sample')
+    image._driver = flexmock()
+    image._driver.should_receive('inspect_id').with_args('abcd') \
+        .and_return('abcd').once()
+    image._driver.should_receive('tag').with_args('abcd', 'test/sample').once()
+    image._driver.should_receive('pull').never()
+
+    assert image.use_image('abcd')
+    image.build()
+    assert image.image_id == 'abcd'
+
+
+def _uploadable_image(remote, local):
+    registry = flexmock(repotag_url=lambda repotag: 'localhost:5000/' + repotag,
+                        __enter__=lambda: None,
+                        __exit__=lambda *args: None)
+    registry.should_receive('info').with_args('test/sample:1.0', cached=False) \
+        .and_return(remote)
+
+    image = NativeDockerImageLayer('test/sample:1.0', registry=registry)
+    image._driver = flexmock()
+    image._driver.should_receive('inspect').with_args('abcd').and_return(local)
+    image._image_id = 'abcd'
+    image._already_built = True
+    return image, registry
+
+
+def test_upload_to_registry():
+    image, registry = _uploadable_image(
+        'sha256:ffff',
+        {'Id': 'sha256:abcd',
+         'RepoDigests': ['localhost:5000/test/sample@sha256:eeee']})
+    registry.should_receive('delete_tag').with_args('test/sample:1.0').once()
+    registry.should_receive('post').with_args('abcd', 'test/sample:1.0').once()
+    registry.should_receive('invalidate').with_args('test/sample:1.0').once()
+
+    image.upload_to_registry()
+
+
+def test_upload_to_registry_unchanged():
+    image, registry = _uploadable_image(
+        'sha256:eeee',
+        {'Id': 'sha256:abcd',
+         'RepoDigests': ['other:5000/test/sample@sha256:ffff',
+                         'localhost:5000/test/sample@sha256:eeee']})
+    registry.should_receive('delete_tag').never()
+    registry.should_receive('post').never()
+    registry.should_receive('invalidate').never()
+
+    image.upload_to_registry()
+
+
+def test_upload_to_registry_missing():
+    image, registry = _uploadable_image(None, None)
+    registry.should_receive('delete_tag').once()
+    registry.should_receive('post').once()
+    registry.should_receive('invalidate').once()
+
+    image.upload_to_registry()
+
+
+def _built_images():
+    base = NativeDockerImageLayer('test/base')
+    temp = DockerfileDirectImageLayer(base=base, run='true')
+    cached = DockerfileDirectImageLayer(base=base, run='true')
+    for image in (base, temp, cached):
+        image._already_built = True
+        image._image_id = 'abcd'
+    cached._from_cache = True
+    return base, temp, cached
+
+
+def test_cleanup_images():
+    base, temp, cached = _built_images()
+    driver = flexmock()
+    driver.should_receive('rmi_many').with_args([temp.repotag], int).once()
+    base._driver = temp._driver = cached._driver = driver
+
+    BaseImageLayer.cleanup_images([base, temp, cached])
+
+
+def test_cleanup_images_detached():
+    import subprocess
+    base, temp, cached = _built_images()
+
+    stdin = flexmock(write=lambda data: None, close=lambda: None)
+    flexmock(stdin).should_receive('write') \
+        .with_args(temp.repotag.encode('utf-8')).once()
+    flexmock(subprocess).should_receive('Popen') \
+        .and_return(flexmock(stdin=stdin)).once()
+
+    BaseImageLayer.cleanup_images([base, temp, cached], detach=True)
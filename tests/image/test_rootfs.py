@@ -1,26 +1,35 @@
+import gzip
+import os
+
 from flexmock import flexmock
 import pytest
 
+from docker_build._exec import ExecutionError
 from docker_build.image.api import RootFSLayer
 
 
-def test_build():
-    layer = RootFSLayer('rootfs.tar')
-    layer._driver = flexmock(import_=lambda path: 'abcdef')
+def test_build(tmpdir):
+    tmpdir.join('rootfs.tar').write('archive')
+    layer = RootFSLayer('rootfs.tar', cwd=tmpdir.strpath)
+    layer._driver = flexmock()
+    layer._driver.should_receive('import_') \
+        .replace_with(lambda f_obj: f_obj.read() == b'archive' and 'abcdef') \
+        .once()
 
     layer.build()
 
     assert layer._image_id == 'abcdef'
 
 
-def test_build_pre_post():
+def test_build_pre_post(tmpdir):
+    tmpdir.join('rootfs.tar').write('archive')
     result = []
     def pre():
         result.append(0)
     def post():
         result.append(1)
 
-    layer = RootFSLayer('rootfs.tar', pre=pre, post=post)
+    layer = RootFSLayer('rootfs.tar', pre=pre, post=post, cwd=tmpdir.strpath)
     layer._driver = flexmock(import_=lambda path: 'abcdef')
 
     assert result == []
@@ -30,18 +39,61 @@ def test_build_pre_post():
     assert result == [0, 1]
 
 
-def test_post_on_failure():
+def test_post_on_failure(tmpdir):
+    tmpdir.join('rootfs.tar').write('archive')
     result = []
     def post():
         result.append(1)
 
-    layer = RootFSLayer('rootfs.tar', post=post)
-    layer._driver = flexmock(import_=lambda path: 'abcdef')
-    layer._driver.should_receive('import_').and_raise(Exception())
+    layer = RootFSLayer('rootfs.tar', post=post, cwd=tmpdir.strpath)
+    layer._driver = flexmock()
+    layer._driver.should_receive('import_') \
+        .and_raise(ExecutionError('docker', 1, '', 'import failed')) \
+        .once()
 
     assert result == []
-    with pytest.raises(Exception):
+    with pytest.raises(ExecutionError) as error:
         layer.build()
+    assert 'import failed' in str(error.value)
 
     assert layer._image_id is None
     assert result == [1]
+
+
+def test_build_decompressed(tmpdir, monkeypatch):
+    # a multi-threaded decompressor
+    bin_dir = tmpdir.mkdir('bin')
+    pigz = bin_dir.join('pigz')
+    pigz.write('#!/bin/sh\nshift\nexec gzip -dc "$@"\n')
+    pigz.chmod(0o755)
+    monkeypatch.setenv('PATH', bin_dir.strpath + os.pathsep +
+                       os.environ['PATH'])
+
+    with gzip.open(tmpdir.join('rootfs.tar.gz').strpath, 'wb') as f_obj:
+        f_obj.write(b'archive')
+
+    layer = RootFSLayer('rootfs.tar.gz', cwd=tmpdir.strpath)
+    layer._driver = flexmock()
+    layer._driver.should_receive('import_') \
+        .replace_with(lambda f_obj: f_obj.read() == b'archive' and 'abcdef') \
+        .once()
+
+    layer.build()
+
+    assert layer._image_id == 'abcdef'
+
+
+def test_build_decompress_failed(tmpdir, monkeypatch):
+    bin_dir = tmpdir.mkdir('bin')
+    pigz = bin_dir.join('pigz')
+    pigz.write('#!/bin/sh\necho corrupt >&2\nexit 1\n')
+    pigz.chmod(0o755)
+    monkeypatch.setenv('PATH', bin_dir.strpath)
+    tmpdir.join('rootfs.tar.gz').write('')
+
+    layer = RootFSLayer('rootfs.tar.gz', cwd=tmpdir.strpath)
+    layer._driver = flexmock(import_=lambda f_obj: f_obj.read() and 'abcdef')
+
+    with pytest.raises(ExecutionError) as error:
+        layer.build()
+    assert 'corrupt' in str(error.value)
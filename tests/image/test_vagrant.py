@@ -1,4 +1,5 @@
 import contextlib
+import os
 from flexmock import flexmock
 import pytest
 
@@ -24,9 +25,17 @@ def test_build(tmpdir, datadir, vagrant_filename, vagrant_dir_or_file):
 
     file_or_dir = vagrant_file.join(vagrant_dir_or_file).strpath
 
+    released = []
+    @contextlib.contextmanager
+    def _vagrant(directory, keep=False, release=None):
+        assert directory == tmpdir.strpath and not keep
+        # the Vagrantfile stays until the machine is destroyed
+        assert tmpdir.join('Vagrantfile').read() == content
+        yield 'fbf460de4e94806c'
+        released.append(release)
+
     flexmock(_vagrant_driver).should_receive('vagrant') \
-        .with_args(tmpdir.strpath) \
-        .and_return(_mock_contextmanager('fbf460de4e94806c')) \
+        .replace_with(_vagrant) \
         .once()
 
     flexmock(_docker_driver).should_receive('commit') \
@@ -38,4 +47,88 @@ def test_build(tmpdir, datadir, vagrant_filename, vagrant_dir_or_file):
     layer.build()
 
     assert layer._image_id == '15878aca572de99b4381c949'
+    # the directory is locked until the machine is destroyed
+    lock = VagrantLayer._directory_lock(tmpdir.strpath)
+    assert lock.locked()
+    released[0]()
+    assert not lock.locked()
+    assert tmpdir.join('Vagrantfile').check() \
+        == (vagrant_filename == 'Vagrantfile')
+
+
+@pytest.fixture
+def vagrant_mode():
+    from docker_build.image import _vagrant
+    yield _vagrant.set_mode
+    _vagrant.set_mode()
+
+
+def _mock_vagrant(directories):
+    @contextlib.contextmanager
+    def _vagrant(directory, keep=False, release=None):
+        directories.append((directory,
+                            open(os.path.join(directory, 'Vagrantfile')).read(),
+                            sorted(os.listdir(directory)), keep))
+        yield 'fbf460de4e94806c'
+        if release:
+            release()
+
+    flexmock(_vagrant_driver).should_receive('vagrant') \
+        .replace_with(_vagrant)
+    flexmock(_docker_driver).should_receive('commit') \
+        .and_return('15878aca572de99b4381c949')
+
+
+def test_build_isolated(tmpdir, vagrant_mode):
+    tmpdir.join('Vagrantfile').write('# default')
+    tmpdir.join('other.vgt').write('# other')
+    tmpdir.mkdir('.vagrant')
+    tmpdir.mkdir('files').join('a').write('a')
+    vagrant_mode(isolated=True)
+    directories = []
+    _mock_vagrant(directories)
+
+    VagrantLayer(tmpdir.strpath).build()
+    VagrantLayer(tmpdir.join('other.vgt').strpath).build()
+
+    assert [entry[1:] for entry in directories] == [
+        ('# default', ['Vagrantfile', 'files', 'other.vgt'], False),
+        ('# other', ['Vagrantfile', 'files', 'other.vgt'], False)]
+    for directory, _content, _names, _keep in directories:
+        assert directory != tmpdir.strpath
+        assert not os.path.exists(directory)
+
+
+def test_build_keep(tmpdir, vagrant_mode):
+    source = tmpdir.mkdir('source')
+    source.join('Vagrantfile').write('# version 1')
+    vagrant_mode(keep_directory=tmpdir.join('keep').strpath)
+    directories = []
+    _mock_vagrant(directories)
+
+    VagrantLayer(source.strpath).build()
+    working_copy = directories[0][0]
+    os.makedirs(os.path.join(working_copy, '.vagrant'))
+    source.join('Vagrantfile').write('# version 2')
+    VagrantLayer(source.strpath).build()
+
+    assert directories == [
+        (working_copy, '# version 1', ['Vagrantfile'], True),
+        (working_copy, '# version 2', ['.vagrant', 'Vagrantfile'], True)]
+
+
+def test_build_keep_home(tmpdir, vagrant_mode, monkeypatch):
+    source = tmpdir.mkdir('source')
+    source.join('Vagrantfile').write('# default')
+    monkeypatch.setenv('HOME', tmpdir.mkdir('home').strpath)
+    monkeypatch.chdir(source)
+    vagrant_mode(keep_directory='~/.docker-build/cache/vagrant')
+    directories = []
+    _mock_vagrant(directories)
+
+    VagrantLayer(source.strpath).build()
 
+    working_copy = directories[0][0]
+    assert working_copy.startswith(
+        tmpdir.join('home', '.docker-build', 'cache', 'vagrant').strpath)
+    assert not source.join('~').check()
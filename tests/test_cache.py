@@ -0,0 +1,53 @@
+import json
+
+from docker_build._cache import BuildCache, RegistryCache
+
+
+def test_build_cache(tmpdir):
+    directory = tmpdir.join('cache').strpath
+
+    cache = BuildCache(directory)
+    assert cache.image_id('d1') is None
+    cache.add('d1', 'abcd')
+    cache.add('d2', 'bcde', 'test/sample')
+    cache.save()
+
+    cache = BuildCache(directory)
+    assert cache.image_id('d1') == 'abcd'
+    assert cache.image_id('d2') == 'bcde'
+    assert cache.tag_digest('test/sample') == 'd2'
+    assert cache.tag_digest('test/other') is None
+
+
+def test_build_cache_corrupt(tmpdir):
+    tmpdir.join('build.json').write('{')
+
+    cache = BuildCache(tmpdir.strpath)
+    assert cache.image_id('d1') is None
+
+
+def test_registry_cache(tmpdir):
+    url = 'http://localhost:5000'
+
+    cache = RegistryCache(tmpdir.strpath, ttl=60)
+    assert cache.get(url, 'test/sample:1') == (False, None)
+    cache.put(url, 'test/sample:1', 'sha256:abcd')
+    cache.put(url, 'test/missing:1', None)
+    cache.put(url, 'test/pushed:1', None)
+    cache.invalidate(url, 'test/pushed:1')
+    cache.save()
+
+    cache = RegistryCache(tmpdir.strpath, ttl=60)
+    assert cache.get(url, 'test/sample:1') == (True, 'sha256:abcd')
+    assert cache.get(url, 'test/missing:1') == (True, None)
+    assert cache.get(url, 'test/pushed:1') == (False, None)
+    assert cache.get('http://other:5000', 'test/sample:1') == (False, None)
+
+
+def test_registry_cache_expired(tmpdir):
+    cache = RegistryCache(tmpdir.strpath, ttl=0)
+    cache.put('http://localhost:5000', 'test/sample:1', 'sha256:abcd')
+
+    assert cache.get('http://localhost:5000', 'test/sample:1') == (False, None)
+    cache.save()
+    assert json.loads(tmpdir.join('registry.json').read()) == {}
@@ -1,3 +1,4 @@
+import json
 import os.path
 import sys
 import tempfile
@@ -6,6 +7,7 @@ from textwrap import dedent
 from flexmock import flexmock
 import pytest
 
+import docker_build._profile
 import docker_build.cli
 from docker_build.image.api import BaseImageLayer
 
@@ -42,7 +44,7 @@ def _run_cli(tmpdir, args, stdin=None):
         else:
             flexmock(stdin_wrapper).should_receive('read').never()
 
-        docker_build.cli.main(args)
+        docker_build.cli.main(args + ['--cache-dir', tmpdir.strpath])
 
 # -----------------------------------------------------------------------------
 
@@ -89,6 +91,110 @@ def test_stdin_bad_config(tmpdir, stdin):
 ])
 def test_build(tmpdir, filename):
     flexmock(BaseImageLayer).should_receive('build').once()
-    flexmock(BaseImageLayer).should_receive('is_uploaded').and_return(False).once()
+    flexmock(BaseImageLayer).should_receive('check_uploaded') \
+        .replace_with(lambda images: dict.fromkeys(images, False)).once()
     flexmock(BaseImageLayer).should_receive('upload_to_registry').once()
     _run_cli(tmpdir, ['-c', filename])
+
+
+def test_list(tmpdir, capsys):
+    flexmock(BaseImageLayer).should_receive('check_uploaded') \
+        .replace_with(lambda images: dict.fromkeys(images, True)).once()
+    with pytest.raises(SystemExit):
+        _run_cli(tmpdir, ['-l', '-c', 'tests/raw/registry.py'])
+    out, _err = capsys.readouterr()
+    assert out.startswith('+ ')
+    assert out.rstrip().endswith('foox/example:1.2')
+
+
+def test_profile(tmpdir, capsys):
+    trace = tmpdir.join('trace.json')
+    try:
+        _run_cli(tmpdir, ['--check-config', '-c', 'tests/raw/registry.py',
+                          '--profile', trace.strpath])
+    finally:
+        docker_build._profile._profiler = None
+    _out, err = capsys.readouterr()
+    assert 'Time per phase:' in err
+    events = json.loads(trace.read())['traceEvents']
+    assert [e['cat'] for e in events if e['ph'] == 'X'] == ['config']
+
+
+def test_build_targets(tmpdir):
+    config = tmpdir.join('docker-build.images')
+    config.write(dedent("""
+        base = Image('test/base')
+        Image('test/web:1.0', base=base)
+        Image('test/worker:1.0', base=base)
+    """))
+
+    checked = []
+    flexmock(BaseImageLayer).should_receive('check_uploaded') \
+        .replace_with(lambda images: checked.extend(images) or
+                      dict.fromkeys(images, True)).once()
+    _run_cli(tmpdir, ['-c', config.strpath, 'test/web'])
+    assert [image.repotag for image in checked] == ['test/web:1.0']
+
+    with pytest.raises(SystemExit):
+        _run_cli(tmpdir, ['-c', config.strpath, 'test/missing'])
+
+
+def test_build_changed_included_config(tmpdir):
+    config = tmpdir.join('docker-build.images')
+    config.write(dedent("""
+        load_config_file('images.py')
+    """))
+    tmpdir.join('images.py').write(dedent("""
+        Image('test/web:1.0')
+        Image('test/worker:1.0')
+    """))
+
+    flexmock(docker_build.cli).should_receive('changed_files') \
+        .and_return([tmpdir.join('images.py').strpath]).once()
+    checked = []
+    flexmock(BaseImageLayer).should_receive('check_uploaded') \
+        .replace_with(lambda images: checked.extend(images) or
+                      dict.fromkeys(images, True)).once()
+    _run_cli(tmpdir, ['-c', config.strpath, '--changed-since', 'HEAD'])
+    assert sorted(image.repotag for image in checked) \
+        == ['test/web:1.0', 'test/worker:1.0']
+
+
+def test_default_cache_dir(tmpdir, monkeypatch):
+    import subprocess
+    from docker_build import _drivers, _teardown
+
+    dead = subprocess.Popen([sys.executable, '-c', ''])
+    dead.wait()
+    home = tmpdir.mkdir('home')
+    state = home.join('.docker-build', 'cache', 'containers',
+                      'containers-%d.json' % dead.pid)
+    state.ensure()
+    state.write(json.dumps({'leaked': dead.pid}))
+    monkeypatch.setenv('HOME', home.strpath)
+    monkeypatch.chdir(tmpdir.mkdir('project'))
+    config = tmpdir.join('project', 'docker-build.images')
+    config.write("Image('test/base')\n")
+
+    # the containers leaked by a run from another directory are removed
+    driver = flexmock()
+    driver.should_receive('rm').with_args('leaked').and_return(0).once()
+    flexmock(_drivers).should_receive('get_driver').and_return(driver)
+    try:
+        docker_build.cli.main(['-C', '-c', config.strpath])
+        assert _teardown.get_teardown().wait()
+    finally:
+        _teardown.set_state_directory(None)
+
+    assert not state.check()
+    assert tmpdir.join('project').listdir() == [config]
+
+
+@pytest.mark.parametrize('args', [
+    ['-j', '0'],
+    ['--push-jobs', '0'],
+    ['--pull-jobs', '-1'],
+])
+def test_invalid_jobs(args):
+    with pytest.raises(SystemExit):
+        docker_build.cli._get_cli_arguments(args)
@@ -0,0 +1,119 @@
+import tarfile
+
+import pytest
+
+from docker_build import _context
+
+
+@pytest.fixture
+def pruning():
+    yield
+    _context.set_pruning(True)
+
+
+def _context_dir(tmpdir, dockerfile):
+    tmpdir.join('Dockerfile').write(dockerfile)
+    tmpdir.mkdir('src').join('main.py').write('main')
+    tmpdir.join('src', 'main.pyc').write('compiled')
+    tmpdir.mkdir('docs').join('index.md').write('docs')
+    tmpdir.join('setup.py').write('setup')
+    return tmpdir
+
+
+def test_referenced_sources():
+    content = '\n'.join([
+        '# comment',
+        'FROM ubuntu',
+        'COPY src /app/src',
+        'add --chown=1:1 a.txt b.txt /app/',
+        'COPY ["with space", "/app/"]',
+        'COPY --from=build /out /app/out',
+        'ADD http://example.com/file /tmp/',
+        'RUN cp \\',
+        '    a b',
+        'ONBUILD COPY . /app',
+    ])
+    assert _context.referenced_sources(content) == \
+        ['src', 'a.txt', 'b.txt', 'with space']
+
+
+def test_referenced_sources_run():
+    content = '\n'.join([
+        '# syntax=docker/dockerfile:1',
+        'FROM ubuntu',
+        'RUN --mount=type=cache,target=/root/.cache make',
+        'RUN --mount=type=bind,from=build,source=/out,target=/out make',
+        'COPY src /app/src',
+    ])
+    assert _context.referenced_sources(content) == ['src']
+
+
+@pytest.mark.parametrize('content', [
+    'COPY $SRC /app',
+    # bind mounts of the context
+    'RUN --mount=type=bind,source=setup.py,target=/setup.py make',
+    'RUN --mount=target=/src make',
+    # heredocs
+    'COPY <<EOF /app/config\nCOPY setup.py /app\nEOF',
+    'RUN <<EOF\nmake\nEOF',
+    # parser directives
+    '# escape=`\nFROM ubuntu\nCOPY src `\n  /app',
+    # unknown instructions and flags
+    'FROM ubuntu\nFETCH src /app',
+    'COPY --unknown=1 src /app',
+])
+def test_referenced_sources_unknown(content):
+    assert _context.referenced_sources(content) is None
+
+
+def test_dockerignore(tmpdir):
+    tmpdir.join('.dockerignore').write('\n'.join([
+        '# comment',
+        '**/*.pyc',
+        'docs',
+        '!docs/index.md',
+    ]))
+    rules = _context.read_dockerignore(tmpdir.strpath)
+
+    assert _context._is_ignored(rules, 'src/main.pyc')
+    assert _context._is_ignored(rules, 'main.pyc')
+    assert _context._is_ignored(rules, 'docs/other.md')
+    assert not _context._is_ignored(rules, 'docs/index.md')
+    assert not _context._is_ignored(rules, 'src/main.py')
+
+
+def test_context_paths(tmpdir):
+    _context_dir(tmpdir, 'FROM ubuntu\nCOPY src /app/src\n')
+    tmpdir.join('.dockerignore').write('*.pyc\nsrc/*.pyc\n')
+
+    assert _context.context_paths(tmpdir.strpath) == \
+        ['Dockerfile', 'src', 'src/main.py']
+
+
+def test_context_paths_full(tmpdir, pruning):
+    _context_dir(tmpdir, 'FROM ubuntu\nONBUILD COPY . /app\n')
+    tmpdir.join('.dockerignore').write('docs')
+    _context.set_pruning(False)
+
+    assert _context.context_paths(tmpdir.strpath) == \
+        ['.dockerignore', 'Dockerfile', 'setup.py', 'src', 'src/main.py',
+         'src/main.pyc']
+
+
+def test_build_context(tmpdir):
+    _context_dir(tmpdir.mkdir('context'), 'FROM ubuntu\nCOPY setup.py /\n')
+    tmpdir.join('other.docker').write('FROM ubuntu\nCOPY src/main.py /\n')
+
+    with _context.build_context(tmpdir.join('context').strpath) \
+            as (f_obj, name):
+        assert name == 'Dockerfile'
+        with tarfile.open(fileobj=f_obj) as tar:
+            assert tar.getnames() == ['Dockerfile', 'setup.py']
+
+    # Dockerfile outside of the context directory
+    with _context.build_context(tmpdir.join('context').strpath,
+                                tmpdir.join('other.docker').strpath) \
+            as (f_obj, name):
+        assert name == '.dockerfile'
+        with tarfile.open(fileobj=f_obj) as tar:
+            assert tar.getnames() == ['src/main.py', '.dockerfile']
@@ -0,0 +1,86 @@
+import os
+
+from docker_build import _digest
+
+
+def _directory_digest(directory):
+    hasher = _digest.new()
+    _digest.update_directory(hasher, directory)
+    return hasher.hexdigest()
+
+
+def test_update_directory(tmpdir):
+    tmpdir.join('Dockerfile').write('FROM ubuntu')
+    tmpdir.mkdir('sub').join('file').write('content')
+    digest = _directory_digest(tmpdir.strpath)
+
+    assert _directory_digest(tmpdir.strpath) == digest
+
+    tmpdir.join('sub', 'file').write('changed')
+    assert _directory_digest(tmpdir.strpath) != digest
+
+
+def test_update_directory_names(tmpdir):
+    a = tmpdir.mkdir('a')
+    b = tmpdir.mkdir('b')
+    a.join('x').write('content')
+    b.join('y').write('content')
+
+    assert _directory_digest(a.strpath) != _directory_digest(b.strpath)
+
+
+def test_update_directory_symlink(tmpdir):
+    tmpdir.join('file').write('content')
+    os.symlink('file', tmpdir.join('link').strpath)
+    digest = _directory_digest(tmpdir.strpath)
+
+    tmpdir.join('link').remove()
+    os.symlink('other', tmpdir.join('link').strpath)
+    assert _directory_digest(tmpdir.strpath) != digest
+
+
+def test_file_digest(tmpdir, monkeypatch):
+    import hashlib
+    from docker_build._cache import FileDigestCache
+
+    monkeypatch.setattr(_digest, '_MMAP_CHUNK_SIZE', 3)
+    monkeypatch.setattr(_digest, '_file_cache', None)
+    archive = tmpdir.join('rootfs.tar')
+    archive.write('content')
+    empty = tmpdir.join('empty.tar')
+    empty.write('')
+
+    assert _digest.file_digest(archive.strpath) == \
+        hashlib.sha256(b'content').hexdigest()
+    assert _digest.file_digest(empty.strpath) == \
+        hashlib.sha256(b'').hexdigest()
+
+    cache = FileDigestCache(tmpdir.join('cache').strpath)
+    monkeypatch.setattr(_digest, '_file_cache', cache)
+    digest = _digest.file_digest(archive.strpath)
+    cache.save()
+
+    # unchanged files are not hashed again
+    cache = FileDigestCache(tmpdir.join('cache').strpath)
+    monkeypatch.setattr(_digest, '_file_cache', cache)
+    monkeypatch.setattr(_digest, 'update_file', None)
+    monkeypatch.setattr(_digest, '_update_mapped', None)
+    assert _digest.file_digest(archive.strpath) == digest
+
+
+def test_update_directory_cached(tmpdir, monkeypatch):
+    from docker_build._cache import FileDigestCache
+
+    context = tmpdir.mkdir('context')
+    context.join('Dockerfile').write('FROM ubuntu')
+    cache = FileDigestCache(tmpdir.join('cache').strpath)
+    monkeypatch.setattr(_digest, '_file_cache', cache)
+    digest = _directory_digest(context.strpath)
+    cache.save()
+
+    # unchanged files are not read again
+    monkeypatch.setattr(_digest, '_file_cache',
+                        FileDigestCache(tmpdir.join('cache').strpath))
+    monkeypatch.setattr(_digest, 'update_file', None)
+    monkeypatch.setattr(_digest, '_update_mapped', None)
+    assert _directory_digest(context.strpath) == digest
@@ -0,0 +1,243 @@
+import json
+import subprocess
+import sys
+import tarfile
+import threading
+
+import pytest
+from six import BytesIO
+from six.moves import BaseHTTPServer, socketserver
+
+from docker_build import _docker_api_driver
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _read_chunked(self):
+        body = b''
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            body += self.rfile.read(size)
+            self.rfile.readline()
+            if not size:
+                return body
+
+    def _handle(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = self._read_chunked()
+        else:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length)
+        self.server.requests.append((self.command, self.path, body,
+                                     dict(self.headers.items())))
+        status, data = self.server.responses.get(
+            (self.command, self.path), (404, {'message': 'not found'}))
+        if not isinstance(data, bytes):
+            data = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_DELETE = _handle
+
+    def address_string(self):
+        return 'unix'
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        self.requests = []
+        self.responses = {}
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        socketserver.ThreadingMixIn.process_request(
+            self, request, client_address)
+
+
+@pytest.fixture()
+def server(tmpdir):
+    server = _Server(tmpdir.join('docker.sock').strpath)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+    thread.daemon = True
+    thread.start()
+    _docker_api_driver.connect(server.server_address)
+    yield server
+    server.shutdown()
+    server.server_close()
+    _docker_api_driver._auth.clear()
+
+
+def _stream(*messages):
+    return b''.join(json.dumps(m).encode('utf-8') + b'\r\n' for m in messages)
+
+
+def test_inspect_id(server):
+    server.responses[('GET', '/images/test%2Fsample/json')] = \
+        (200, {'Id': 'abcd'})
+
+    assert _docker_api_driver.inspect_id('test/sample') == 'abcd'
+    assert _docker_api_driver.inspect_id('test/missing') is None
+
+    # images and containers are looked up on one persistent connection
+    assert len(server.requests) == 3
+    assert server.connections == 1
+
+
+def test_inspect(server):
+    server.responses[('GET', '/containers/abcd/json')] = \
+        (200, {'Id': 'abcd', 'State': {'Running': True}})
+
+    assert _docker_api_driver.inspect('abcd') == \
+        {'Id': 'abcd', 'State': {'Running': True}}
+    assert _docker_api_driver.inspect('abcd', '{{.State.Running}}') == 'true'
+
+
+def test_inspect_ids(server):
+    server.responses[('GET', '/images/test%2Fa/json')] = (200, {'Id': 'abcd'})
+
+    result = _docker_api_driver.inspect_ids(['test/a', 'test/b'])
+    assert result == {'test/a': 'abcd', 'test/b': None}
+
+
+def test_tag(server):
+    server.responses[('POST', '/images/abcd/tag?repo=test%2Fsample&tag=1.0')] = \
+        (201, b'')
+    _docker_api_driver.tag('abcd', 'test/sample:1.0')
+
+
+def test_tag_error(server):
+    with pytest.raises(_docker_api_driver.APIError) as error:
+        _docker_api_driver.tag('abcd', 'test/sample')
+    assert error.value.status == 404
+    assert 'not found' in str(error.value)
+
+
+def test_commit(server):
+    server.responses[('POST', '/commit?container=cdef&repo=test%2Fsample&tag=1')] = \
+        (201, {'Id': 'abcd'})
+    assert _docker_api_driver.commit('cdef', 'test/sample:1') == 'abcd'
+
+
+def test_rmi(server):
+    server.responses[('DELETE', '/images/test%2Fsample?force=1')] = (200, [])
+    assert _docker_api_driver.rmi('test/sample') == 0
+    assert _docker_api_driver.rmi('test/missing') == 404
+
+
+def test_push(server):
+    server.responses[('POST', '/auth')] = (200, {'Status': 'Login Succeeded'})
+    server.responses[('POST', '/images/localhost%3A5000%2Fsample/push?tag=1')] = \
+        (200, _stream({'status': 'Pushing'}, {'status': 'Pushed'}))
+
+    _docker_api_driver.login(b'http://localhost:5000', 'user', 'pwd')
+    _docker_api_driver.push('localhost:5000/sample:1')
+
+    headers = server.requests[-1][3]
+    auth = json.loads(_docker_api_driver.base64.urlsafe_b64decode(
+        headers['X-Registry-Auth']).decode('utf-8'))
+    assert auth['username'] == 'user'
+    assert auth['serveraddress'] == 'localhost:5000'
+
+
+def test_push_error(server):
+    server.responses[('POST', '/images/sample/push?tag=1')] = \
+        (200, _stream({'status': 'Pushing'}, {'error': 'denied'}))
+
+    with pytest.raises(_docker_api_driver.APIError):
+        _docker_api_driver.push('sample:1')
+
+
+def test_build(server, tmpdir):
+    context = tmpdir.mkdir('context')
+    context.join('Dockerfile').write('FROM ubuntu')
+    context.join('custom.docker').write('FROM debian\nCOPY files /files')
+    context.mkdir('files').join('a').write('a')
+    context.join('unused').write('unused')
+    server.responses[('POST', '/build?dockerfile=custom.docker&rm=1&t=test%2Fsample')] = \
+        (200, _stream({'stream': 'Step 1 : FROM debian\n'},
+                      {'stream': 'Successfully built b7722e0317a4\n'}))
+
+    result = _docker_api_driver.build(
+        'test/sample', chdir=context.strpath,
+        dockerfile=context.join('custom.docker').strpath)
+    assert result == 'b7722e0317a4'
+
+    body = server.requests[-1][2]
+    with tarfile.open(fileobj=BytesIO(body)) as tar:
+        assert sorted(tar.getnames()) == \
+            ['custom.docker', 'files', 'files/a']
+
+
+def test_import(server, tmpdir):
+    archive = tmpdir.join('rootfs.tar')
+    archive.write(b'archive', mode='wb')
+    server.responses[('POST', '/images/create?fromSrc=-')] = \
+        (200, _stream({'status': 'sha256:abcd'}))
+
+    assert _docker_api_driver.import_(archive.strpath) == 'sha256:abcd'
+    assert server.requests[-1][2] == b'archive'
+
+
+def test_import_pipe(server):
+    server.responses[('POST', '/images/create?fromSrc=-')] = \
+        (200, _stream({'status': 'sha256:abcd'}))
+
+    # e.g. the output of a decompressor, sent chunked
+    process = subprocess.Popen([sys.executable, '-c',
+                                'import sys; sys.stdout.write("archive")'],
+                               stdout=subprocess.PIPE)
+    try:
+        assert _docker_api_driver.import_(process.stdout) == 'sha256:abcd'
+    finally:
+        process.stdout.close()
+        process.wait()
+
+    method, path, body, headers = server.requests[-1]
+    assert body == b'archive'
+    assert headers.get('Transfer-Encoding') == 'chunked'
+
+
+def test_request_retry(tmpdir):
+    import socket
+    from flexmock import flexmock
+
+    positions = []
+    def _request(method, url, body, headers):
+        positions.append(body.tell())
+        body.read()
+        raise socket.error()
+    closed = flexmock(close=lambda: None, request=_request)
+    body = BytesIO(b'archive')
+    body.read(3)
+
+    pool = _docker_api_driver.ConnectionPool(tmpdir.join('sock').strpath)
+    connections = iter([(closed, True), (closed, False)])
+    flexmock(pool).should_receive('_get') \
+        .replace_with(lambda: next(connections)).twice()
+    with pytest.raises(socket.error):
+        pool.request('POST', '/images/create', body=body)
+
+    # rewound for the retry
+    assert positions == [3, 3]
+
+    # pipes cannot be sent again
+    process = subprocess.Popen([sys.executable, '-c', ''],
+                               stdout=subprocess.PIPE)
+    flexmock(pool).should_receive('_get') \
+        .replace_with(lambda: (closed, True)).once()
+    try:
+        with pytest.raises(socket.error):
+            pool.request('POST', '/images/create', body=process.stdout)
+    finally:
+        process.stdout.close()
+        process.wait()
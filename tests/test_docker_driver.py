@@ -18,14 +18,44 @@ Successfully built b7722e0317a4
 """
 
 
-def test_build():
+def _streamed(output):
+    def _exec_cmd(*args, **kwargs):
+        for line in output.splitlines(True):
+            kwargs['callback'](line.encode('utf-8'))
+    return _exec_cmd
+
+def test_build(tmpdir, monkeypatch):
+    tmpdir.join('Dockerfile').write('FROM ubuntu')
+    monkeypatch.chdir(tmpdir)
     flexmock(_exec).should_receive('exec_cmd') \
-        .with_args('docker', 'build', '--rm', '-t', 'test/sample', '.', chdir=None) \
-        .and_return(_built_out) \
+        .with_args('docker', '-D', 'build', '--rm', '-t', 'test/sample', '-',
+                   stdin=object, callback=object, max_lines=int) \
+        .replace_with(_streamed(_built_out)) \
         .once()
     result = _docker_driver.build('test/sample')
     assert result == 'b7722e0317a4'
 
+def test_build_dockerfile(tmpdir):
+    tmpdir.join('custom.docker').write('FROM ubuntu')
+    flexmock(_exec).should_receive('exec_cmd') \
+        .with_args('docker', '-D', 'build', '--rm', '-t', 'test/sample',
+                   '-f', 'custom.docker', '-',
+                   stdin=object, callback=object, max_lines=int) \
+        .replace_with(_streamed(_built_out)) \
+        .once()
+    result = _docker_driver.build(
+        'test/sample', chdir=tmpdir.strpath,
+        dockerfile=tmpdir.join('custom.docker').strpath)
+    assert result == 'b7722e0317a4'
+
+def test_build_fail_no_match(tmpdir):
+    tmpdir.join('Dockerfile').write('FROM ubuntu')
+    flexmock(_exec).should_receive('exec_cmd') \
+        .replace_with(_streamed('Step 0 : FROM registry:0.9.1\n')) \
+        .once()
+    with pytest.raises(Exception):
+        _docker_driver.build('test/sample', chdir=tmpdir.strpath)
+
 def test_commit():
     flexmock(_exec).should_receive('exec_cmd') \
         .with_args('docker', 'commit', '-p', 'abcd').once()
@@ -57,6 +87,19 @@ def test_inspect_missing_image():
     result = _docker_driver.inspect('abcd')
     assert result is None
 
+def test_inspect_ids():
+    flexmock(_exec).should_receive('exec_cmd') \
+        .with_args('docker', 'inspect', str, str, str, can_fail=True) \
+        .and_return(1, '[{"Id": "abcd", "RepoTags": ["test/a:latest"]},'
+                       ' {"Id": "bcde", "RepoTags": ["x:1", "test/b:1.0"]}]') \
+        .once()
+    result = _docker_driver.inspect_ids(['test/a', 'test/b:1.0', 'test/c'])
+    assert result == {'test/a': 'abcd', 'test/b:1.0': 'bcde', 'test/c': None}
+
+def test_inspect_ids_empty():
+    flexmock(_exec).should_receive('exec_cmd').never()
+    assert _docker_driver.inspect_ids([]) == {}
+
 def test_login():
     flexmock(_exec).should_receive('exec_cmd') \
         .with_args('docker', 'login', '-u', 'my-user', '-p', 'my-pwd', '-e', ' ', 'localhost:5005').once()
@@ -97,6 +140,18 @@ def test_rmi_force():
     result = _docker_driver.rmi('abcd')
     assert result == 2
 
+def test_rmi_many(monkeypatch):
+    removed = []
+    flexmock(_exec).should_receive('exec_cmd') \
+        .replace_with(lambda *args, **kwargs: removed.append(args) or (1, ''))
+    monkeypatch.setattr(_docker_driver, '_RMI_BATCH_SIZE', 2)
+
+    _docker_driver.rmi_many(['a', 'b', 'c', 'd', 'e'], jobs=2)
+    assert sorted(removed) == [
+        ('docker', 'rmi', '-f', 'a', 'b'),
+        ('docker', 'rmi', '-f', 'c', 'd'),
+        ('docker', 'rmi', '-f', 'e')]
+
 def test_rmi_no_force():
     flexmock(_exec).should_receive('exec_cmd') \
         .with_args('docker', 'rmi', 'abcd').once()
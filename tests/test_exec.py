@@ -36,3 +36,36 @@ def test_exec_cmd_can_fail():
     assert stdout == None
     assert stderr
 
+
+
+def test_exec_cmd_stdin_file(tmpdir):
+    path = tmpdir.join('input')
+    # bigger than a pipe buffer and a chunk
+    data = b'0123456789abcdef' * (1024 * 1024 // 8)
+    path.write(data, mode='wb')
+
+    with open(path.strpath, 'rb') as f_obj:
+        output = exec_cmd('/bin/cat', stdin=f_obj)
+    assert output == data
+
+
+def test_exec_cmd_stdin_closed_early():
+    status, stdout = exec_cmd(
+        '/bin/true', stdin=BytesIO(b'x' * 1024 * 1024), can_fail=True)
+    assert status == 0
+
+
+def test_exec_cmd_callback():
+    lines = []
+    output = exec_cmd('/bin/cat', stdin=b'a\nb\nc', callback=lines.append)
+    assert lines == [b'a\n', b'b\n', b'c']
+    assert output is None
+
+    output = exec_cmd('/bin/cat', stdin=b'a\nb\nc', callback=lines.append,
+                      keep_output=True)
+    assert output == b'a\nb\nc'
+
+
+def test_exec_cmd_max_lines():
+    output = exec_cmd('/bin/cat', stdin=b'a\nb\nc\n', max_lines=2)
+    assert output == b'b\nc\n'
@@ -0,0 +1,26 @@
+import subprocess
+
+from docker_build._git import changed_files
+
+
+def _git(directory, *args):
+    subprocess.check_call(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@localhost']
+        + list(args), cwd=directory.strpath, stdout=subprocess.PIPE)
+
+
+def test_changed_files(tmpdir):
+    repo = tmpdir.mkdir('repo')
+    repo.mkdir('web').join('Dockerfile').write('FROM ubuntu')
+    repo.mkdir('worker').join('Dockerfile').write('FROM ubuntu')
+    _git(repo, 'init', '-q')
+    _git(repo, 'add', '.')
+    _git(repo, 'commit', '-q', '-m', 'initial')
+
+    assert changed_files('HEAD', repo.join('web').strpath) == []
+
+    repo.join('web', 'Dockerfile').write('FROM debian')
+    repo.join('worker', 'app.py').write('')
+    assert sorted(changed_files('HEAD', repo.strpath)) == [
+        repo.join('web', 'Dockerfile').strpath,
+        repo.join('worker', 'app.py').strpath]
@@ -0,0 +1,166 @@
+from flexmock import flexmock
+
+from docker_build._cache import BuildCache
+from docker_build._image_builder import ImageBuilder
+from docker_build._journal import BuildJournal
+from docker_build.image.api import BaseImageLayer, ImageCollection
+
+
+def _options(tmpdir, **kwargs):
+    options = dict(force=False, jobs=2, push_jobs=1, pull_jobs=0,
+                   use_cache=True, cache_dir=tmpdir.strpath,
+                   async_cleanup=False, resume=False,
+                   dockerbuild='dockerbuild.py')
+    options.update(kwargs)
+    return flexmock(**options)
+
+
+def _collection(driver):
+    collection = ImageCollection()
+    base = collection.add('test/base')
+    collection.add('test/sample', base=base)
+    for image in collection:
+        image._driver = driver
+    return collection
+
+
+def test_build(tmpdir):
+    pulled = []
+    driver = flexmock()
+    driver.should_receive('inspect_id').with_args('test/base') \
+        .replace_with(lambda repotag: 'abcd' if pulled else None)
+    driver.should_receive('pull').with_args('test/base') \
+        .replace_with(pulled.append).once()
+    driver.should_receive('tag').with_args('abcd', 'test/sample').once()
+
+    flexmock(BaseImageLayer).should_receive('check_uploaded') \
+        .replace_with(lambda images: dict.fromkeys(images, False))
+
+    builder = ImageBuilder(_options(tmpdir), _collection(driver))
+    assert builder.build()
+
+    cache = BuildCache(tmpdir.strpath)
+    assert cache.tag_digest('test/base')
+    assert cache.tag_digest('test/sample')
+
+
+def test_build_prefetch(tmpdir):
+    pulled = []
+    driver = flexmock()
+    driver.should_receive('inspect_ids').with_args(['test/base']) \
+        .and_return({'test/base': None}).once()
+    # pulled ahead of the build
+    driver.should_receive('pull').with_args('test/base') \
+        .replace_with(lambda repotag: pulled.append(1)).once()
+    driver.should_receive('inspect_id').with_args('test/base') \
+        .replace_with(lambda repotag: 'abcd' if pulled else None)
+    driver.should_receive('tag').with_args('abcd', 'test/sample').once()
+    flexmock(BaseImageLayer).should_receive('check_uploaded') \
+        .replace_with(lambda images: dict.fromkeys(images, False))
+
+    builder = ImageBuilder(_options(tmpdir, pull_jobs=2), _collection(driver))
+    assert builder.build()
+    assert pulled == [1]
+
+
+def test_build_prefetch_up_to_date(tmpdir):
+    driver = flexmock()
+    driver.should_receive('inspect_ids').never()
+    driver.should_receive('pull').never()
+    flexmock(BaseImageLayer).should_receive('check_uploaded') \
+        .replace_with(lambda images: dict.fromkeys(images, True))
+
+    builder = ImageBuilder(_options(tmpdir, pull_jobs=2), _collection(driver))
+    assert builder.build()
+
+
+def test_build_changed_inputs(tmpdir):
+    base = _collection(flexmock(inspect_id=lambda repotag: 'abcd')).find(
+        'test/base')[0]
+    cache = BuildCache(tmpdir.strpath)
+    cache.add(base.digest(), 'abcd', 'test/base')
+    cache.add('outdated', 'bcde', 'test/sample')
+    cache.save()
+
+    # the pulled images are inspected at once
+    driver = flexmock()
+    driver.should_receive('inspect_ids').with_args(['test/base']) \
+        .and_return({'test/base': 'abcd'}).once()
+    driver.should_receive('inspect_id').never()
+    collection = _collection(driver)
+    sample = collection.find('test/sample')[0]
+
+    flexmock(BaseImageLayer).should_receive('check_uploaded') \
+        .replace_with(lambda images: dict.fromkeys(images, True))
+
+    builder = ImageBuilder(_options(tmpdir), collection)
+    assert builder._images() == [sample]
+
+
+def _resumable_collection(driver):
+    collection = ImageCollection()
+    base = collection.add('test/base')
+    temp = collection.add(base=base, run='make')
+    collection.add('test/sample', base=temp)
+    for image in collection:
+        image._driver = driver
+    return collection, temp
+
+
+def test_build_resume(tmpdir):
+    from docker_build import _drivers
+    from docker_build._exec import ExecutionError
+
+    images = {'test/base': 'abcd'}
+    driver = flexmock(inspect_id=images.get)
+    flexmock(_drivers).should_receive('get_driver').and_return(driver)
+    flexmock(BaseImageLayer).should_receive('check_uploaded') \
+        .replace_with(lambda images: dict.fromkeys(images, False))
+    options = _options(tmpdir, use_cache=False, resume=True)
+
+    # the temporary image is kept if a later layer fails
+    collection, temp = _resumable_collection(driver)
+    flexmock(temp).should_receive('_build') \
+        .replace_with(lambda: setattr(temp, '_image_id', 'bcde')).once()
+    images[temp.repotag] = images['bcde'] = 'bcde'
+    driver.should_receive('tag').with_args('bcde', 'test/sample') \
+        .and_raise(ExecutionError('docker', 1, '', 'failed')).once()
+    driver.should_receive('rmi_many').never()
+
+    assert not ImageBuilder(options, collection).build()
+    assert len(BuildJournal(tmpdir.strpath, 'dockerbuild.py')) == 2
+
+    # and used by the next run, which removes it
+    collection, resumed = _resumable_collection(driver)
+    flexmock(resumed).should_receive('_build').never()
+    driver.should_receive('tag').with_args('bcde', 'test/sample').once()
+    driver.should_receive('rmi_many').with_args([temp.repotag], int).once()
+
+    assert ImageBuilder(options, collection).build()
+    assert resumed.image_id == 'bcde'
+    assert len(BuildJournal(tmpdir.strpath, 'dockerbuild.py')) == 0
+
+
+def test_build_discards_journal(tmpdir):
+    from docker_build import _drivers
+
+    journal = BuildJournal(tmpdir.strpath, 'dockerbuild.py')
+    journal.built(flexmock(image_id='bcde', repotag='temp_image/test:abc',
+                           is_temporary=lambda: True), 'digest')
+
+    driver = flexmock(inspect_id=lambda repotag: 'abcd')
+    driver.should_receive('tag').with_args('abcd', 'test/sample').once()
+    driver.should_receive('rmi_many') \
+        .with_args(['temp_image/test:abc'], int).once()
+    flexmock(_drivers).should_receive('get_driver').and_return(driver)
+    flexmock(BaseImageLayer).should_receive('check_uploaded') \
+        .replace_with(lambda images: dict.fromkeys(images, False))
+
+    # the journals of other configurations are kept
+    other = BuildJournal(tmpdir.strpath, 'other/dockerbuild.py')
+    other.built(flexmock(image_id='cdef', repotag='temp_image/test:bcd',
+                         is_temporary=lambda: True), 'digest')
+
+    assert ImageBuilder(_options(tmpdir), _collection(driver)).build()
+    assert len(BuildJournal(tmpdir.strpath, 'dockerbuild.py')) == 0
+    assert len(BuildJournal(tmpdir.strpath, 'other/dockerbuild.py')) == 1
@@ -0,0 +1,67 @@
+import os
+
+from flexmock import flexmock
+import pytest
+
+from docker_build import _load_config
+from docker_build._load_config import (
+    Builtins, FormattedException, load_config_file, load_config_source)
+
+
+@pytest.fixture()
+def code_cache(tmpdir):
+    _load_config.set_code_cache(tmpdir.join('cache').strpath)
+    yield tmpdir.join('cache')
+    _load_config.set_code_cache(None)
+
+
+def _load(path):
+    with Builtins() as builtins:
+        return load_config_file(builtins, path)
+
+
+def test_code_cache(tmpdir, code_cache):
+    config = tmpdir.join('docker-build.images')
+    config.write('value = 1\n')
+
+    assert _load(config.strpath).value == 1
+    assert len(code_cache.listdir()) == 1
+
+    flexmock(_load_config).should_receive('_compile').never()
+    assert _load(config.strpath).value == 1
+
+
+def test_code_cache_changed(tmpdir, code_cache):
+    config = tmpdir.join('docker-build.images')
+    config.write('value = 1\n')
+    assert _load(config.strpath).value == 1
+
+    config.write('value = 22\n')
+    assert _load(config.strpath).value == 22
+
+    # unchanged size and mtime: the cached code is used
+    stat = os.stat(config.strpath)
+    config.write('value = 33\n')
+    os.utime(config.strpath, (stat.st_atime, stat.st_mtime))
+    assert _load(config.strpath).value == 22
+
+
+def test_code_cache_corrupt(tmpdir, code_cache):
+    config = tmpdir.join('docker-build.images')
+    config.write('value = 1\n')
+    _load(config.strpath)
+    code_cache.listdir()[0].write(b'corrupt', mode='wb')
+
+    assert _load(config.strpath).value == 1
+
+
+def test_load_config_source(tmpdir):
+    with Builtins() as builtins:
+        module = load_config_source(builtins, 'import os\ncwd = os.getcwd()\n',
+                                    cwd=tmpdir.strpath)
+    assert module.cwd == tmpdir.strpath
+
+    with Builtins() as builtins:
+        with pytest.raises(FormattedException) as error:
+            load_config_source(builtins, 'a =', cwd=tmpdir.strpath)
+    assert '<stdin>' in error.value.args[0]
@@ -0,0 +1,28 @@
+import pytest
+
+from docker_build._pool import imap_unordered, map_concurrent
+
+
+class _ExampleException(Exception):
+    pass
+
+
+def test_map_concurrent():
+    assert map_concurrent(lambda x: x * 2, [1, 2, 3], 2) == [2, 4, 6]
+    assert map_concurrent(lambda x: x, [], 2) == []
+
+
+def test_imap_unordered():
+    items = iter(range(10))
+    assert sorted(imap_unordered(lambda x: x * 2, items, 3)) == \
+        list(range(0, 20, 2))
+
+
+def test_imap_unordered_error():
+    def func(item):
+        if item == 2:
+            raise _ExampleException()
+        return item
+
+    with pytest.raises(_ExampleException):
+        list(imap_unordered(func, range(5), 2))
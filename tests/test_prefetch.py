@@ -0,0 +1,27 @@
+import threading
+import time
+
+from flexmock import flexmock
+
+from docker_build import _prefetch
+
+
+def test_close_waits_for_pulls():
+    started = threading.Event()
+    pulled = []
+
+    def _pull(repotag):
+        started.set()
+        time.sleep(0.1)
+        pulled.append(repotag)
+
+    driver = flexmock(inspect_ids=lambda repotags:
+                      dict.fromkeys(repotags, None))
+    driver.should_receive('pull').replace_with(_pull).once()
+
+    prefetch = _prefetch.Prefetch({driver: ['test/a', 'test/b']}, jobs=1)
+    assert started.wait(5)
+    prefetch.close()
+
+    # the running pull is finished, the pending one skipped
+    assert pulled == ['test/a']
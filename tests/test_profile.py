@@ -0,0 +1,68 @@
+import json
+import time
+
+import pytest
+
+from docker_build import _profile
+
+
+@pytest.fixture()
+def profiler():
+    profiler = _profile.enable()
+    yield profiler
+    _profile._profiler = None
+
+
+def test_disabled():
+    with _profile.span('test', 'build') as span:
+        span.args['status'] = 200
+    assert _profile.get_profiler() is None
+
+
+def test_span(profiler):
+    with _profile.span('test/base', 'build', base=None):
+        pass
+    with pytest.raises(ValueError):
+        with _profile.span('test/sample', 'build', base='test/base'):
+            raise ValueError()
+
+    assert [s.name for s in profiler.spans] == ['test/base', 'test/sample']
+    assert profiler.spans[1].args == {'base': 'test/base',
+                                      'error': 'ValueError'}
+
+
+def test_chrome_trace(profiler, tmpdir):
+    with _profile.span('docker build', 'exec', exit_code=0):
+        pass
+
+    path = tmpdir.join('trace.json').strpath
+    _profile.write_trace(path)
+    with open(path) as f_obj:
+        events = json.load(f_obj)['traceEvents']
+
+    assert events[0]['ph'] == 'X'
+    assert events[0]['name'] == 'docker build'
+    assert events[0]['cat'] == 'exec'
+    assert events[0]['args'] == {'exit_code': 0}
+    assert events[1]['ph'] == 'M'
+    assert events[1]['tid'] == events[0]['tid']
+
+
+def _add(profiler, name, duration, base=None):
+    span = profiler.span(name, 'build', base=base)
+    span.start = time.time()
+    span.end = span.start + duration
+    profiler.add(span)
+
+
+def test_critical_path(profiler):
+    _add(profiler, 'root', 1)
+    _add(profiler, 'fast', 1, base='root')
+    _add(profiler, 'slow', 5, base='root')
+    _add(profiler, 'other', 4)
+
+    assert [s.name for s in profiler.critical_path()] == ['root', 'slow']
+
+    summary = profiler.summary(slowest=2)
+    assert 'Critical path (6.00s):' in summary
+    assert summary.rstrip().endswith('other')
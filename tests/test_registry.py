@@ -1,5 +1,7 @@
+from flexmock import flexmock
 import pytest
-from docker_build._registry import Registry
+from docker_build._cache import RegistryCache
+from docker_build._registry import Registry, RegistryCollection
 
 
 @pytest.mark.parametrize('url, expect, auth', [
@@ -41,3 +43,129 @@ def test_registry_kwargs(kwargs, expect, auth):
     assert registry.url == expect
     assert registry.auth == auth
 
+
+
+def test_registry_infos():
+    registry = Registry('example.com')
+    flexmock(registry).should_receive('info') \
+        .replace_with(lambda repotag: 'id-' + repotag if repotag != 'c' else None) \
+        .times(3)
+    assert registry.infos(['a', 'b', 'c']) == {'a': 'id-a', 'b': 'id-b', 'c': None}
+
+
+def test_registry_images_v2(registry_server):
+    registry_server.responses.update({
+        ('GET', '/v2/'): (200, {}, {}),
+        ('GET', '/v2/_catalog?n=100'): (
+            200, {'Link': '</v2/_catalog?n=100&last=b>; rel="next"'},
+            {'repositories': ['a', 'b']}),
+        ('GET', '/v2/_catalog?n=100&last=b'): (
+            200, {}, {'repositories': ['c/d']}),
+        ('GET', '/v2/a/tags/list?n=100'): (
+            200, {'Link': '</v2/a/tags/list?n=100&last=1>; rel="next"'},
+            {'name': 'a', 'tags': ['1']}),
+        ('GET', '/v2/a/tags/list?n=100&last=1'): (
+            200, {}, {'name': 'a', 'tags': ['2']}),
+        ('GET', '/v2/b/tags/list?n=100'): (
+            200, {}, {'name': 'b', 'tags': None}),
+        ('GET', '/v2/c/d/tags/list?n=100'): (
+            200, {}, {'name': 'c/d', 'tags': ['latest']}),
+    })
+    registry = Registry(registry_server.url)
+
+    assert registry.repositories() == ['a', 'b', 'c/d']
+    assert sorted(registry.iter_images()) == [
+        '%s/a:1' % registry_server.url,
+        '%s/a:2' % registry_server.url,
+        '%s/c/d:latest' % registry_server.url]
+
+
+def test_registry_images_v1(registry_server):
+    registry_server.responses.update({
+        ('GET', '/v1/search'): (
+            200, {}, {'results': [{'name': 'a'}, {'name': 'b'}]}),
+        ('GET', '/v1/repositories/a/tags'): (200, {}, {'1': 'abcd'}),
+        ('GET', '/v1/repositories/b/tags'): (200, {}, {'2': 'bcde'}),
+    })
+    registry = Registry(registry_server.url)
+
+    assert sorted(registry.images()) == [
+        '%s/a:1' % registry_server.url,
+        '%s/b:2' % registry_server.url]
+
+
+def test_registry_images_error(registry_server):
+    registry_server.responses[('GET', '/v2/')] = (200, {}, {})
+    registry_server.responses[('GET', '/v2/_catalog?n=100')] = \
+        (200, {}, {'repositories': ['a']})
+    registry = Registry(registry_server.url)
+
+    with pytest.raises(Exception):
+        list(registry.iter_images())
+
+
+def test_registry_info_v2(registry_server):
+    registry_server.responses.update({
+        ('GET', '/v2/'): (401, {}, {}),
+        ('HEAD', '/v2/a/b/manifests/1.0'): (
+            200, {'Docker-Content-Digest': 'sha256:abcd'}, None),
+    })
+    registry = Registry(registry_server.url)
+
+    assert registry.info('a/b:1.0') == 'sha256:abcd'
+    assert registry.info('a/b') is None
+    assert registry.api_version == 2
+
+    # the version is detected once
+    assert registry_server.requests.count(('GET', '/v2/')) == 1
+    assert ('HEAD', '/v2/a/b/manifests/latest') in registry_server.requests
+
+
+def test_registry_info_v1(registry_server):
+    registry_server.responses[('GET', '/v1/repositories/a/tags/1.0')] = \
+        (200, {}, 'abcd')
+    registry = Registry(registry_server.url)
+
+    assert registry.info('a:1.0') == 'abcd'
+    assert registry.info('a:2.0') is None
+    assert registry.api_version == 1
+
+
+def test_registry_info_cached(registry_server, tmpdir):
+    registry_server.responses[('GET', '/v2/')] = (200, {}, {})
+    registry_server.responses[('HEAD', '/v2/a/manifests/1.0')] = \
+        (200, {'Docker-Content-Digest': 'sha256:abcd'}, None)
+    head = ('HEAD', '/v2/a/manifests/1.0')
+
+    collection = RegistryCollection(RegistryCache(tmpdir.strpath, ttl=60))
+    registry = collection.add(registry_server.url)
+    assert registry.info('a:1.0') == 'sha256:abcd'
+    assert registry.info('a:2.0') is None
+    collection.cache.save()
+
+    # a new run answers from the cache
+    registry = RegistryCollection(
+        RegistryCache(tmpdir.strpath, ttl=60)).add(registry_server.url)
+    assert registry.info('a:1.0') == 'sha256:abcd'
+    assert registry.info('a:2.0') is None
+    assert registry_server.requests.count(head) == 1
+
+    registry.invalidate('a:1.0')
+    assert registry.info('a:1.0') == 'sha256:abcd'
+    assert registry_server.requests.count(head) == 2
+
+    # bypassing the cache
+    assert registry.info('a:1.0', cached=False) == 'sha256:abcd'
+    assert registry_server.requests.count(head) == 3
+
+
+def test_registry_delete_tag(registry_server):
+    registry = Registry(registry_server.url)
+    registry.delete_tag('a:1.0')
+    assert ('DELETE', '/v1/repositories/a/tags/1.0') in registry_server.requests
+
+    registry_server.responses[('GET', '/v2/')] = (200, {}, {})
+    registry = Registry(registry_server.url)
+    registry.delete_tag('a:1.0')
+    assert [r for r in registry_server.requests if r[0] == 'DELETE'] == \
+        [('DELETE', '/v1/repositories/a/tags/1.0')]
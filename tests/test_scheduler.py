@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from docker_build._scheduler import Scheduler
+
+
+class _Image(object):
+    def __init__(self, name, base=None):
+        self.full_repotag = name
+        self.base = base
+
+
+class _ExampleException(Exception):
+    pass
+
+
+def _tree():
+    root = _Image('root')
+    a = _Image('a', base=root)
+    b = _Image('b', base=root)
+    a1 = _Image('a1', base=a)
+    b1 = _Image('b1', base=b)
+    return root, a, b, a1, b1
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+def test_run_order(jobs):
+    root, a, b, a1, b1 = _tree()
+    lock = threading.Lock()
+    processed = []
+
+    def func(image):
+        with lock:
+            processed.append(image)
+
+    failed = Scheduler(jobs).run([a1, b1, a], func)
+
+    assert failed == []
+    assert sorted(i.full_repotag for i in processed) == \
+        ['a', 'a1', 'b', 'b1', 'root']
+    for image in processed:
+        if image.base:
+            assert processed.index(image.base) < processed.index(image)
+
+
+def test_run_concurrent_siblings():
+    root, a, b, a1, b1 = _tree()
+    barrier = threading.Event()
+    started = []
+
+    def func(image):
+        if image in (a, b):
+            started.append(image)
+            if len(started) == 2:
+                barrier.set()
+            # fails if siblings are not running at the same time
+            assert barrier.wait(5)
+
+    failed = Scheduler(2).run([a1, b1], func)
+    assert failed == []
+
+
+def test_run_failure():
+    root, a, b, a1, b1 = _tree()
+    processed = []
+
+    def func(image):
+        processed.append(image)
+        if image is a:
+            raise _ExampleException()
+
+    failed = Scheduler(1).run([a1], func)
+
+    assert [image for image, _exc_info in failed] == [a]
+    assert failed[0][1][0] is _ExampleException
+    assert processed == [root, a]
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import startup
+
+
+def test_import_cli():
+    assert startup.imported_lazy_modules('import docker_build.cli') == []
+
+
+def test_check_config(tmpdir):
+    config = tmpdir.join('docker-build.images')
+    config.write(
+        "registry = Registry('localhost:5000')\n"
+        "Image('test/sample:1', registry=registry, base=Image('ubuntu'))\n")
+
+    # the registry is not queried for a config check, only the layer module
+    # of the native images is imported
+    assert startup.imported_lazy_modules(
+        'import docker_build.cli\n'
+        'docker_build.cli.main(["-C", "-c", %r, "--cache-dir", %r])'
+        % (config.strpath, tmpdir.strpath)) == ['docker_build.image._docker']
+
+
+def test_import_time():
+    latencies = sorted(startup.import_time() for _index in range(3))
+    assert latencies[1] * 1000 <= startup.BUDGET_MS
@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+
+from docker_build import _teardown
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+def _state(tmpdir, pid=None):
+    return tmpdir.join('containers-%d.json' % (pid or os.getpid()))
+
+
+def test_teardown(tmpdir):
+    state = _state(tmpdir)
+    removed = []
+    teardown = _teardown.Teardown(tmpdir.strpath)
+
+    teardown.started('abcd')
+    teardown.started('bcde')
+    assert sorted(json.loads(state.read())) == ['abcd', 'bcde']
+
+    teardown.remove('abcd', lambda: removed.append('abcd'))
+    assert teardown.wait()
+    assert removed == ['abcd']
+    assert list(json.loads(state.read())) == ['bcde']
+
+
+def test_teardown_failed(tmpdir):
+    teardown = _teardown.Teardown(tmpdir.strpath)
+    teardown.started('abcd')
+
+    def _fail():
+        raise Exception('daemon not running')
+    teardown.remove('abcd', _fail)
+
+    assert not teardown.wait()
+    assert not _state(tmpdir).check()
+
+
+def test_reap(tmpdir):
+    dead = _dead_pid()
+    _state(tmpdir, dead).write(json.dumps({'leaked': dead}))
+    _state(tmpdir, os.getppid()).write(json.dumps({'running': os.getppid()}))
+    removed = []
+
+    teardown = _teardown.Teardown(tmpdir.strpath)
+    teardown.reap(removed.append)
+    assert teardown.wait()
+
+    assert removed == ['leaked']
+    assert sorted(path.basename for path in tmpdir.listdir()) \
+        == ['containers-%d.json' % os.getppid()]
+
+
+def test_reap_no_directory(tmpdir):
+    teardown = _teardown.Teardown(tmpdir.join('missing').strpath)
+    teardown.reap(lambda container_id: None)
+    assert teardown.wait()
@@ -0,0 +1,41 @@
+from flexmock import flexmock
+
+from docker_build._uploader import Uploader, report
+
+
+class _ExampleException(Exception):
+    pass
+
+
+def _image(name):
+    return flexmock(full_repotag=name, upload_to_registry=lambda: None)
+
+
+def test_upload():
+    images = [_image('a'), _image('b')]
+    for image in images:
+        image.should_receive('upload_to_registry').once()
+
+    uploader = Uploader(2)
+    for image in images:
+        uploader.put(image)
+    results = uploader.wait()
+
+    assert results == [(images[0], None), (images[1], None)]
+    assert report(results)
+
+
+def test_upload_failure():
+    good = _image('good')
+    bad = _image('bad')
+    bad.should_receive('upload_to_registry').and_raise(_ExampleException)
+
+    uploader = Uploader()
+    uploader.put(bad)
+    uploader.put(good)
+    results = uploader.wait()
+
+    assert results[0][0] is bad
+    assert results[0][1][0] is _ExampleException
+    assert results[1] == (good, None)
+    assert not report(results)
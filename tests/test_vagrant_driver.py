@@ -1,7 +1,7 @@
 import pytest
 from flexmock import flexmock
 
-from docker_build import _exec, _vagrant_driver
+from docker_build import _drivers, _exec, _teardown, _vagrant_driver
 
 
 _up_output = """\
@@ -27,14 +27,23 @@ Vagrantfile and to try again.
 
 _execution_error = _exec.ExecutionError('cmd', 'status', 'stdout', 'stderr')
 
+_ENV = {'VAGRANT_DEFAULT_PROVIDER': 'docker'}
+
+
+def _streamed(output):
+    def _exec_cmd(*args, **kwargs):
+        for line in output.splitlines(True):
+            kwargs['callback'](line.encode('utf-8'))
+    return _exec_cmd
+
 
 def test_up():
     flexmock(_exec).should_receive('exec_cmd') \
         .with_args(
-            'VAGRANT_DEFAULT_PROVIDER=docker vagrant',
+            'vagrant',
             'up',
-            chdir=None) \
-        .and_return(_up_output) \
+            env=_ENV, chdir=None, callback=object, max_lines=int) \
+        .replace_with(_streamed(_up_output)) \
         .once()
 
     _vagrant_driver.up()
@@ -43,10 +52,10 @@ def test_up():
 def test_up_chdir(tmpdir):
     flexmock(_exec).should_receive('exec_cmd') \
         .with_args(
-            'VAGRANT_DEFAULT_PROVIDER=docker vagrant',
+            'vagrant',
             'up',
-            chdir=tmpdir.strpath) \
-        .and_return(_up_output) \
+            env=_ENV, chdir=tmpdir.strpath, callback=object, max_lines=int) \
+        .replace_with(_streamed(_up_output)) \
         .once()
 
     _vagrant_driver.up(tmpdir.strpath)
@@ -55,9 +64,9 @@ def test_up_chdir(tmpdir):
 def test_up_execution_error():
     flexmock(_exec).should_receive('exec_cmd') \
         .with_args(
-            'VAGRANT_DEFAULT_PROVIDER=docker vagrant',
+            'vagrant',
             'up',
-            chdir=None) \
+            env=_ENV, chdir=None, callback=object, max_lines=int) \
         .and_raise(_execution_error) \
         .once()
 
@@ -68,10 +77,10 @@ def test_up_execution_error():
 def test_up_fail_no_match():
     flexmock(_exec).should_receive('exec_cmd') \
         .with_args(
-            'VAGRANT_DEFAULT_PROVIDER=docker vagrant',
+            'vagrant',
             'up',
-            chdir=None) \
-        .and_return(_up_output_failing) \
+            env=_ENV, chdir=None, callback=object, max_lines=int) \
+        .replace_with(_streamed(_up_output_failing)) \
         .once()
 
     with pytest.raises(_vagrant_driver.VagrantError):
@@ -81,10 +90,10 @@ def test_up_fail_no_match():
 def test_destroy():
     flexmock(_exec).should_receive('exec_cmd') \
         .with_args(
-            'VAGRANT_DEFAULT_PROVIDER=docker vagrant',
+            'vagrant',
             'destroy',
             '-f',
-            chdir=None) \
+            env=_ENV, chdir=None) \
         .once()
 
     _vagrant_driver.destroy()
@@ -93,10 +102,10 @@ def test_destroy():
 def test_destroy_chdir(tmpdir):
     flexmock(_exec).should_receive('exec_cmd') \
         .with_args(
-            'VAGRANT_DEFAULT_PROVIDER=docker vagrant',
+            'vagrant',
             'destroy',
             '-f',
-            chdir=tmpdir.strpath) \
+            env=_ENV, chdir=tmpdir.strpath) \
         .once()
 
     _vagrant_driver.destroy(chdir=tmpdir.strpath)
@@ -105,10 +114,10 @@ def test_destroy_chdir(tmpdir):
 def test_destroy_fail():
     flexmock(_exec).should_receive('exec_cmd') \
         .with_args(
-            'VAGRANT_DEFAULT_PROVIDER=docker vagrant',
+            'vagrant',
             'destroy',
             '-f',
-            chdir=None) \
+            env=_ENV, chdir=None) \
         .and_raise(_execution_error) \
         .once()
 
@@ -119,10 +128,11 @@ def test_destroy_fail():
 def test_vagrant_context_manager():
     flexmock(_vagrant_driver).should_receive('up') \
         .with_args(chdir=None) \
+        .and_return('fbf460de4e94806c') \
         .ordered() \
         .once()
-    flexmock(_vagrant_driver).should_receive('destroy') \
-        .with_args(chdir=None) \
+    flexmock(_vagrant_driver).should_receive('destroy_async') \
+        .with_args('fbf460de4e94806c', chdir=None, release=None) \
         .ordered() \
         .once()
 
@@ -136,10 +146,119 @@ def test_vagrant_context_manager_chdir(tmpdir):
         .and_return('fbf460de4e94806c') \
         .ordered() \
         .once()
-    flexmock(_vagrant_driver).should_receive('destroy') \
-        .with_args(chdir=tmpdir.strpath) \
+    flexmock(_vagrant_driver).should_receive('destroy_async') \
+        .with_args('fbf460de4e94806c', chdir=tmpdir.strpath, release=None) \
         .ordered() \
         .once()
 
     with _vagrant_driver.vagrant(tmpdir.strpath) as container_id:
         assert container_id == 'fbf460de4e94806c'
+
+
+def test_vagrant_context_manager_failure(tmpdir):
+    # provisioning failed after the container was created
+    _machine(tmpdir, 'fbf460de4e94806c')
+    flexmock(_vagrant_driver).should_receive('up') \
+        .and_raise(_vagrant_driver.VagrantError())
+    flexmock(_vagrant_driver).should_receive('destroy_async') \
+        .with_args('fbf460de4e94806c', chdir=tmpdir.strpath, release=None) \
+        .once()
+
+    with pytest.raises(_vagrant_driver.VagrantError):
+        with _vagrant_driver.vagrant(tmpdir.strpath):
+            pass
+
+
+def test_vagrant_context_manager_not_created(tmpdir):
+    released = []
+    flexmock(_vagrant_driver).should_receive('up') \
+        .and_raise(_vagrant_driver.VagrantError())
+    flexmock(_vagrant_driver).should_receive('destroy_async').never()
+
+    with pytest.raises(_vagrant_driver.VagrantError):
+        with _vagrant_driver.vagrant(tmpdir.strpath,
+                                     release=lambda: released.append(1)):
+            pass
+    assert released == [1]
+
+
+def test_destroy_async(tmpdir):
+    released = []
+    teardown = _teardown.Teardown(tmpdir.join('containers').strpath)
+    flexmock(_teardown).should_receive('get_teardown').and_return(teardown)
+    flexmock(_exec).should_receive('exec_cmd') \
+        .with_args('vagrant', 'destroy', '-f', env=_ENV, chdir=tmpdir.strpath) \
+        .once()
+    flexmock(_drivers).should_receive('get_driver').never()
+
+    teardown.started('fbf460de4e94806c')
+    _vagrant_driver.destroy_async('fbf460de4e94806c', chdir=tmpdir.strpath,
+                                  release=lambda: released.append(1))
+
+    assert teardown.wait()
+    assert released == [1]
+    assert tmpdir.join('containers').listdir() == []
+
+
+def test_destroy_async_fail(tmpdir):
+    released = []
+    teardown = _teardown.Teardown()
+    flexmock(_teardown).should_receive('get_teardown').and_return(teardown)
+    flexmock(_exec).should_receive('exec_cmd') \
+        .with_args('vagrant', 'destroy', '-f', env=_ENV, chdir=tmpdir.strpath) \
+        .and_raise(_execution_error) \
+        .once()
+    # the container is removed anyway
+    driver = flexmock()
+    driver.should_receive('rm').with_args('fbf460de4e94806c', force=True) \
+        .and_return(0).once()
+    flexmock(_drivers).should_receive('get_driver').and_return(driver)
+
+    _vagrant_driver.destroy_async('fbf460de4e94806c', chdir=tmpdir.strpath,
+                                  release=lambda: released.append(1))
+
+    assert teardown.wait()
+    assert released == [1]
+
+
+def _machine(directory, container_id):
+    machine = directory.join('.vagrant', 'machines', 'default', 'docker')
+    machine.ensure(dir=True)
+    machine.join('id').write(container_id)
+
+
+def test_vagrant_keep_running(tmpdir):
+    _machine(tmpdir, 'fbf460de4e94806c')
+    flexmock(_exec).should_receive('exec_cmd') \
+        .with_args('vagrant', 'status', '--machine-readable',
+                   env=_ENV, chdir=tmpdir.strpath) \
+        .and_return(b'1426801518,default,state,running\n') \
+        .ordered() \
+        .once()
+    flexmock(_exec).should_receive('exec_cmd') \
+        .with_args('vagrant', 'provision', env=_ENV, chdir=tmpdir.strpath,
+                   callback=object, max_lines=int) \
+        .ordered() \
+        .once()
+    flexmock(_vagrant_driver).should_receive('destroy').never()
+
+    with _vagrant_driver.vagrant(tmpdir.strpath, keep=True) as container_id:
+        assert container_id == 'fbf460de4e94806c'
+
+
+def test_vagrant_keep_not_created(tmpdir):
+    flexmock(_exec).should_receive('exec_cmd') \
+        .with_args('vagrant', 'status', '--machine-readable',
+                   env=_ENV, chdir=tmpdir.strpath) \
+        .and_return(b'1426801518,default,state,not_created\n') \
+        .once()
+    flexmock(_exec).should_receive('exec_cmd') \
+        .with_args('vagrant', 'up', '--provision', env=_ENV,
+                   chdir=tmpdir.strpath, callback=object, max_lines=int) \
+        .replace_with(lambda *args, **kwargs:
+                      _machine(tmpdir, 'fbf460de4e94806c')) \
+        .once()
+    flexmock(_vagrant_driver).should_receive('destroy').never()
+
+    with _vagrant_driver.vagrant(tmpdir.strpath, keep=True) as container_id:
+        assert container_id == 'fbf460de4e94806c'